@@ -0,0 +1,189 @@
+# backend/alembic/online_migrations.py
+"""
+大表在线迁移工具：供 alembic/versions 下的 revision 使用（from online_migrations import ...）
+
+Alembic 默认把一次 upgrade 包在一个事务里，大表上的整表 UPDATE / CREATE INDEX / SET NOT NULL
+会在整个执行期间锁住 orders，订单流转全部排队。这里的几个工具把它们拆成不挡线上读写的步骤：
+- backfill：按主键区间分批 UPDATE，每批一个短事务（autocommit_block），批间停 MIGRATION_PAUSE 秒；
+  where 条件排除已处理的行，中断后重跑会从第一条未处理的行接着做，已做完的不再改写
+- create_index_concurrently / drop_index_concurrently：在事务外执行 CONCURRENTLY，只拿
+  SHARE UPDATE EXCLUSIVE，不挡写入；上次中断留下的 INVALID 索引先删掉再建，已建好的直接跳过
+- set_not_null：CHECK NOT VALID -> VALIDATE（不挡写入地扫一遍）-> SET NOT NULL（PG12+ 借已验证的
+  CHECK 跳过全表扫描）-> 删掉 CHECK
+- 进度：logger "alembic.online"，每 MIGRATION_PROGRESS_EVERY 秒一行（行数 / 主键进度 / 速度 / 预计剩余）
+
+注意：
+- autocommit_block 会先提交当前 revision 里之前的 DDL，所以同一 revision 里它前面的步骤要写成可重入的
+  （例如 `if not has_column(...)`），中断后整条 revision 重跑不会在已完成的步骤上报错
+- 离线模式（alembic upgrade --sql）没有连接可分批，backfill 退化为单条 UPDATE；索引语句照常带 CONCURRENTLY，
+  前后由 autocommit_block 输出 COMMIT / BEGIN，落在事务外
+"""
+import logging
+import os
+import time
+from typing import Optional, Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+log = logging.getLogger("alembic.online")
+
+MIGRATION_CHUNK_ROWS = int(os.getenv("MIGRATION_CHUNK_ROWS", "5000"))
+MIGRATION_PAUSE = float(os.getenv("MIGRATION_PAUSE", "0.05"))
+MIGRATION_PROGRESS_EVERY = float(os.getenv("MIGRATION_PROGRESS_EVERY", "5"))
+
+
+def _offline() -> bool:
+    return op.get_context().as_sql
+
+
+# ---------- 元数据探测（让 revision 可重入）----------
+def has_column(table: str, column: str) -> bool:
+    """离线模式没有库可查，按全新执行处理（返回 False）"""
+    if _offline():
+        return False
+    return any(c["name"] == column for c in sa.inspect(op.get_bind()).get_columns(table))
+
+
+def _index_valid(name: str) -> Optional[bool]:
+    """None：不存在；True：可用；False：上次 CONCURRENTLY 中断留下的 INVALID 索引"""
+    return op.get_bind().execute(
+        sa.text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND pg_catalog.pg_table_is_visible(c.oid)"
+        ),
+        {"name": name},
+    ).scalar()
+
+
+# ---------- 分批回填 ----------
+class _Progress:
+    def __init__(self, label: str, start: int, stop: int):
+        self.label = label
+        self.start = start
+        self.stop = stop
+        self.rows = 0
+        self.upto = start
+        self.t0 = self.last = time.monotonic()
+
+    def report(self, upto: int, force: bool = False) -> None:
+        now = time.monotonic()
+        if upto == self.upto or (not force and now - self.last < MIGRATION_PROGRESS_EVERY):
+            return
+        self.last, self.upto = now, upto
+        elapsed = max(now - self.t0, 1e-6)
+        span = max(self.stop - self.start, 1)
+        done = min(max(upto - self.start, 0) / span, 1.0)
+        eta = elapsed / done - elapsed if done > 0 else float("nan")
+        log.info(
+            "%s: %d rows, id %d/%d (%.1f%%), %.0f rows/s, eta %.0fs",
+            self.label, self.rows, min(upto, self.stop), self.stop, done * 100, self.rows / elapsed, eta,
+        )
+
+
+def backfill(
+    table: str,
+    set_sql: str,
+    *,
+    where: Optional[str] = None,
+    pk: str = "id",
+    chunk: int = MIGRATION_CHUNK_ROWS,
+    pause: float = MIGRATION_PAUSE,
+) -> int:
+    """
+    UPDATE {table} SET {set_sql} [WHERE {where}]，按 {pk} 区间 [lo, lo + chunk) 分批、每批单独提交；返回改写的行数
+    - where 应排除已处理的行（如 "duration_hours IS NULL"）：既是重跑时的断点，也避免同一行被改写两次
+    - 扫到开始时的最大主键后再看一眼，把迁移期间新插入的行一并补上
+    """
+    cond = f" AND ({where})" if where else ""
+    if _offline():
+        op.execute(f"UPDATE {table} SET {set_sql}" + (f" WHERE {where}" if where else ""))
+        return 0
+
+    label = f"backfill {table}"
+    total = 0
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        # 断点：第一条还没处理的行（沿主键索引找，已处理的越多走得越远，但不锁任何行）
+        lo = conn.execute(sa.text(f"SELECT min({pk}) FROM {table} WHERE TRUE{cond}")).scalar()
+        if lo is None:
+            log.info("%s: nothing to do", label)
+            return 0
+        stop = conn.execute(sa.text(f"SELECT max({pk}) FROM {table}")).scalar()
+        progress = _Progress(label, lo, stop)
+        update = sa.text(f"UPDATE {table} SET {set_sql} WHERE {pk} >= :lo AND {pk} < :hi{cond}")
+        while True:
+            while lo <= stop:
+                hi = lo + chunk
+                n = conn.execute(update, {"lo": lo, "hi": hi}).rowcount
+                progress.rows += n
+                total += n
+                progress.report(hi)
+                lo = hi
+                if pause:
+                    time.sleep(pause)
+            latest = conn.execute(sa.text(f"SELECT max({pk}) FROM {table}")).scalar()
+            if latest is None or latest < lo:
+                break
+            progress.stop = stop = latest
+        progress.report(lo, force=True)
+    return total
+
+
+# ---------- 索引 ----------
+def create_index_concurrently(
+    name: str,
+    table: str,
+    columns: Sequence,
+    *,
+    unique: bool = False,
+    where: Optional[str] = None,
+    **kw,
+) -> None:
+    """CREATE INDEX CONCURRENTLY，参数同 op.create_index；where 为部分索引条件（SQL 文本）"""
+    if where is not None:
+        kw["postgresql_where"] = sa.text(where)
+    with op.get_context().autocommit_block():
+        if _offline():
+            # 离线脚本里 autocommit_block 输出 COMMIT / BEGIN，CONCURRENTLY 落在事务外
+            op.create_index(
+                name, table, list(columns), unique=unique, postgresql_concurrently=True, if_not_exists=True, **kw
+            )
+            return
+        state = _index_valid(name)
+        if state:
+            log.info("index %s already exists, skipped", name)
+            return
+        if state is False:
+            log.info("index %s is INVALID (interrupted build), rebuilding", name)
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+        t0 = time.monotonic()
+        op.create_index(
+            name, table, list(columns), unique=unique, postgresql_concurrently=True, if_not_exists=True, **kw
+        )
+        log.info("index %s on %s built in %.1fs", name, table, time.monotonic() - t0)
+
+
+def drop_index_concurrently(name: str, table: str) -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+# ---------- 约束 ----------
+def set_not_null(table: str, column: str) -> None:
+    """
+    ALTER COLUMN ... SET NOT NULL 的在线版：先 NOT VALID 加 CHECK（瞬时），VALIDATE 扫表时只拿
+    SHARE UPDATE EXCLUSIVE；SET NOT NULL 看到已验证的 CHECK 就不再扫表，ACCESS EXCLUSIVE 只持有一瞬
+    """
+    check = f"{table}_{column}_not_null"
+    if _offline():
+        op.alter_column(table, column, nullable=False)
+        return
+    with op.get_context().autocommit_block():
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}")
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({column} IS NOT NULL) NOT VALID")
+        t0 = time.monotonic()
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+        log.info("%s.%s validated NOT NULL in %.1fs", table, column, time.monotonic() - t0)
+        op.alter_column(table, column, nullable=False)
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check}")
@@ -10,6 +10,8 @@ from typing import Sequence, Union
 from alembic import op
 import sqlalchemy as sa
 
+from online_migrations import create_index_concurrently, drop_index_concurrently, has_column
+
 
 # revision identifiers, used by Alembic.
 revision: str = '1246c2126c2b'
@@ -20,39 +22,37 @@ depends_on: Union[str, Sequence[str], None] = None
 
 def upgrade() -> None:
     """Upgrade schema."""
+    # 建索引的 autocommit_block 会先提交前面的 DDL，每步都按「已做过就跳过」写，中断后可整条重跑
     # 1) 新增 4 列（先允许为空，避免老代码写不进去）
-    op.add_column("orders", sa.Column("boss_kook_id",   sa.Text(), nullable=True))
-    op.add_column("orders", sa.Column("boss_kook_name", sa.Text(), nullable=True))
-    op.add_column("orders", sa.Column("player_kook_id",   sa.Text(), nullable=True))
-    op.add_column("orders", sa.Column("player_kook_name", sa.Text(), nullable=True))
+    for col in ("boss_kook_id", "boss_kook_name", "player_kook_id", "player_kook_name"):
+        if not has_column("orders", col):
+            op.add_column("orders", sa.Column(col, sa.Text(), nullable=True))
 
     # 2) 可选：给 id 列建索引，便于查询/导出（不影响功能）
-    op.create_index("ix_orders_boss_kook_id", "orders", ["boss_kook_id"], unique=False)
-    op.create_index("ix_orders_player_kook_id", "orders", ["player_kook_id"], unique=False)
+    #    CONCURRENTLY 建，不挡订单写入（在事务外执行，见 alembic/online_migrations.py）
+    create_index_concurrently("ix_orders_boss_kook_id", "orders", ["boss_kook_id"])
+    create_index_concurrently("ix_orders_player_kook_id", "orders", ["player_kook_id"])
 
     # 3) 删除旧列（如有外键，需先 drop constraint）
     # op.drop_constraint("orders_boss_user_id_fkey", "orders", type_="foreignkey")
     # op.drop_constraint("orders_player_user_id_fkey", "orders", type_="foreignkey")
-    with op.batch_alter_table("orders") as b:
-        b.drop_column("boss_user_id")
-        b.drop_column("player_user_id")
-
+    #    离线脚本里 has_column 恒为 False，删列用 IF EXISTS 保证可重入
+    op.drop_column("orders", "boss_user_id", if_exists=True)
+    op.drop_column("orders", "player_user_id", if_exists=True)
 
 
 def downgrade() -> None:
     """Downgrade schema."""
-# 回滚：加回旧列（类型按你之前的定义；一般是 BigInteger）
-    with op.batch_alter_table("orders") as b:
-        b.add_column(sa.Column("player_user_id", sa.BigInteger(), nullable=True))
-        b.add_column(sa.Column("boss_user_id",   sa.BigInteger(), nullable=False))
+    # 回滚：加回旧列（类型按你之前的定义；一般是 BigInteger）
+    if not has_column("orders", "player_user_id"):
+        op.add_column("orders", sa.Column("player_user_id", sa.BigInteger(), nullable=True))
+    if not has_column("orders", "boss_user_id"):
+        op.add_column("orders", sa.Column("boss_user_id",   sa.BigInteger(), nullable=False))
 
     # 恢复索引
-    op.drop_index("ix_orders_player_kook_id", table_name="orders")
-    op.drop_index("ix_orders_boss_kook_id",   table_name="orders")
+    drop_index_concurrently("ix_orders_player_kook_id", "orders")
+    drop_index_concurrently("ix_orders_boss_kook_id",   "orders")
 
     # 删除新列
-    with op.batch_alter_table("orders") as b:
-        b.drop_column("player_kook_name")
-        b.drop_column("player_kook_id")
-        b.drop_column("boss_kook_name")
-        b.drop_column("boss_kook_id")
\ No newline at end of file
+    for col in ("player_kook_name", "player_kook_id", "boss_kook_name", "boss_kook_id"):
+        op.drop_column("orders", col, if_exists=True)
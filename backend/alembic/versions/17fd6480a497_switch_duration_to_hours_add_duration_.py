@@ -10,6 +10,8 @@ from typing import Sequence, Union
 from alembic import op
 import sqlalchemy as sa
 
+from online_migrations import backfill, has_column, set_not_null
+
 
 # revision identifiers, used by Alembic.
 revision: str = '17fd6480a497'
@@ -20,17 +22,18 @@ depends_on: Union[str, Sequence[str], None] = None
 
 def upgrade() -> None:
     """Upgrade schema."""
-    op.add_column("orders", sa.Column("duration_hours", sa.Numeric(6,2), nullable=True))
-    conn = op.get_bind()
-    conn.execute(sa.text("UPDATE orders SET duration_hours = ROUND(duration_min / 60.0, 2)"))
-    op.alter_column("orders", "duration_hours", nullable=False)
+    # 分批回填 + 在线 NOT NULL，不长时间锁 orders；中断后重跑从未回填的行接着做
+    if not has_column("orders", "duration_hours"):
+        op.add_column("orders", sa.Column("duration_hours", sa.Numeric(6,2), nullable=True))
+    backfill("orders", "duration_hours = ROUND(duration_min / 60.0, 2)", where="duration_hours IS NULL")
+    set_not_null("orders", "duration_hours")
     op.drop_column("orders", "duration_min")
 
 
 def downgrade() -> None:
     """Downgrade schema."""
-    op.add_column("orders", sa.Column("duration_min", sa.Integer(), nullable=True))
-    conn = op.get_bind()
-    conn.execute(sa.text("UPDATE orders SET duration_min = ROUND(duration_hours * 60)"))
-    op.alter_column("orders", "duration_min", nullable=False)
+    if not has_column("orders", "duration_min"):
+        op.add_column("orders", sa.Column("duration_min", sa.Integer(), nullable=True))
+    backfill("orders", "duration_min = ROUND(duration_hours * 60)", where="duration_min IS NULL")
+    set_not_null("orders", "duration_min")
     op.drop_column("orders", "duration_hours")
\ No newline at end of file
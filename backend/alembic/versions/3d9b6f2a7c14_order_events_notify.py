@@ -0,0 +1,58 @@
+"""order_audits: NOTIFY order_events on insert
+
+Revision ID: 3d9b6f2a7c14
+Revises: 8c3f1a6e2b90
+Create Date: 2026-10-17 13:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9b6f2a7c14'
+down_revision: Union[str, Sequence[str], None] = '8c3f1a6e2b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 每条审计（创建 / 流转）在同一事务里 NOTIFY，提交后才投递；回滚则不投递
+    # 事件体与 app.events.order_event 一致，各 worker 的监听任务据此失效缓存、转发 SSE
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_order_event() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('order_events', (
+                SELECT json_build_object(
+                    'id', NEW.id,
+                    'order_id', NEW.order_id,
+                    'from_status', NEW.from_status,
+                    'to_status', NEW.to_status,
+                    'game_name', o.game_name,
+                    'amount_cents', o.amount_cents,
+                    'boss_kook_id', o.boss_kook_id,
+                    'boss_kook_name', o.boss_kook_name,
+                    'player_kook_id', o.player_kook_id,
+                    'player_kook_name', o.player_kook_name,
+                    'at', o.updated_at
+                )::text
+                FROM orders o WHERE o.id = NEW.order_id
+            ));
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER order_audits_notify
+        AFTER INSERT ON order_audits
+        FOR EACH ROW EXECUTE FUNCTION notify_order_event()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS order_audits_notify ON order_audits")
+    op.execute("DROP FUNCTION IF EXISTS notify_order_event()")
@@ -0,0 +1,45 @@
+"""orders: composite indexes for listing (keyset on created_at, id)
+
+Revision ID: 5b7e2c91d4a3
+Revises: ea4045f06a00
+Create Date: 2026-10-17 11:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e2c91d4a3'
+down_revision: Union[str, Sequence[str], None] = 'ea4045f06a00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 全部 CONCURRENTLY（事务外执行，见 alembic/online_migrations.py）：百万行的 orders 上建索引不挡写入；
+    # 中断后重跑会跳过已建好的、重建 INVALID 的
+    # GET /api/orders：过滤列在前，(created_at, id) 在后，按索引顺序倒序扫描 + 行值比较翻页
+    create_index_concurrently("ix_orders_status_created_id", "orders", ["status", "created_at", "id"])
+    create_index_concurrently("ix_orders_created_id", "orders", ["created_at", "id"])
+
+    # 老板 / 陪玩维度：复合索引的前缀即可覆盖原来的单列索引，旧的删掉省写放大
+    create_index_concurrently("ix_orders_boss_created_id", "orders", ["boss_kook_id", "created_at", "id"])
+    create_index_concurrently("ix_orders_player_created_id", "orders", ["player_kook_id", "created_at", "id"])
+    drop_index_concurrently("ix_orders_boss_kook_id", "orders")
+    drop_index_concurrently("ix_orders_player_kook_id", "orders")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    create_index_concurrently("ix_orders_player_kook_id", "orders", ["player_kook_id"])
+    create_index_concurrently("ix_orders_boss_kook_id", "orders", ["boss_kook_id"])
+    drop_index_concurrently("ix_orders_player_created_id", "orders")
+    drop_index_concurrently("ix_orders_boss_created_id", "orders")
+    drop_index_concurrently("ix_orders_created_id", "orders")
+    drop_index_concurrently("ix_orders_status_created_id", "orders")
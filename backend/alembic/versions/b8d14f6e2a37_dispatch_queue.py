@@ -0,0 +1,99 @@
+"""players / player_games / dispatch_queue for automatic assignment
+
+Revision ID: b8d14f6e2a37
+Revises: e5f08b3c6a71
+Create Date: 2026-10-17 16:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d14f6e2a37'
+down_revision: Union[str, Sequence[str], None] = 'e5f08b3c6a71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('players',
+    sa.Column('kook_id', sa.Text(), nullable=False),
+    sa.Column('kook_name', sa.Text(), nullable=True),
+    sa.Column('available', sa.Boolean(), server_default=sa.true(), nullable=False),
+    sa.Column('max_load', sa.SmallInteger(), server_default=sa.text('1'), nullable=False),
+    sa.Column('active_orders', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('completed_hours', sa.Numeric(precision=12, scale=2), server_default=sa.text('0'), nullable=False),
+    sa.Column('last_assigned_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('kook_id')
+    )
+    op.create_table('player_games',
+    sa.Column('player_kook_id', sa.Text(), nullable=False),
+    sa.Column('game_name', sa.Text(), nullable=False),
+    sa.Column('available', sa.Boolean(), nullable=False),
+    sa.Column('max_load', sa.SmallInteger(), nullable=False),
+    sa.Column('active_orders', sa.Integer(), nullable=False),
+    sa.Column('completed_hours', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('last_assigned_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['player_kook_id'], ['players.kook_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('player_kook_id', 'game_name')
+    )
+    op.create_index(
+        'ix_player_games_pick', 'player_games',
+        ['game_name', 'active_orders', 'completed_hours', sa.text('last_assigned_at NULLS FIRST')],
+        unique=False, postgresql_where=sa.text('available AND active_orders < max_load'),
+    )
+    op.create_table('dispatch_queue',
+    sa.Column('order_id', sa.BigInteger(), nullable=False),
+    sa.Column('game_name', sa.Text(), nullable=False),
+    sa.Column('priority', sa.SmallInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('enqueued_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('order_id')
+    )
+    op.create_index('ix_dispatch_queue_next', 'dispatch_queue', ['game_name', sa.text('priority DESC'), 'enqueued_at', 'order_id'], unique=False)
+
+    # players 是负载 / 在线状态的唯一写入点；player_games 里的副本由触发器跟随，挑人时只读一个索引
+    op.execute("""
+        CREATE OR REPLACE FUNCTION sync_player_games() RETURNS trigger AS $$
+        BEGIN
+            UPDATE player_games SET
+                available = NEW.available,
+                max_load = NEW.max_load,
+                active_orders = NEW.active_orders,
+                completed_hours = NEW.completed_hours,
+                last_assigned_at = NEW.last_assigned_at
+            WHERE player_kook_id = NEW.kook_id;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER players_sync_games
+        AFTER UPDATE OF available, max_load, active_orders, completed_hours, last_assigned_at ON players
+        FOR EACH ROW
+        WHEN (ROW(OLD.available, OLD.max_load, OLD.active_orders, OLD.completed_hours, OLD.last_assigned_at)
+             IS DISTINCT FROM ROW(NEW.available, NEW.max_load, NEW.active_orders, NEW.completed_hours, NEW.last_assigned_at))
+        EXECUTE FUNCTION sync_player_games()
+    """)
+
+    # 已审核通过、还没人接的订单直接入队（按审核通过的先后）
+    op.execute("""
+        INSERT INTO dispatch_queue (order_id, game_name, enqueued_at)
+        SELECT id, game_name, updated_at FROM orders WHERE status = 'REVIEW_APPROVED'
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS players_sync_games ON players")
+    op.execute("DROP FUNCTION IF EXISTS sync_player_games()")
+    op.drop_index('ix_dispatch_queue_next', table_name='dispatch_queue')
+    op.drop_table('dispatch_queue')
+    op.drop_index('ix_player_games_pick', table_name='player_games', postgresql_where=sa.text('available AND active_orders < max_load'))
+    op.drop_table('player_games')
+    op.drop_table('players')
@@ -0,0 +1,139 @@
+"""order_audits: monthly range partitions on created_at, payload JSONB, (order_id, created_at) index
+
+Revision ID: c7a2e94b1d53
+Revises: a41e7d0c5f28
+Create Date: 2026-10-17 14:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a2e94b1d53'
+down_revision: Union[str, Sequence[str], None] = 'a41e7d0c5f28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, order_id, actor_user_id, from_status, to_status, reason, created_at, payload"
+
+# 按月建分区（UTC 月界），已存在的跳过；并发调用时别的会话抢先建好也跳过
+ENSURE_PARTITIONS_FN = """
+CREATE OR REPLACE FUNCTION ensure_order_audit_partitions(from_month timestamptz, months_ahead int)
+RETURNS int AS $$
+DECLARE
+    m timestamp := date_trunc('month', from_month AT TIME ZONE 'UTC');
+    last timestamp := date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => months_ahead);
+    part text;
+    n int := 0;
+BEGIN
+    WHILE m <= last LOOP
+        part := 'order_audits_' || to_char(m, '"y"YYYY"m"MM');
+        IF to_regclass(part) IS NULL THEN
+            BEGIN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF order_audits FOR VALUES FROM (%L) TO (%L)',
+                    part, m AT TIME ZONE 'UTC', (m + interval '1 month') AT TIME ZONE 'UTC'
+                );
+                n := n + 1;
+            EXCEPTION WHEN duplicate_table THEN
+                NULL;
+            END;
+        END IF;
+        m := m + interval '1 month';
+    END LOOP;
+    RETURN n;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1) 旧表改名让位（索引 / 约束名全局唯一，一并改名）
+    op.execute("ALTER TABLE order_audits RENAME TO order_audits_old")
+    op.execute("ALTER INDEX order_audits_pkey RENAME TO order_audits_old_pkey")
+    op.execute("ALTER TABLE order_audits_old RENAME CONSTRAINT order_audits_order_id_fkey TO order_audits_old_order_id_fkey")
+    op.execute("ALTER TABLE order_audits_old RENAME CONSTRAINT order_audits_actor_user_id_fkey TO order_audits_old_actor_user_id_fkey")
+    op.execute("DROP TRIGGER IF EXISTS order_audits_notify ON order_audits_old")
+
+    # 2) 分区父表：主键必须包含分区键 -> (id, created_at)；id 继续用原序列
+    op.execute("""
+        CREATE TABLE order_audits (
+            id bigint NOT NULL DEFAULT nextval('order_audits_id_seq'),
+            order_id bigint NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+            actor_user_id bigint REFERENCES users(id),
+            from_status order_status,
+            to_status order_status NOT NULL,
+            reason text,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            payload jsonb,
+            CONSTRAINT order_audits_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE order_audits_id_seq OWNED BY order_audits.id")
+    # 订单历史：按 order_id 查、按时间排
+    op.create_index('ix_order_audits_order_created', 'order_audits', ['order_id', 'created_at'], unique=False)
+
+    # 3) 月分区：从最早一条审计所在月到当前月 + MONTHS_AHEAD；DEFAULT 分区兜底漏建的月份
+    op.execute(ENSURE_PARTITIONS_FN)
+    op.execute(f"""
+        SELECT ensure_order_audit_partitions(
+            coalesce((SELECT min(created_at) FROM order_audits_old), now()), {MONTHS_AHEAD}
+        )
+    """)
+    op.execute("CREATE TABLE order_audits_default PARTITION OF order_audits DEFAULT")
+
+    # 4) 搬数据（JSON -> JSONB），删旧表
+    op.execute(f"""
+        INSERT INTO order_audits ({COLUMNS})
+        SELECT id, order_id, actor_user_id, from_status, to_status, reason, created_at, payload::jsonb
+        FROM order_audits_old
+    """)
+    op.execute("DROP TABLE order_audits_old")
+
+    # 5) NOTIFY 触发器挂回新表（分区表上的行级触发器会下发到每个分区）
+    op.execute("""
+        CREATE TRIGGER order_audits_notify
+        AFTER INSERT ON order_audits
+        FOR EACH ROW EXECUTE FUNCTION notify_order_event()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE order_audits RENAME TO order_audits_part")
+    op.execute("ALTER INDEX order_audits_pkey RENAME TO order_audits_part_pkey")
+    op.execute("DROP TRIGGER IF EXISTS order_audits_notify ON order_audits_part")
+    op.execute("""
+        CREATE TABLE order_audits (
+            id bigint NOT NULL DEFAULT nextval('order_audits_id_seq'),
+            order_id bigint NOT NULL,
+            actor_user_id bigint,
+            from_status order_status,
+            to_status order_status NOT NULL,
+            reason text,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            payload json,
+            CONSTRAINT order_audits_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute(f"""
+        INSERT INTO order_audits ({COLUMNS})
+        SELECT id, order_id, actor_user_id, from_status, to_status, reason, created_at, payload::json
+        FROM order_audits_part
+    """)
+    op.execute("ALTER SEQUENCE order_audits_id_seq OWNED BY order_audits.id")
+    op.execute("DROP TABLE order_audits_part")
+    op.create_foreign_key('order_audits_order_id_fkey', 'order_audits', 'orders', ['order_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('order_audits_actor_user_id_fkey', 'order_audits', 'users', ['actor_user_id'], ['id'])
+    op.execute("DROP FUNCTION IF EXISTS ensure_order_audit_partitions(timestamptz, int)")
+    op.execute("""
+        CREATE TRIGGER order_audits_notify
+        AFTER INSERT ON order_audits
+        FOR EACH ROW EXECUTE FUNCTION notify_order_event()
+    """)
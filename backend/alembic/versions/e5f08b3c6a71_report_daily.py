@@ -0,0 +1,52 @@
+"""report_daily summary table (day x game x player), backfilled from completed audits
+
+Revision ID: e5f08b3c6a71
+Revises: c7a2e94b1d53
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f08b3c6a71'
+down_revision: Union[str, Sequence[str], None] = 'c7a2e94b1d53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 app.services.reports.REPORT_TZ 一致
+REPORT_TZ = os.getenv("REPORT_TZ", "Asia/Shanghai")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('report_daily',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('game_name', sa.Text(), nullable=False),
+    sa.Column('player_kook_id', sa.Text(), nullable=False),
+    sa.Column('player_kook_name', sa.Text(), nullable=True),
+    sa.Column('orders', sa.Integer(), nullable=False),
+    sa.Column('amount_cents', sa.BigInteger(), nullable=False),
+    sa.Column('hours', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'game_name', 'player_kook_id')
+    )
+    # 历史已完成订单：按审计里的 COMPLETED 时间归天
+    op.execute(sa.text("""
+        INSERT INTO report_daily (day, game_name, player_kook_id, player_kook_name, orders, amount_cents, hours)
+        SELECT timezone(:tz, a.created_at)::date, o.game_name, coalesce(o.player_kook_id, ''),
+               max(o.player_kook_name), count(*), sum(o.amount_cents), sum(o.duration_hours)
+        FROM order_audits a
+        JOIN orders o ON o.id = a.order_id
+        WHERE a.to_status = 'COMPLETED'
+        GROUP BY 1, 2, 3
+    """).bindparams(tz=REPORT_TZ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('report_daily')
@@ -0,0 +1,101 @@
+"""orders_archive / order_audits_archive / receipts_archive for terminal orders
+
+Revision ID: f3a8c5d20e19
+Revises: b8d14f6e2a37
+Create Date: 2026-10-17 20:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8c5d20e19'
+down_revision: Union[str, Sequence[str], None] = 'b8d14f6e2a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 枚举类型已由 d32453d37bd6 建好
+order_status = postgresql.ENUM(name='order_status', create_type=False)
+receipt_type = postgresql.ENUM(name='receipt_type', create_type=False)
+
+
+def _archived_at() -> sa.Column:
+    return sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 列与 orders / order_audits / receipts 一一对应，不带外键：订单行已不在 live 表
+    op.create_table('orders_archive',
+    sa.Column('id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('game_name', sa.Text(), nullable=False),
+    sa.Column('amount_cents', sa.Integer(), nullable=False),
+    sa.Column('duration_hours', sa.Numeric(precision=6, scale=2), nullable=False),
+    sa.Column('boss_kook_id', sa.Text(), nullable=True),
+    sa.Column('boss_kook_name', sa.Text(), nullable=True),
+    sa.Column('player_kook_id', sa.Text(), nullable=True),
+    sa.Column('player_kook_name', sa.Text(), nullable=True),
+    sa.Column('status', order_status, nullable=False),
+    sa.Column('extra', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    _archived_at(),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_orders_archive_created_id', 'orders_archive', ['created_at', 'id'], unique=False)
+
+    op.create_table('order_audits_archive',
+    sa.Column('id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('order_id', sa.BigInteger(), nullable=False),
+    sa.Column('actor_user_id', sa.BigInteger(), nullable=True),
+    sa.Column('from_status', order_status, nullable=True),
+    sa.Column('to_status', order_status, nullable=False),
+    sa.Column('reason', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    _archived_at(),
+    sa.PrimaryKeyConstraint('id', 'created_at')
+    )
+    op.create_index('ix_order_audits_archive_order_created', 'order_audits_archive', ['order_id', 'created_at'], unique=False)
+
+    op.create_table('receipts_archive',
+    sa.Column('id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('order_id', sa.BigInteger(), nullable=False),
+    sa.Column('type', receipt_type, nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    _archived_at(),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_receipts_archive_order_id', 'receipts_archive', ['order_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # 先把归档数据搬回 live 表，再删归档表
+    op.execute("""
+        INSERT INTO orders (id, game_name, amount_cents, duration_hours, boss_kook_id, boss_kook_name,
+                            player_kook_id, player_kook_name, status, extra, created_at, updated_at)
+        SELECT id, game_name, amount_cents, duration_hours, boss_kook_id, boss_kook_name,
+               player_kook_id, player_kook_name, status, extra, created_at, updated_at
+        FROM orders_archive
+    """)
+    op.execute("""
+        INSERT INTO order_audits (id, order_id, actor_user_id, from_status, to_status, reason, created_at, payload)
+        SELECT id, order_id, actor_user_id, from_status, to_status, reason, created_at, payload
+        FROM order_audits_archive
+    """)
+    op.execute("""
+        INSERT INTO receipts (id, order_id, type, payload, created_at)
+        SELECT id, order_id, type, payload, created_at FROM receipts_archive
+    """)
+    op.drop_index('ix_receipts_archive_order_id', table_name='receipts_archive')
+    op.drop_table('receipts_archive')
+    op.drop_index('ix_order_audits_archive_order_created', table_name='order_audits_archive')
+    op.drop_table('order_audits_archive')
+    op.drop_index('ix_orders_archive_created_id', table_name='orders_archive')
+    op.drop_table('orders_archive')
@@ -0,0 +1,223 @@
+# app/api_async.py
+"""
+订单生命周期路由的 async 版本（DB_ASYNC=1 时由 app.main 挂载）
+路径、入参、出参与 app.main 中的同步版完全一致，只是换成 AsyncSession，
+请求在等待 Postgres 时不再占用线程池 worker
+"""
+from datetime import date, datetime
+from typing import Optional, List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import get_async_db
+from app.models import Order, OrderStatus, ReceiptType
+from app.schemas import (
+    CreateOrderIn, BulkCreateIn, OrderOut, OrderPage,
+    ReviewIn, AcceptIn, CompleteIn,
+    ReviewBatchIn, AcceptBatchIn, CompleteBatchIn, BatchOut,
+    OrderHistoryOut, RevenueReportOut, PlayersReportOut,
+    PlayerIn, PlayerPatch, PriorityIn, PlayerOut, DispatchQueueOut, RecentPeopleOut,
+    order_dict, audit_dict,
+)
+from app.services import orders_async as svc
+from app.services import reports_async, exports, exports_async, dispatch_async, archive_async
+from app import order_cache
+from app.fastjson import json_response
+from app.services.orders import LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT
+
+router = APIRouter()
+
+
+# ---------- 1) 创建订单 ----------
+@router.post("/api/orders", response_model=OrderOut)
+async def create_order(payload: CreateOrderIn, db: AsyncSession = Depends(get_async_db)):
+    [order] = await svc.create_orders(db, [payload])
+    return json_response(order_dict(order))
+
+# ---------- 1b) 批量创建 ----------
+@router.post("/api/orders/bulk", response_model=List[OrderOut])
+async def create_orders_bulk(payload: BulkCreateIn, db: AsyncSession = Depends(get_async_db)):
+    return json_response([order_dict(o) for o in await svc.create_orders(db, payload)])
+
+# ---------- 2) 查询订单 ----------
+@router.get("/api/orders/{order_id}", response_model=OrderOut)
+async def get_order(order_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    snap = await order_cache.aget(order_id)
+    if snap is None:
+        res = await db.execute(select(Order).where(Order.id == order_id))
+        order = res.scalar_one_or_none() or await archive_async.find_order(db, order_id)
+        if not order:
+            raise HTTPException(status_code=404, detail="order not found")
+        snap = await order_cache.afill(order)
+    return order_cache.snapshot_response(snap, request.headers.get("if-none-match"))
+
+# ---------- 2a) 订单历史 ----------
+@router.get("/api/orders/{order_id}/history", response_model=OrderHistoryOut)
+async def order_history_api(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    items = await svc.order_history(db, order_id)
+    return json_response({"order_id": order_id, "items": [audit_dict(a) for a in items]})
+
+# ---------- 2b) 订单列表 ----------
+@router.get("/api/orders", response_model=OrderPage)
+async def list_orders_api(
+    status: Optional[OrderStatus] = None,
+    boss_kook_id: Optional[str] = None,
+    player_kook_id: Optional[str] = None,
+    game_name: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+):
+    items, next_cursor = await svc.list_orders(
+        db,
+        status=status, boss_kook_id=boss_kook_id, player_kook_id=player_kook_id,
+        game_name=game_name, created_from=created_from, created_to=created_to,
+        cursor=cursor, limit=limit,
+    )
+    return json_response({"items": [order_dict(o) for o in items], "next_cursor": next_cursor})
+
+# ---------- 2d) 报表 ----------
+@router.get("/api/reports/revenue", response_model=RevenueReportOut)
+async def revenue_report_api(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    game_name: Optional[str] = None,
+    player_kook_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await reports_async.revenue(db, date_from, date_to, game_name, player_kook_id)
+
+@router.get("/api/reports/players", response_model=PlayersReportOut)
+async def players_report_api(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    game_name: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await reports_async.players(db, date_from, date_to, game_name, limit)
+
+# ---------- 2e) 结算导出 ----------
+@router.get("/api/export/orders")
+async def export_orders_api(
+    status: Optional[List[OrderStatus]] = Query(None),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    game_name: Optional[str] = None,
+    player_kook_id: Optional[str] = None,
+    format: str = "csv",
+):
+    enc = exports.make_encoder(format, exports.ORDER_COLUMNS)
+    stmt = exports.orders_export_stmt(status, created_from, created_to, game_name, player_kook_id)
+    return exports.export_response(exports_async.stream(stmt, enc, "orders"), "orders", format, enc)
+
+@router.get("/api/export/receipts")
+async def export_receipts_api(
+    type: Optional[ReceiptType] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    order_status: Optional[List[OrderStatus]] = Query(None),
+    format: str = "csv",
+):
+    enc = exports.make_encoder(format, exports.RECEIPT_COLUMNS)
+    stmt = exports.receipts_export_stmt(type, created_from, created_to, order_status)
+    return exports.export_response(exports_async.stream(stmt, enc, "receipts"), "receipts", format, enc)
+
+# ---------- 2f) 派单 ----------
+@router.put("/api/players/{kook_id}", response_model=PlayerOut)
+async def register_player_api(kook_id: str, payload: PlayerIn, db: AsyncSession = Depends(get_async_db)):
+    return await dispatch_async.register_player(
+        db, kook_id, payload.kook_name, payload.games, payload.available, payload.max_load
+    )
+
+@router.patch("/api/players/{kook_id}", response_model=PlayerOut)
+async def update_player_api(kook_id: str, payload: PlayerPatch, db: AsyncSession = Depends(get_async_db)):
+    return await dispatch_async.update_player(db, kook_id, payload.model_dump(exclude_none=True))
+
+@router.get("/api/players", response_model=List[PlayerOut])
+async def list_players_api(game_name: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    return await dispatch_async.list_players(db, game_name)
+
+@router.get("/api/players/recent", response_model=RecentPeopleOut)
+async def recent_people_api(
+    days: int = Query(7, ge=1, le=90),
+    limit: int = Query(200, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """最近活跃的陪玩 / 老板 KOOK ID（机器人启动预热用）"""
+    return await dispatch_async.recent_people(db, days, limit)
+
+@router.get("/api/dispatch/queue", response_model=DispatchQueueOut)
+async def dispatch_queue_api(db: AsyncSession = Depends(get_async_db)):
+    return await dispatch_async.queue_summary(db)
+
+@router.put("/api/dispatch/queue/{order_id}/priority")
+async def dispatch_priority_api(order_id: int, payload: PriorityIn, db: AsyncSession = Depends(get_async_db)):
+    await dispatch_async.set_priority(db, order_id, payload.priority)
+    return {"order_id": order_id, "priority": payload.priority}
+
+# ---------- 3) 审核 ----------
+@router.post("/api/orders/{order_id}/review", response_model=OrderOut)
+async def review_order_api(order_id: int, payload: ReviewIn, db: AsyncSession = Depends(get_async_db)):
+    order = await svc.review_order(
+        db,
+        order_id=order_id,
+        reviewer_kook_id=payload.reviewer_kook_id,
+        approve=payload.approve,
+        reason=payload.reason,
+    )
+    return json_response(order_dict(order))
+
+# ---------- 4) 接单 ----------
+@router.post("/api/orders/{order_id}/accept", response_model=OrderOut)
+async def accept_order_api(order_id: int, payload: AcceptIn, db: AsyncSession = Depends(get_async_db)):
+    order = await svc.accept_order(
+        db=db,
+        order_id=order_id,
+        player_kook_id=payload.player_kook_id,
+        player_kook_name=payload.player_kook_name,
+        payload=payload.payload,
+    )
+    return json_response(order_dict(order))
+
+# ---------- 5) 完成 ----------
+@router.post("/api/orders/{order_id}/complete", response_model=OrderOut)
+async def complete_order_api(order_id: int, payload: CompleteIn, db: AsyncSession = Depends(get_async_db)):
+    order = await svc.complete_order(
+        db,
+        order_id=order_id,
+        actor_kook_id=payload.actor_kook_id,
+        payload=payload.payload,
+    )
+    return json_response(order_dict(order))
+
+# ---------- 6) 批量流转 ----------
+@router.post("/api/orders/review:batch", response_model=BatchOut)
+async def review_orders_batch(payload: ReviewBatchIn, db: AsyncSession = Depends(get_async_db)):
+    return BatchOut(results=await svc.review_orders(
+        db, payload.order_ids,
+        reviewer_kook_id=payload.reviewer_kook_id,
+        approve=payload.approve,
+        reason=payload.reason,
+    ))
+
+@router.post("/api/orders/accept:batch", response_model=BatchOut)
+async def accept_orders_batch(payload: AcceptBatchIn, db: AsyncSession = Depends(get_async_db)):
+    return BatchOut(results=await svc.accept_orders(
+        db, payload.order_ids,
+        player_kook_id=payload.player_kook_id,
+        player_kook_name=payload.player_kook_name,
+        payload=payload.payload,
+    ))
+
+@router.post("/api/orders/complete:batch", response_model=BatchOut)
+async def complete_orders_batch(payload: CompleteBatchIn, db: AsyncSession = Depends(get_async_db)):
+    return BatchOut(results=await svc.complete_orders(
+        db, payload.order_ids,
+        actor_kook_id=payload.actor_kook_id,
+        payload=payload.payload,
+    ))
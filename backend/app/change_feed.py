@@ -0,0 +1,111 @@
+# app/change_feed.py
+"""
+多 worker 的变更订阅：每个 worker 一个后台任务 LISTEN order_events
+（order_audits 上的触发器在写审计的同一事务里 NOTIFY，见 alembic 3d9b6f2a7c14）
+- 收到事件：失效本进程的订单快照（lru），并转发到本进程的事件总线（SSE 订阅者）
+- 本进程自己已发布的事件由事件总线按 ID 去重，不重复推送也不重复失效
+- 断线重连后：清空本进程快照缓存，再从 order_audits 补发断线期间的事件
+ORDER_EVENTS_LISTEN=0 关闭（单 worker 部署不需要）；需要 asyncpg
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+
+from app import events, order_cache
+from app.db import DATABASE_URL, env_flag
+from app.metrics import CHANGE_FEED_EVENTS, CHANGE_FEED_RECONNECTS
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "order_events"
+ORDER_EVENTS_LISTEN = env_flag("ORDER_EVENTS_LISTEN", "1")
+LISTEN_PING = float(os.getenv("ORDER_EVENTS_LISTEN_PING", "30"))   # 秒；空闲时探活，发现半开连接
+LISTEN_BACKOFF_MAX = 30.0
+
+
+def listen_dsn(url: str) -> str:
+    """SQLAlchemy URL -> asyncpg 可用的 postgresql://..."""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class ChangeFeed:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.last_id: Optional[int] = None
+        self.connected_once = False
+
+    def on_notify(self, conn, pid, channel, payload: str) -> None:
+        try:
+            ev = json.loads(payload)
+        except ValueError:
+            log.warning("bad %s payload: %r", CHANNEL, payload)
+            return
+        if self.last_id is None or ev["id"] > self.last_id:
+            self.last_id = ev["id"]
+        if events.bus.publish([ev]):
+            CHANGE_FEED_EVENTS.labels("remote").inc()
+            order_cache.invalidate_local([ev["order_id"]])
+        else:
+            CHANGE_FEED_EVENTS.labels("duplicate").inc()
+
+    async def resync(self) -> None:
+        """断线期间的 NOTIFY 已丢失：本地快照全部作废，事件从审计表补发"""
+        order_cache.clear_local()
+        if self.last_id is None:
+            return
+        missed = await events.replay(self.last_id)
+        if missed:
+            events.bus.publish(missed)
+            self.last_id = missed[-1]["id"]
+
+    async def run(self) -> None:
+        import asyncpg
+
+        attempt = 0
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda c: closed.set())
+                await conn.add_listener(CHANNEL, self.on_notify)
+                if self.connected_once:
+                    await self.resync()
+                self.connected_once = True
+                attempt = 0
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), timeout=LISTEN_PING)
+                    except asyncio.TimeoutError:
+                        await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("%s listener dropped: %s", CHANNEL, e)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            CHANGE_FEED_RECONNECTS.inc()
+            await asyncio.sleep(random.uniform(0, min(LISTEN_BACKOFF_MAX, 0.5 * (2 ** attempt))))
+            attempt = min(attempt + 1, 10)
+
+
+def start() -> Optional[asyncio.Task]:
+    if not ORDER_EVENTS_LISTEN:
+        return None
+    return asyncio.create_task(ChangeFeed(listen_dsn(DATABASE_URL)).run())
+
+
+async def stop(task: Optional[asyncio.Task]) -> None:
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
@@ -1,15 +1,103 @@
 # app/db.py
 import os
+import time
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
 
 load_dotenv()  # 读取 backend/.env
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL not set")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+def env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+# DB_ASYNC=1 时订单路由走 AsyncEngine/AsyncSession（见 app/api_async.py）
+DB_ASYNC = env_flag("DB_ASYNC")
+
+# ---------- 连接池配置（按部署调）----------
+DB_POOL_SIZE     = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW  = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE  = int(os.getenv("DB_POOL_RECYCLE", "-1"))     # 秒；-1 不回收
+DB_POOL_TIMEOUT  = float(os.getenv("DB_POOL_TIMEOUT", "30"))   # 等连接的最长秒数
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", "1")          # 每次取连接先探活（多一次往返）
+DB_NULL_POOL     = env_flag("DB_NULL_POOL")                    # 前面有 PgBouncer 时不在进程内池化
+
+
+class _PoolStatsMixin:
+    """
+    给 QueuePool 加等待统计：只记真正阻塞的取连接 —— 池已满（checkedout >= size + overflow 上限）
+    且实际等了 WAIT_MIN_SECONDS 以上才算一次等待，累计等待秒数；等超时记 timeouts
+    max_overflow < 0（不限溢出）时取连接从不排队，不计等待
+    """
+    WAIT_MIN_SECONDS = 0.001  # 判满之后别的请求刚好还回连接、立即拿到的不算
+    waits = 0
+    wait_seconds = 0.0
+    timeouts = 0
+
+    def __init__(self, *args, max_overflow: int = 10, **kw):
+        super().__init__(*args, max_overflow=max_overflow, **kw)
+        self.overflow_limit = max_overflow
+
+    def _do_get(self):
+        exhausted = self.overflow_limit >= 0 and self.checkedout() >= self.size() + self.overflow_limit
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - t0
+            if exhausted and waited >= self.WAIT_MIN_SECONDS:
+                self.waits += 1
+                self.wait_seconds += waited
+
+
+class StatsQueuePool(_PoolStatsMixin, QueuePool):
+    pass
+
+
+class StatsAsyncQueuePool(_PoolStatsMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_kwargs(poolclass) -> dict:
+    if DB_NULL_POOL:
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def pool_stats(eng) -> dict:
+    """/internal/pool 用：连接池当前占用与累计等待"""
+    p = eng.pool
+    if isinstance(p, NullPool):
+        return {"pool": "NullPool"}
+    return {
+        "pool": type(p).__name__,
+        "size": p.size(),
+        "checked_out": p.checkedout(),
+        "checked_in": p.checkedin(),
+        "overflow": p.overflow(),
+        "max_overflow": getattr(p, "overflow_limit", None),
+        "waits": getattr(p, "waits", 0),
+        "wait_seconds": round(getattr(p, "wait_seconds", 0.0), 6),
+        "timeouts": getattr(p, "timeouts", 0),
+    }
+
+
+engine = create_engine(DATABASE_URL, future=True, **pool_kwargs(StatsQueuePool))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
 def get_session():
@@ -22,3 +110,48 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ---------- 异步引擎（仅 DB_ASYNC=1 时创建，需要 asyncpg）----------
+def to_async_url(url: str) -> str:
+    """postgresql+psycopg2://... -> postgresql+asyncpg://..."""
+    u = make_url(url)
+    if u.get_backend_name() == "postgresql":
+        u = u.set(drivername="postgresql+asyncpg")
+    return u.render_as_string(hide_password=False)
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_kwargs(StatsAsyncQueuePool))
+    # expire_on_commit=False：提交后仍可读取属性，避免在 async 下触发隐式懒加载
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+# FastAPI 依赖（异步版）
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("async engine disabled, set DB_ASYNC=1")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ---------- 中间件 / 后台任务执行 Core 语句：有 async 引擎就走它，否则同步引擎放线程池 ----------
+def _run_core_sync(stmt, fetch: str):
+    with engine.begin() as conn:
+        res = conn.execute(stmt)
+        return res.first() if fetch == "first" else res.all() if fetch == "all" else None
+
+async def run_core(stmt, fetch: str = "first"):
+    """fetch: first | all | none；单独一个事务，执行完即提交"""
+    if async_engine is not None:
+        async with async_engine.begin() as conn:
+            res = await conn.execute(stmt)
+            return res.first() if fetch == "first" else res.all() if fetch == "all" else None
+    from starlette.concurrency import run_in_threadpool
+    return await run_in_threadpool(_run_core_sync, stmt, fetch)
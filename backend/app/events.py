@@ -0,0 +1,214 @@
+# app/events.py
+"""
+订单事件：创建 / 流转提交后发布到进程内 pub/sub，GET /api/orders/events 以 SSE 推给订阅者
+- 事件 ID = 审计行 order_audits.id；断线重连带 Last-Event-ID（或 ?last_event_id=）续传
+- 进程内保留最近 EVENTS_BUFFER 条，按发布顺序续传；Last-Event-ID 不在缓冲区里（太旧 / 进程重启）
+  时从 order_audits（含归档表）补发，最多 EVENTS_REPLAY_MAX 条
+- 审计 ID 在插入时分配、提交顺序不保证递增：ID 较小的事务可能晚于 last_id 才提交。库里补发从
+  last_id - EVENTS_REPLAY_WINDOW 开始，窗口内客户端可能已收到的事件会再发一次，客户端按事件 ID 去重
+- 每个订阅者一个有界队列；跟不上（队列满）就断开它，客户端带 Last-Event-ID 重连即可补齐
+- 同步路由在线程池里发布，统一用 call_soon_threadsafe 投递到事件循环
+其他 worker 的流转由 app.change_feed 监听 NOTIFY 后转发进来
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.db import run_core
+from app.models import Order, OrderArchive, OrderAudit, OrderAuditArchive
+from app.services.archive import with_archived
+
+EVENTS_BUFFER = int(os.getenv("EVENTS_BUFFER", "1000"))
+EVENTS_REPLAY_MAX = int(os.getenv("EVENTS_REPLAY_MAX", "1000"))
+EVENTS_REPLAY_WINDOW = int(os.getenv("EVENTS_REPLAY_WINDOW", "100"))  # 按 ID 往回多补的条数
+EVENTS_QUEUE_MAX = int(os.getenv("EVENTS_QUEUE_MAX", "1000"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))   # 秒；空闲时发注释行保活
+
+_ORDER_FIELDS = (
+    "game_name", "amount_cents", "boss_kook_id", "boss_kook_name",
+    "player_kook_id", "player_kook_name",
+)
+
+
+def _value(v):
+    return getattr(v, "value", v)
+
+
+def order_event(event_id: int, order, from_status) -> Dict[str, Any]:
+    """事件体：流转前后状态 + 推送时常用的订单字段"""
+    ev = {
+        "id": event_id,
+        "order_id": order.id,
+        "from_status": _value(from_status),
+        "to_status": _value(order.status),
+    }
+    for f in _ORDER_FIELDS:
+        ev[f] = getattr(order, f, None)
+    at = getattr(order, "updated_at", None)
+    ev["at"] = at.isoformat() if at else None
+    return ev
+
+
+_OVERFLOW = object()  # 队列里的溢出标记
+
+
+class EventBus:
+    def __init__(self, buffer_size: int, queue_size: int):
+        self.buffer: deque = deque(maxlen=buffer_size)
+        self.queue_size = queue_size
+        self.subscribers: set = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ids: set = set()  # 缓冲区内的事件 ID，用于去重
+        self._lock = threading.Lock()
+
+    def publish(self, events: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        发布并返回真正新发布的事件：本进程提交后直接发布，NOTIFY 又会送来同一事件，
+        谁先到谁发，后到的按 ID 丢弃
+        """
+        fresh = []
+        with self._lock:
+            for ev in events:
+                if ev["id"] in self._ids:
+                    continue
+                if len(self.buffer) == self.buffer.maxlen:
+                    self._ids.discard(self.buffer[0]["id"])
+                self.buffer.append(ev)
+                self._ids.add(ev["id"])
+                fresh.append(ev)
+        loop = self.loop
+        if fresh and loop is not None and self.subscribers:
+            loop.call_soon_threadsafe(self._fanout, fresh)
+        return fresh
+
+    def _fanout(self, events: List[Dict[str, Any]]) -> None:
+        for q in list(self.subscribers):
+            for ev in events:
+                try:
+                    q.put_nowait(ev)
+                except asyncio.QueueFull:
+                    # 慢订阅者：塞一个溢出标记（先腾一格），由它自己断开
+                    q.get_nowait()
+                    q.put_nowait(_OVERFLOW)
+                    self.subscribers.discard(q)
+                    break
+
+    def subscribe(self) -> asyncio.Queue:
+        self.loop = asyncio.get_running_loop()
+        q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self.subscribers.discard(q)
+
+    def since(self, last_id: int) -> Optional[List[Dict[str, Any]]]:
+        """缓冲区里 last_id 之后（按发布顺序）的事件；last_id 不在缓冲区时返回 None"""
+        with self._lock:
+            buf = list(self.buffer)
+        for i in range(len(buf) - 1, -1, -1):
+            if buf[i]["id"] == last_id:
+                return buf[i + 1:]
+        return None
+
+
+bus = EventBus(EVENTS_BUFFER, EVENTS_QUEUE_MAX)
+
+
+def publish_rows(from_status, rows) -> None:
+    """rows：(Order, audit_id)，由 app.services.orders* 在提交后调用"""
+    bus.publish([order_event(audit_id, o, from_status) for o, audit_id in rows])
+
+
+# ---------- 补发：从 order_audits 读 last_id 之后的事件 ----------
+def replay_stmt(last_id: int, limit: int):
+    """live / 归档表各自 UNION ALL 后再关联：订单与审计整批一起归档，搬走的订单照样能补发"""
+    a = with_archived(
+        OrderAudit.__table__, OrderAuditArchive.__table__,
+        [OrderAudit.id, OrderAudit.order_id, OrderAudit.from_status, OrderAudit.to_status, OrderAudit.created_at],
+    )
+    o = with_archived(
+        Order.__table__, OrderArchive.__table__,
+        [Order.id, *(getattr(Order, f) for f in _ORDER_FIELDS)],
+    )
+    return (
+        select(a.c.id, a.c.order_id, a.c.from_status, a.c.to_status, a.c.created_at,
+               *(o.c[f] for f in _ORDER_FIELDS))
+        .select_from(a)
+        .join(o, o.c.id == a.c.order_id)
+        .where(a.c.id > last_id - EVENTS_REPLAY_WINDOW)
+        .order_by(a.c.id)
+        .limit(limit)
+    )
+
+
+async def replay(last_id: int) -> List[Dict[str, Any]]:
+    rows = await run_core(replay_stmt(last_id, EVENTS_REPLAY_MAX + EVENTS_REPLAY_WINDOW), fetch="all")
+    out = []
+    for r in rows:
+        ev = {
+            "id": r.id,
+            "order_id": r.order_id,
+            "from_status": _value(r.from_status),
+            "to_status": _value(r.to_status),
+        }
+        for f in _ORDER_FIELDS:
+            ev[f] = getattr(r, f)
+        ev["at"] = r.created_at.isoformat() if r.created_at else None
+        out.append(ev)
+    return out
+
+
+# ---------- SSE ----------
+def sse_format(ev: Dict[str, Any]) -> str:
+    return f"id: {ev['id']}\nevent: order\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
+
+
+async def sse_stream(request: Request, last_id: Optional[int]) -> AsyncIterator[str]:
+    # 先订阅再补发，补发期间的新事件进队列，按 ID 去重
+    q = bus.subscribe()
+    try:
+        yield "retry: 3000\n\n"
+        sent = set()
+        if last_id is not None:
+            backlog = bus.since(last_id)
+            if backlog is None:
+                backlog = await replay(last_id)
+            for ev in backlog:
+                if ev["id"] in sent:
+                    continue
+                sent.add(ev["id"])
+                yield sse_format(ev)
+        while True:
+            try:
+                ev = await asyncio.wait_for(q.get(), timeout=EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+            if ev is _OVERFLOW:
+                return
+            if ev["id"] in sent:
+                continue
+            yield sse_format(ev)
+    finally:
+        bus.unsubscribe(q)
+
+
+def event_stream_response(request: Request, last_event_id: Optional[int]) -> StreamingResponse:
+    header = request.headers.get("last-event-id")
+    if last_event_id is None and header and header.strip().isdigit():
+        last_event_id = int(header)
+    return StreamingResponse(
+        sse_stream(request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,38 @@
+# app/fastjson.py
+"""
+响应 JSON 快速通道（orjson）
+- FastJSONResponse：app 的 default_response_class；带 response_model 的路由照旧经 pydantic 校验，
+  只是最后一步序列化换成 orjson
+- 订单类路由直接 return json_response(order_dict(...))：ORM 行 / RETURNING 行 -> dict -> bytes 一步完成，
+  不再走「构造 OrderOut -> response_model 再校验一遍 -> 转 jsonable -> json.dumps」；
+  这些路由上的 response_model 只留给 OpenAPI 文档
+- 输出与 pydantic 的 JSON 模式一致：Decimal 为字符串，datetime 为 ISO 8601（UTC 写作 Z）
+基准：python -m bench.serialize
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """已是纯 dict / list 的结果直接出字节，跳过 response_model"""
+    return Response(content=dumps(content), status_code=status_code, media_type="application/json")
@@ -0,0 +1,171 @@
+# app/idempotency.py
+"""
+POST 幂等：请求头带 Idempotency-Key 时
+- 首个请求先占位（status_code 为 NULL），处理完把状态码 + 响应体写回
+- 同 key 同请求的重试：一次主键查询直接回放缓存的响应（响应头 Idempotent-Replayed: true）
+- 同 key 但请求不同（method/path/body 的 sha256 不一致）：422
+- 首个请求还没处理完：409，客户端稍后再重试
+- 5xx / 异常 / 请求被取消（客户端断开、进程退出）不缓存，删掉占位，允许重试重新执行
+- 占位只租 IDEMPOTENCY_LEASE_SECONDS 秒：进程被杀、来不及删占位时，过了租约的占位视为不存在，
+  重试可以接管，不会被 409 挡满整个 TTL；写回 / 删除只认自己占位时的 created_at，被接管后旧请求不会改动新占位
+键保留 IDEMPOTENCY_TTL_HOURS 小时；过期的键视为不存在，由写入时顺带清理，
+归档进程（app/workers/archive.py）每轮再把积压的过期键分批清完（没有写入流量时也不会堆积）
+不带请求头的请求完全不受影响
+"""
+import asyncio
+import hashlib
+import os
+import random
+from datetime import timedelta
+from typing import Optional
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, delete, func, not_, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.db import run_core
+from app.models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+KEY_MAX_LEN = 255
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "120"))
+IDEMPOTENCY_PURGE_EVERY = int(os.getenv("IDEMPOTENCY_PURGE_EVERY", "200"))  # 平均每 N 次新键清理一次
+PURGE_BATCH = 1000
+
+TTL = timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+LEASE = timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+IK = IdempotencyKey
+
+
+def request_hash(method: str, path: str, body: bytes) -> bytes:
+    h = hashlib.sha256()
+    h.update(method.encode())
+    h.update(b"\n")
+    h.update(path.encode())
+    h.update(b"\n")
+    h.update(body)
+    return h.digest()
+
+
+# ---------- 语句 ----------
+def _stale():
+    """过期的键，或租约已过、没人写回的占位：都可以被新请求接管"""
+    return or_(
+        IK.created_at < func.now() - TTL,
+        and_(IK.status_code.is_(None), IK.created_at < func.now() - LEASE),
+    )
+
+
+def lookup_stmt(key: str):
+    return (
+        select(IK.request_hash, IK.status_code, IK.response_body)
+        .where(IK.key == key, not_(_stale()))
+    )
+
+
+def claim_stmt(key: str, req_hash: bytes):
+    """占位：键不存在或可接管时写入并返回 created_at（之后写回 / 删除的凭据）；键仍有效时不返回行"""
+    ins = pg_insert(IK).values(key=key, request_hash=req_hash)
+    return ins.on_conflict_do_update(
+        index_elements=[IK.key],
+        set_={
+            "request_hash": ins.excluded.request_hash,
+            "status_code": None,
+            "response_body": None,
+            "created_at": func.now(),
+        },
+        where=_stale(),
+    ).returning(IK.created_at)
+
+
+def finish_stmt(key: str, claimed_at, status_code: int, body: bytes):
+    return (
+        update(IK)
+        .where(IK.key == key, IK.created_at == claimed_at)
+        .values(status_code=status_code, response_body=body)
+    )
+
+
+def release_stmt(key: str, claimed_at):
+    return delete(IK).where(IK.key == key, IK.created_at == claimed_at)
+
+
+def purge_stmt(limit: int = PURGE_BATCH):
+    expired = (
+        select(IK.key)
+        .where(IK.created_at < func.now() - TTL)
+        .limit(limit)
+        .scalar_subquery()
+    )
+    return delete(IK).where(IK.key.in_(expired))
+
+
+def _replay(row, req_hash: bytes) -> Response:
+    if row.request_hash != req_hash:
+        return JSONResponse(
+            status_code=422,
+            content={"detail": "Idempotency-Key reused with a different request"},
+        )
+    if row.status_code is None:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "request with this Idempotency-Key is in progress"},
+        )
+    return Response(
+        content=row.response_body,
+        status_code=row.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def install(app: FastAPI) -> None:
+    @app.middleware("http")
+    async def _idempotency_middleware(request: Request, call_next):
+        key: Optional[str] = request.headers.get(HEADER)
+        if request.method != "POST" or not key:
+            return await call_next(request)
+        if len(key) > KEY_MAX_LEN:
+            return JSONResponse(status_code=400, content={"detail": f"{HEADER} too long"})
+
+        req_hash = request_hash(request.method, request.url.path, await request.body())
+
+        # 重试的常见路径：一次主键查询
+        row = await run_core(lookup_stmt(key))
+        if row is None:
+            claimed = await run_core(claim_stmt(key, req_hash))
+            if claimed is None:
+                # 并发的同 key 请求抢先占位
+                row = await run_core(lookup_stmt(key))
+                if row is None:
+                    return JSONResponse(
+                        status_code=409,
+                        content={"detail": "request with this Idempotency-Key is in progress"},
+                    )
+        if row is not None:
+            return _replay(row, req_hash)
+        claimed_at = claimed.created_at
+
+        finished = False
+        try:
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            if response.status_code < 500:
+                await run_core(finish_stmt(key, claimed_at, response.status_code, body), fetch="none")
+                finished = True
+        finally:
+            if not finished:
+                # 含 CancelledError（BaseException）：shield 保证取消时删占位的语句照样执行完
+                await asyncio.shield(run_core(release_stmt(key, claimed_at), fetch="none"))
+
+        if IDEMPOTENCY_PURGE_EVERY > 0 and random.randrange(IDEMPOTENCY_PURGE_EVERY) == 0:
+            await run_core(purge_stmt(), fetch="none")
+
+        # 原样带回所有响应头（Set-Cookie 等可重复的头不能合并成 dict），只重算 content-length
+        out = Response(content=body, status_code=response.status_code)
+        out.raw_headers = [
+            (k, v) for k, v in response.raw_headers if k.lower() != b"content-length"
+        ] + [(b"content-length", str(len(body)).encode())]
+        return out
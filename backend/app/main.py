@@ -1,19 +1,56 @@
 # app/main.py
-from fastapi import FastAPI, Depends, HTTPException
+import logging
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Optional, List
+
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from app.db import get_db
-from app.models import Order, OrderAudit, OrderStatus
+from app.db import get_db, DB_ASYNC, engine, async_engine, pool_stats, run_core
+from app.models import Order, OrderStatus, ReceiptType
 from app.schemas import (
-    CreateOrderIn, OrderOut,
+    CreateOrderIn, BulkCreateIn, OrderOut, OrderPage,
     ReviewIn, AcceptIn, CompleteIn,
+    ReviewBatchIn, AcceptBatchIn, CompleteBatchIn, BatchOut,
+    OrderHistoryOut, RevenueReportOut, PlayersReportOut,
+    PlayerIn, PlayerPatch, PriorityIn, PlayerOut, DispatchQueueOut, RecentPeopleOut,
+    order_dict, audit_dict,
 )
+from app.services.orders import LIST_DEFAULT_LIMIT, LIST_MAX_LIMIT, ensure_audit_partitions_stmt
+from app import metrics, idempotency, order_cache, events, change_feed
+from app.fastjson import FastJSONResponse, json_response
+
+
+# 每个 worker 启动时：补建审计分区；开一个 LISTEN order_events 后台任务（见 app.change_feed）
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 审计表按月分区：启动时补建未来几个月的分区（已存在的跳过），失败不影响启动（有 DEFAULT 分区兜底）
+    try:
+        await run_core(ensure_audit_partitions_stmt())
+    except Exception as e:
+        logging.getLogger(__name__).warning("ensure audit partitions failed: %s", e)
+    feed = change_feed.start()
+    try:
+        yield
+    finally:
+        await change_feed.stop(feed)
+
+
+# 默认响应走 orjson；订单类路由直接返回 json_response，跳过 response_model 再校验（见 app.fastjson）
+app = FastAPI(title="Kook Order Backend (MVP)", lifespan=lifespan, default_response_class=FastJSONResponse)
 
+# ---------- POST 幂等：Idempotency-Key（先装，指标中间件在外层一并计时）----------
+idempotency.install(app)
 
-app = FastAPI(title="Kook Order Backend (MVP)")
+# ---------- 指标：/metrics ----------
+metrics.install(app)
+metrics.instrument_engine(engine)
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine)
 
 # ---------- 通用异常处理 ----------
 @app.exception_handler(IntegrityError)
@@ -27,26 +64,28 @@ async def handle_integrity_error(request: Request, exc: IntegrityError):
 def root():
     return {"ok": True, "service": "Kook Order Backend"}
 
-# ---------- 小工具：统一构造输出 ----------
-def to_order_out(order: Order) -> OrderOut:
-    # 有的 Enum 需要 .value，有的直接是 str
-    status_val = order.status.value if hasattr(order.status, "value") else str(order.status)
-    return OrderOut(
-        id=order.id,
-        game_name=order.game_name,
-        amount_cents=order.amount_cents,
-        duration_hours=order.duration_hours,
-        status=status_val,
-        extra=order.extra,
-        # 新增：直接从 orders 表返回 KOOK 身份
-        boss_kook_id=getattr(order, "boss_kook_id", None),
-        boss_kook_name=getattr(order, "boss_kook_name", None),
-        player_kook_id=getattr(order, "player_kook_id", None),
-        player_kook_name=getattr(order, "player_kook_name", None),
-    )
+# ---------- 连接池状态：按真实并发调 DB_POOL_SIZE / DB_MAX_OVERFLOW ----------
+@app.get("/internal/pool")
+def pool_status():
+    out = {"sync": pool_stats(engine)}
+    if async_engine is not None:
+        out["async"] = pool_stats(async_engine.sync_engine)
+    return out
+
+# ---------- 订单事件流（SSE）：必须先于 /api/orders/{order_id} 注册 ----------
+@app.get("/api/orders/events")
+async def order_events(request: Request, last_event_id: Optional[int] = Query(None, ge=0)):
+    """
+    text/event-stream；每个事件 id 为审计 ID，event 为 order，data 为 JSON
+    断线重连带 Last-Event-ID 请求头（或 ?last_event_id=）从断点续传
+    """
+    return events.event_stream_response(request, last_event_id)
+
+# ---------- 订单生命周期路由（同步版；DB_ASYNC=1 时换成 app.api_async）----------
+orders_router = APIRouter()
 
 # ---------- 1) 创建订单：写入老板 KOOK id + name ----------
-@app.post("/api/orders", response_model=OrderOut)
+@orders_router.post("/api/orders", response_model=OrderOut)
 def create_order(payload: CreateOrderIn, db: Session = Depends(get_db)):
     """
     期望 payload（schemas.CreateOrderIn）包含：
@@ -55,39 +94,152 @@ def create_order(payload: CreateOrderIn, db: Session = Depends(get_db)):
     - duration_hours: Decimal/float(保留2位)
     - boss_kook_id: str               ← KOOK 数字ID（如 "174142457"）
     - boss_kook_name: str             ← KOOK 昵称（如 "奥巴马#1234"）
+    一条 INSERT ... RETURNING 同时写入订单与 PENDING_REVIEW 审计
     """
-    order = Order(
-        game_name=payload.game_name.strip(),
-        amount_cents=payload.amount_cents,
-        duration_hours=payload.duration_hours,
-        status=OrderStatus.PENDING_REVIEW,
-        # 直接记录 KOOK 身份（不再依赖内部用户ID）
-        boss_kook_id=payload.boss_kook_id,
-        boss_kook_name=payload.boss_kook_name,
-        # 玩家信息接单时写入
-        player_kook_id=None,
-        player_kook_name=None,
-    )
-    db.add(order)
-    db.flush()
+    from app.services.orders import create_orders
+    [order] = create_orders(db, [payload])
+    return json_response(order_dict(order))
 
-    db.add(OrderAudit(order_id=order.id,
-                      to_status=OrderStatus.PENDING_REVIEW,
-                      reason="create"))
-    db.commit()
-    db.refresh(order)
-    return to_order_out(order)
+# ---------- 1b) 批量创建：多行 INSERT ... RETURNING，一个事务 ----------
+@orders_router.post("/api/orders/bulk", response_model=List[OrderOut])
+def create_orders_bulk(payload: BulkCreateIn, db: Session = Depends(get_db)):
+    from app.services.orders import create_orders
+    return json_response([order_dict(o) for o in create_orders(db, payload)])
 
 # ---------- 2) 查询订单：直接返回四个 KOOK 字段 ----------
-@app.get("/api/orders/{order_id}", response_model=OrderOut)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.id == order_id).one_or_none()
-    if not order:
-        raise HTTPException(status_code=404, detail="order not found")
-    return to_order_out(order)
+@orders_router.get("/api/orders/{order_id}", response_model=OrderOut)
+def get_order(order_id: int, request: Request, db: Session = Depends(get_db)):
+    # 先查快照缓存：命中不碰数据库；ETag 一致返回 304
+    snap = order_cache.get(order_id)
+    if snap is None:
+        order = db.query(Order).filter(Order.id == order_id).one_or_none()
+        if not order:
+            from app.services import archive
+            order = archive.find_order(db, order_id)  # 已归档的终态订单
+        if not order:
+            raise HTTPException(status_code=404, detail="order not found")
+        snap = order_cache.fill(order)
+    return order_cache.snapshot_response(snap, request.headers.get("if-none-match"))
+
+# ---------- 2a) 订单历史：审计记录（按月分区表）----------
+@orders_router.get("/api/orders/{order_id}/history", response_model=OrderHistoryOut)
+def order_history_api(order_id: int, db: Session = Depends(get_db)):
+    from app.services.orders import order_history
+    items = order_history(db, order_id)
+    return json_response({"order_id": order_id, "items": [audit_dict(a) for a in items]})
+
+# ---------- 2b) 订单列表：按状态 / 老板 / 陪玩 / 游戏 / 创建时间过滤，keyset 分页 ----------
+@orders_router.get("/api/orders", response_model=OrderPage)
+def list_orders_api(
+    status: Optional[OrderStatus] = None,
+    boss_kook_id: Optional[str] = None,
+    player_kook_id: Optional[str] = None,
+    game_name: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(LIST_DEFAULT_LIMIT, ge=1, le=LIST_MAX_LIMIT),
+    db: Session = Depends(get_db),
+):
+    from app.services.orders import list_orders
+    items, next_cursor = list_orders(
+        db,
+        status=status, boss_kook_id=boss_kook_id, player_kook_id=player_kook_id,
+        game_name=game_name, created_from=created_from, created_to=created_to,
+        cursor=cursor, limit=limit,
+    )
+    return json_response({"items": [order_dict(o) for o in items], "next_cursor": next_cursor})
+
+# ---------- 2d) 报表：只读汇总表 report_daily，按天数计算量 ----------
+@orders_router.get("/api/reports/revenue", response_model=RevenueReportOut)
+def revenue_report_api(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    game_name: Optional[str] = None,
+    player_kook_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    from app.services import reports
+    return reports.revenue(db, date_from, date_to, game_name, player_kook_id)
+
+@orders_router.get("/api/reports/players", response_model=PlayersReportOut)
+def players_report_api(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    game_name: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    from app.services import reports
+    return reports.players(db, date_from, date_to, game_name, limit)
+
+# ---------- 2e) 结算导出：服务端游标分批取数，边查边写（见 app/services/exports.py）----------
+@orders_router.get("/api/export/orders")
+def export_orders_api(
+    status: Optional[List[OrderStatus]] = Query(None),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    game_name: Optional[str] = None,
+    player_kook_id: Optional[str] = None,
+    format: str = "csv",
+):
+    from app.services import exports
+    enc = exports.make_encoder(format, exports.ORDER_COLUMNS)
+    stmt = exports.orders_export_stmt(status, created_from, created_to, game_name, player_kook_id)
+    return exports.export_response(exports.stream(stmt, enc, "orders"), "orders", format, enc)
+
+@orders_router.get("/api/export/receipts")
+def export_receipts_api(
+    type: Optional[ReceiptType] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    order_status: Optional[List[OrderStatus]] = Query(None),
+    format: str = "csv",
+):
+    from app.services import exports
+    enc = exports.make_encoder(format, exports.RECEIPT_COLUMNS)
+    stmt = exports.receipts_export_stmt(type, created_from, created_to, order_status)
+    return exports.export_response(exports.stream(stmt, enc, "receipts"), "receipts", format, enc)
+
+# ---------- 2f) 派单：陪玩登记 / 待派队列（派单进程见 app/workers/dispatch.py）----------
+@orders_router.put("/api/players/{kook_id}", response_model=PlayerOut)
+def register_player_api(kook_id: str, payload: PlayerIn, db: Session = Depends(get_db)):
+    from app.services import dispatch
+    return dispatch.register_player(db, kook_id, payload.kook_name, payload.games, payload.available, payload.max_load)
+
+@orders_router.patch("/api/players/{kook_id}", response_model=PlayerOut)
+def update_player_api(kook_id: str, payload: PlayerPatch, db: Session = Depends(get_db)):
+    from app.services import dispatch
+    return dispatch.update_player(db, kook_id, payload.model_dump(exclude_none=True))
+
+@orders_router.get("/api/players", response_model=List[PlayerOut])
+def list_players_api(game_name: Optional[str] = None, db: Session = Depends(get_db)):
+    from app.services import dispatch
+    return dispatch.list_players(db, game_name)
+
+@orders_router.get("/api/players/recent", response_model=RecentPeopleOut)
+def recent_people_api(
+    days: int = Query(7, ge=1, le=90),
+    limit: int = Query(200, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """最近活跃的陪玩 / 老板 KOOK ID（机器人启动预热用）"""
+    from app.services import dispatch
+    return dispatch.recent_people(db, days, limit)
+
+@orders_router.get("/api/dispatch/queue", response_model=DispatchQueueOut)
+def dispatch_queue_api(db: Session = Depends(get_db)):
+    from app.services import dispatch
+    return dispatch.queue_summary(db)
+
+@orders_router.put("/api/dispatch/queue/{order_id}/priority")
+def dispatch_priority_api(order_id: int, payload: PriorityIn, db: Session = Depends(get_db)):
+    from app.services import dispatch
+    dispatch.set_priority(db, order_id, payload.priority)
+    return {"order_id": order_id, "priority": payload.priority}
 
 # ---------- 3) 审核（保持原有业务，仅返回增加新字段） ----------
-@app.post("/api/orders/{order_id}/review", response_model=OrderOut)
+@orders_router.post("/api/orders/{order_id}/review", response_model=OrderOut)
 def review_order_api(order_id: int, payload: ReviewIn, db: Session = Depends(get_db)):
     """
     你的 services.review_order 如果仍可用也能继续用；
@@ -101,10 +253,10 @@ def review_order_api(order_id: int, payload: ReviewIn, db: Session = Depends(get
         approve=payload.approve,
         reason=payload.reason,
     )
-    return to_order_out(order)
+    return json_response(order_dict(order))
 
 # ---------- 4) 接单：必须提供陪玩 KOOK id + name，并写入 ----------
-@app.post("/api/orders/{order_id}/accept", response_model=OrderOut)
+@orders_router.post("/api/orders/{order_id}/accept", response_model=OrderOut)
 def accept_order_api(order_id: int, payload: AcceptIn, db: Session = Depends(get_db)):
     """
     接单：必须提供 player_kook_id / player_kook_name
@@ -118,10 +270,10 @@ def accept_order_api(order_id: int, payload: AcceptIn, db: Session = Depends(get
         player_kook_name=payload.player_kook_name,
         payload=payload.payload,
     )
-    return to_order_out(order)
+    return json_response(order_dict(order))
 
 # ---------- 5) 完成（保持原有业务，仅返回增加新字段） ----------
-@app.post("/api/orders/{order_id}/complete", response_model=OrderOut)
+@orders_router.post("/api/orders/{order_id}/complete", response_model=OrderOut)
 def complete_order_api(order_id: int, payload: CompleteIn, db: Session = Depends(get_db)):
     from app.services.orders import complete_order  # 局部导入
     order = complete_order(
@@ -130,4 +282,41 @@ def complete_order_api(order_id: int, payload: CompleteIn, db: Session = Depends
         actor_kook_id=payload.actor_kook_id,
         payload=payload.payload,
     )
-    return to_order_out(order)
+    return json_response(order_dict(order))
+
+# ---------- 6) 批量流转：同一状态机规则，一条集合语句，逐个 ID 返回结果 ----------
+@orders_router.post("/api/orders/review:batch", response_model=BatchOut)
+def review_orders_batch(payload: ReviewBatchIn, db: Session = Depends(get_db)):
+    from app.services.orders import review_orders
+    return BatchOut(results=review_orders(
+        db, payload.order_ids,
+        reviewer_kook_id=payload.reviewer_kook_id,
+        approve=payload.approve,
+        reason=payload.reason,
+    ))
+
+@orders_router.post("/api/orders/accept:batch", response_model=BatchOut)
+def accept_orders_batch(payload: AcceptBatchIn, db: Session = Depends(get_db)):
+    from app.services.orders import accept_orders
+    return BatchOut(results=accept_orders(
+        db, payload.order_ids,
+        player_kook_id=payload.player_kook_id,
+        player_kook_name=payload.player_kook_name,
+        payload=payload.payload,
+    ))
+
+@orders_router.post("/api/orders/complete:batch", response_model=BatchOut)
+def complete_orders_batch(payload: CompleteBatchIn, db: Session = Depends(get_db)):
+    from app.services.orders import complete_orders
+    return BatchOut(results=complete_orders(
+        db, payload.order_ids,
+        actor_kook_id=payload.actor_kook_id,
+        payload=payload.payload,
+    ))
+
+# ---------- 挂载订单路由：按配置选择同步 / 异步实现 ----------
+if DB_ASYNC:
+    from app.api_async import router as _lifecycle_router
+else:
+    _lifecycle_router = orders_router
+app.include_router(_lifecycle_router)
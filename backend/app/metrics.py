@@ -0,0 +1,105 @@
+# app/metrics.py
+"""
+Prometheus 指标：GET /metrics
+- 每个路由的请求耗时直方图 / 状态码计数
+- 每个请求的 DB 查询次数与耗时（SQLAlchemy cursor 事件 + contextvar 按请求累计）
+- 订单状态流转计数（PENDING_REVIEW -> REVIEW_APPROVED 等）
+多 worker 部署时按 prometheus_client 的 multiprocess 模式设置 PROMETHEUS_MULTIPROC_DIR
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from sqlalchemy import event
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时", ["method", "route"],
+)
+REQUESTS_TOTAL = Counter(
+    "http_requests_total", "HTTP 请求数（按状态码）", ["method", "route", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "单个请求执行的 SQL 条数", ["route"],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 50),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "单个请求累计 SQL 耗时", ["route"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "单条 SQL 耗时",
+)
+ORDER_TRANSITIONS = Counter(
+    "order_transitions_total", "订单状态流转次数", ["from_status", "to_status"],
+)
+CHANGE_FEED_EVENTS = Counter(
+    "change_feed_events_total", "收到的 NOTIFY order_events（remote=其他 worker，duplicate=本进程已发布）", ["origin"],
+)
+CHANGE_FEED_RECONNECTS = Counter(
+    "change_feed_reconnects_total", "LISTEN 连接重连次数",
+)
+EXPORT_ROWS = Counter(
+    "export_rows_total", "导出接口已写出的行数", ["table"],
+)
+ARCHIVE_READS = Counter(
+    "order_archive_reads_total", "live 表未命中、从归档表读到的次数", ["kind"],
+)
+
+# 当前请求的 [SQL 条数, SQL 累计秒数]；不在请求内（脚本、后台任务）为 None
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+
+
+def record_transition(from_status, to_status, n: int = 1) -> None:
+    if n <= 0:
+        return
+    f = getattr(from_status, "value", from_status) or "NONE"
+    t = getattr(to_status, "value", to_status)
+    ORDER_TRANSITIONS.labels(f, t).inc(n)
+
+
+def instrument_engine(sync_engine) -> None:
+    """挂 cursor 事件统计 SQL；async 引擎传 async_engine.sync_engine"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_t0", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        dt = time.perf_counter() - conn.info["query_t0"].pop()
+        DB_QUERY_SECONDS.observe(dt)
+        acc = _request_db.get()
+        if acc is not None:
+            acc[0] += 1
+            acc[1] += dt
+
+
+def _route_of(request: Request) -> str:
+    # 用路由模板做标签（/api/orders/{order_id}），避免按 ID 爆基数
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def install(app: FastAPI) -> None:
+    @app.middleware("http")
+    async def _metrics_middleware(request: Request, call_next):
+        acc = [0, 0.0]
+        token = _request_db.set(acc)
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = _route_of(request)
+            REQUEST_SECONDS.labels(request.method, route).observe(time.perf_counter() - t0)
+            REQUESTS_TOTAL.labels(request.method, route, str(status)).inc()
+            REQUEST_DB_QUERIES.labels(route).observe(acc[0])
+            REQUEST_DB_SECONDS.labels(route).observe(acc[1])
+            _request_db.reset(token)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
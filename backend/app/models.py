@@ -77,18 +77,32 @@ class Order(Base):
         onupdate=func.now()
     )
 
+    # 列表查询（keyset 分页按 created_at DESC, id DESC）用到的复合索引
+    __table_args__ = (
+        sa.Index("ix_orders_status_created_id", "status", "created_at", "id"),
+        sa.Index("ix_orders_boss_created_id", "boss_kook_id", "created_at", "id"),
+        sa.Index("ix_orders_player_created_id", "player_kook_id", "created_at", "id"),
+        sa.Index("ix_orders_created_id", "created_at", "id"),
+    )
+
 # 5) 审计
 class OrderAudit(Base):
     __tablename__ = "order_audits"
 
+    # 按 created_at 月分区（分区由 ensure_order_audit_partitions() 维护），主键须含分区键
     id = Column(BigInteger, primary_key=True)
     order_id = Column(BigInteger, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
     actor_user_id = Column(BigInteger, ForeignKey("users.id"), nullable=True)  # 系统可为空
     from_status = Column(Enum(OrderStatus, name="order_status"), nullable=True)
     to_status = Column(Enum(OrderStatus, name="order_status"), nullable=False)
     reason = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
-    payload = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    payload = Column(JSONB, nullable=True)
+
+    __table_args__ = (
+        sa.Index("ix_order_audits_order_created", "order_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
 # 6) 回执
 class ReceiptType(str, enum.Enum):
@@ -103,3 +117,123 @@ class Receipt(Base):
     type = Column(Enum(ReceiptType, name="receipt_type"), nullable=False)
     payload = Column(JSON, nullable=False)
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+# 7) 幂等键：POST 带 Idempotency-Key 时缓存首个响应，重试直接回放（见 app/idempotency.py）
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(Text, primary_key=True)
+    request_hash = Column(sa.LargeBinary, nullable=False)      # sha256(method, path, body)
+    status_code = Column(sa.SmallInteger, nullable=True)       # NULL = 首个请求仍在处理
+    response_body = Column(sa.LargeBinary, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+# 8) 发件箱：与状态流转同一事务写入，由 app/workers/outbox.py 异步投递（至少一次）
+class Outbox(Base):
+    __tablename__ = "outbox"
+
+    id = Column(BigInteger, primary_key=True)
+    topic = Column(Text, nullable=False)                      # order.pending_review / order.completed ...
+    order_id = Column(BigInteger, nullable=True)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())  # 租约 / 退避到期时间
+    attempts = Column(Integer, nullable=False, server_default=text("0"))
+    last_error = Column(Text, nullable=True)
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # 只索引待投递的行：领取时按 available_at 扫描
+        sa.Index(
+            "ix_outbox_pending", "available_at", "id",
+            postgresql_where=text("delivered_at IS NULL"),
+        ),
+    )
+
+# 9) 日报汇总：天（REPORT_TZ）× 游戏 × 陪玩，结单时在同一语句里增量累加（见 app/services/reports.py）
+class ReportDaily(Base):
+    __tablename__ = "report_daily"
+
+    day = Column(sa.Date, primary_key=True)
+    game_name = Column(Text, primary_key=True)
+    player_kook_id = Column(Text, primary_key=True)            # 无陪玩记为 ''
+    player_kook_name = Column(Text, nullable=True)            # 最近一次结单时的昵称
+    orders = Column(Integer, nullable=False)
+    amount_cents = Column(BigInteger, nullable=False)
+    hours = Column(sa.Numeric(12, 2), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+# 10) 派单：陪玩（可接的游戏、是否在线、当前负载）与待派队列（见 app/services/dispatch.py）
+class Player(Base):
+    __tablename__ = "players"
+
+    kook_id = Column(Text, primary_key=True)
+    kook_name = Column(Text, nullable=True)
+    available = Column(sa.Boolean, nullable=False, server_default=sa.true())
+    max_load = Column(sa.SmallInteger, nullable=False, server_default=text("1"))      # 同时进行中的订单上限
+    active_orders = Column(Integer, nullable=False, server_default=text("0"))         # 接单 +1，结单 -1
+    completed_hours = Column(sa.Numeric(12, 2), nullable=False, server_default=text("0"))
+    last_assigned_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class PlayerGame(Base):
+    __tablename__ = "player_games"
+
+    player_kook_id = Column(Text, ForeignKey("players.kook_id", ondelete="CASCADE"), primary_key=True)
+    game_name = Column(Text, primary_key=True)
+    # 以下是 players 对应列的副本（players 上的触发器同步），
+    # 让「某游戏里负载最低、累计时长最少的空闲陪玩」成为一个部分索引的最左端：O(log n)
+    available = Column(sa.Boolean, nullable=False)
+    max_load = Column(sa.SmallInteger, nullable=False)
+    active_orders = Column(Integer, nullable=False)
+    completed_hours = Column(sa.Numeric(12, 2), nullable=False)
+    last_assigned_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        sa.Index(
+            "ix_player_games_pick", "game_name", "active_orders", "completed_hours",
+            text("last_assigned_at NULLS FIRST"),
+            postgresql_where=text("available AND active_orders < max_load"),
+        ),
+    )
+
+class DispatchQueue(Base):
+    __tablename__ = "dispatch_queue"
+
+    order_id = Column(BigInteger, ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    game_name = Column(Text, nullable=False)
+    priority = Column(sa.SmallInteger, nullable=False, server_default=text("0"))       # 大的先派
+    enqueued_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        # 每个游戏一条队列：优先级高的先、同优先级先进先出；队首 = 该游戏索引段的最左端
+        sa.Index("ix_dispatch_queue_next", "game_name", text("priority DESC"), "enqueued_at", "order_id"),
+    )
+
+# 11) 冷数据归档：终态订单连同审计、回执整批搬进 *_archive（见 app/services/archive.py）
+#     列与原表一一对应（不带外键 / 默认值），另加 archived_at；原表加列时归档表要同步加
+def _archive_table(name: str, live: sa.Table, *indexes: sa.Index) -> sa.Table:
+    cols = [
+        Column(c.name, c.type, nullable=c.nullable, primary_key=c.primary_key, autoincrement=False)
+        for c in live.columns
+    ]
+    archived_at = Column("archived_at", DateTime(timezone=True), nullable=False, server_default=func.now())
+    return sa.Table(name, Base.metadata, *cols, archived_at, *indexes)
+
+class OrderArchive(Base):
+    __table__ = _archive_table(
+        "orders_archive", Order.__table__,
+        sa.Index("ix_orders_archive_created_id", "created_at", "id"),
+    )
+
+class OrderAuditArchive(Base):
+    __table__ = _archive_table(
+        "order_audits_archive", OrderAudit.__table__,
+        sa.Index("ix_order_audits_archive_order_created", "order_id", "created_at"),
+    )
+
+class ReceiptArchive(Base):
+    __table__ = _archive_table(
+        "receipts_archive", Receipt.__table__,
+        sa.Index("ix_receipts_archive_order_id", "order_id"),
+    )
@@ -0,0 +1,282 @@
+# app/order_cache.py
+"""
+订单快照缓存：GET /api/orders/{id} 读穿透，状态流转提交后替换 / 失效
+- 快照 = (ETag, 序列化好的 JSON 字节, 版本 updated_at)：命中时不查库也不重新序列化，
+  If-None-Match 与 ETag 一致直接 304
+- ORDER_CACHE=lru（默认，进程内 LRU + TTL）| redis | off
+- redis：ORDER_CACHE_REDIS_URL，需要 redis 包；ORDER_CACHE_REDIS_URL=fake:// 用进程内的 FakeRedis
+  （接口与 redis 客户端一致，本地调试 / 测试用）
+多 worker 用 lru 时，别的 worker 上的流转由 app.change_feed 收到 NOTIFY 后失效；TTL（ORDER_CACHE_TTL 秒）兜底
+流转（单条 / 批量 / 自动派单）一律用 RETURNING 行 put 新快照而不是删掉：删掉后，流转前读到旧行的 GET
+回填时没有更新的版本可比，旧快照会一直挂到 TTL；put 之后旧行回填会被版本比较挡掉
+async 路由 / 进程用 aget / afill / afill_many：redis 客户端是同步的，放进线程池，不卡事件循环
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional
+
+from fastapi import Response
+from starlette.concurrency import run_in_threadpool
+
+from app.fastjson import dumps
+from app.schemas import order_dict
+
+ORDER_CACHE = os.getenv("ORDER_CACHE", "lru").strip().lower()
+ORDER_CACHE_MAX = int(os.getenv("ORDER_CACHE_MAX", "10000"))
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "30"))
+ORDER_CACHE_REDIS_URL = os.getenv("ORDER_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+
+class Snapshot(NamedTuple):
+    etag: str
+    body: bytes
+    version: float  # updated_at 时间戳：旧快照不覆盖新快照
+
+
+def make_snapshot(order) -> Snapshot:
+    body = dumps(order_dict(order))
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()[:20]
+    updated = getattr(order, "updated_at", None)
+    return Snapshot(etag, body, updated.timestamp() if updated else 0.0)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # 兼容弱校验前缀 W/ 与逗号分隔的多个值
+    return etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+
+def snapshot_response(snap: Snapshot, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": snap.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, snap.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
+
+
+# ---------- 后端实现：get / put / invalidate ----------
+class NullOrderCache:
+    local = True
+
+    def get(self, order_id: int) -> Optional[Snapshot]:
+        return None
+
+    def put(self, order_id: int, snap: Snapshot) -> None:
+        pass
+
+    def invalidate(self, order_ids: Iterable[int]) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class LRUOrderCache:
+    """进程内 LRU；路由线程池里并发读写，加锁"""
+
+    local = True
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[int, tuple[float, Snapshot]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, order_id: int) -> Optional[Snapshot]:
+        with self._lock:
+            hit = self._data.get(order_id)
+            if hit is None:
+                return None
+            expires, snap = hit
+            if expires < time.monotonic():
+                del self._data[order_id]
+                return None
+            self._data.move_to_end(order_id)
+            return snap
+
+    def put(self, order_id: int, snap: Snapshot) -> None:
+        with self._lock:
+            old = self._data.get(order_id)
+            # 读路径拿到的旧行晚于写路径回填时，不能把新快照盖掉
+            if old is not None and old[1].version > snap.version:
+                return
+            self._data[order_id] = (time.monotonic() + self.ttl, snap)
+            self._data.move_to_end(order_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, order_ids: Iterable[int]) -> None:
+        with self._lock:
+            for oid in order_ids:
+                self._data.pop(oid, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# 比较版本后写入（原子）：已存的快照版本更新时不覆盖；值的格式见 RedisOrderCache
+PUT_IF_NEWER = """
+local cur = redis.call('GET', KEYS[1])
+if cur then
+  local v = tonumber(string.match(cur, '^(%S+) '))
+  if v and v > tonumber(ARGV[2]) then
+    return 0
+  end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+
+class FakeRedis:
+    """redis 客户端的最小内存替身：get / set(ex=) / delete / register_script（只认 PUT_IF_NEWER）"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            value, expires = hit
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for k in keys if self._data.pop(k, None) is not None)
+
+    def register_script(self, script: str):
+        if script != PUT_IF_NEWER:
+            raise RuntimeError("FakeRedis only supports PUT_IF_NEWER")
+
+        def put_if_newer(keys, args):
+            (key,), (value, version, ttl) = keys, args
+            with self._lock:
+                hit = self._data.get(key)
+                if hit is not None and (hit[1] is None or hit[1] >= time.monotonic()):
+                    if float(hit[0].partition(b" ")[0]) > float(version):
+                        return 0
+                self._data[key] = (value, time.monotonic() + int(ttl))
+            return 1
+        return put_if_newer
+
+
+class RedisOrderCache:
+    """
+    存成 b"<version> <etag>\\n<body>"，TTL 交给 redis
+    多 worker 共享，流转后的替换 / 失效对所有 worker 立即可见
+    写入走 PUT_IF_NEWER 脚本：与 LRU 一样，读路径拿到的旧行不会盖掉流转写入的新快照
+    """
+
+    local = False
+
+    def __init__(self, client, ttl: float, prefix: str = "order:"):
+        self.client = client
+        self.ttl = max(1, int(ttl))
+        self.prefix = prefix
+        self._put_if_newer = client.register_script(PUT_IF_NEWER)
+
+    def _key(self, order_id: int) -> str:
+        return f"{self.prefix}{order_id}"
+
+    def get(self, order_id: int) -> Optional[Snapshot]:
+        raw = self.client.get(self._key(order_id))
+        if raw is None:
+            return None
+        head, _, body = raw.partition(b"\n")
+        version, _, etag = head.decode().partition(" ")
+        return Snapshot(etag, body, float(version))
+
+    def put(self, order_id: int, snap: Snapshot) -> None:
+        raw = f"{snap.version} {snap.etag}\n".encode() + snap.body
+        self._put_if_newer(keys=[self._key(order_id)], args=[raw, str(snap.version), self.ttl])
+
+    def invalidate(self, order_ids: Iterable[int]) -> None:
+        keys = [self._key(oid) for oid in order_ids]
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self) -> None:
+        pass  # 共享缓存不因某个 worker 断线而清空
+
+
+def build_cache():
+    if ORDER_CACHE in ("off", "none", "0"):
+        return NullOrderCache()
+    if ORDER_CACHE == "lru":
+        return LRUOrderCache(ORDER_CACHE_MAX, ORDER_CACHE_TTL)
+    if ORDER_CACHE == "redis":
+        if ORDER_CACHE_REDIS_URL.startswith("fake://"):
+            return RedisOrderCache(FakeRedis(), ORDER_CACHE_TTL)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("ORDER_CACHE=redis requires the redis package") from e
+        return RedisOrderCache(redis.Redis.from_url(ORDER_CACHE_REDIS_URL), ORDER_CACHE_TTL)
+    raise RuntimeError(f"unknown ORDER_CACHE: {ORDER_CACHE}")
+
+
+cache = build_cache()
+
+
+def get(order_id: int) -> Optional[Snapshot]:
+    return cache.get(order_id)
+
+
+def fill(order) -> Snapshot:
+    """读路径 / 写路径都用：序列化一次并放入缓存"""
+    snap = make_snapshot(order)
+    cache.put(order.id, snap)
+    return snap
+
+
+def fill_many(orders: Iterable) -> None:
+    """批量流转后：逐条 put 新快照（版本比较对批量同样生效）"""
+    for order in orders:
+        fill(order)
+
+
+# ---------- async 版：进程内缓存直接调用（只拿一把线程锁），redis 放进线程池 ----------
+async def _call(fn, *args):
+    if cache.local:
+        return fn(*args)
+    return await run_in_threadpool(fn, *args)
+
+
+async def aget(order_id: int) -> Optional[Snapshot]:
+    return await _call(get, order_id)
+
+
+async def afill(order) -> Snapshot:
+    return await _call(fill, order)
+
+
+async def afill_many(orders: Iterable) -> None:
+    await _call(fill_many, list(orders))
+
+
+# ---------- 其他 worker 的变更（app.change_feed）：只需处理进程内的缓存 ----------
+def invalidate_local(order_ids: Iterable[int]) -> None:
+    if cache.local:
+        cache.invalidate(order_ids)
+
+
+def clear_local() -> None:
+    if cache.local:
+        cache.clear()
@@ -1,9 +1,9 @@
 # app/schemas.py
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List
 
 from pydantic import BaseModel, Field
 
@@ -20,6 +20,10 @@ class CreateOrderIn(BaseModel):
     boss_kook_id: str = Field(..., min_length=1)
     boss_kook_name: str = Field(..., min_length=1, max_length=100)
 
+# 批量创建：POST /api/orders/bulk 的请求体就是 CreateOrderIn 数组
+BULK_MAX = 200
+BulkCreateIn = Annotated[List[CreateOrderIn], Field(min_length=1, max_length=BULK_MAX)]
+
 class AcceptIn(BaseModel):
     # 机器人在 /accept 时必须传入
     player_kook_id: str = Field(..., min_length=1)
@@ -36,6 +40,32 @@ class CompleteIn(BaseModel):
     actor_kook_id: str
     payload: Optional[Dict[str, Any]] = None
 
+# 批量流转：在单条入参基础上加 order_ids
+BatchIds = Annotated[List[int], Field(min_length=1, max_length=BULK_MAX)]
+
+class ReviewBatchIn(ReviewIn):
+    order_ids: BatchIds
+
+class AcceptBatchIn(AcceptIn):
+    order_ids: BatchIds
+
+class CompleteBatchIn(CompleteIn):
+    order_ids: BatchIds
+
+# 派单：陪玩登记（整体替换可接游戏）/ 局部修改
+class PlayerIn(BaseModel):
+    kook_name: Optional[str] = Field(None, max_length=100)
+    games: List[Annotated[str, Field(min_length=1, max_length=100)]] = Field(..., min_length=1, max_length=50)
+    available: bool = True
+    max_load: int = Field(1, ge=1, le=20)
+
+class PlayerPatch(BaseModel):
+    available: Optional[bool] = None
+    max_load: Optional[int] = Field(None, ge=1, le=20)
+
+class PriorityIn(BaseModel):
+    priority: int = Field(..., ge=-100, le=100)
+
 # ---- 出参 ----
 
 class OrderOut(BaseModel):
@@ -60,3 +90,135 @@ class OrderOut(BaseModel):
         "from_attributes": True,  # v1 的 orm_mode=True
         "populate_by_name": True,
     }
+
+class OrderPage(BaseModel):
+    """订单列表：keyset 分页，next_cursor 为空表示没有下一页"""
+    items: List[OrderOut]
+    next_cursor: Optional[str] = None
+
+class BatchItemOut(BaseModel):
+    id: int
+    ok: bool
+    status: Optional[str] = None   # 成功为新状态；失败为当前状态（订单不存在则为空）
+    code: Optional[int] = None     # 失败时：404 / 409
+    error: Optional[str] = None
+
+class BatchOut(BaseModel):
+    results: List[BatchItemOut]
+
+class AuditOut(BaseModel):
+    id: int
+    from_status: Optional[str] = None
+    to_status: str
+    actor_user_id: Optional[int] = None
+    reason: Optional[str] = None
+    payload: Optional[Any] = None
+    created_at: datetime
+
+class ReportTotalOut(BaseModel):
+    orders: int
+    amount_cents: int
+    hours: Decimal
+
+class ReportDayOut(ReportTotalOut):
+    day: date
+
+class RevenueReportOut(BaseModel):
+    """按天营收（day 按 tz 切分；没有结单的天不出现）"""
+    date_from: date
+    date_to: date
+    tz: str
+    days: List[ReportDayOut]
+    total: ReportTotalOut
+
+class ReportPlayerOut(ReportTotalOut):
+    player_kook_id: str
+    player_kook_name: Optional[str] = None
+
+class PlayersReportOut(BaseModel):
+    """陪玩工作量，按时长倒序"""
+    date_from: date
+    date_to: date
+    tz: str
+    players: List[ReportPlayerOut]
+
+class PlayerOut(BaseModel):
+    kook_id: str
+    kook_name: Optional[str] = None
+    games: List[str]
+    available: bool
+    max_load: int
+    active_orders: int
+    completed_hours: Decimal
+    last_assigned_at: Optional[datetime] = None
+
+class RecentPeopleOut(BaseModel):
+    players: List[str]
+    bosses: List[str]
+
+class DispatchGameOut(BaseModel):
+    game_name: str
+    waiting: int
+    oldest: datetime
+    free_players: int
+
+class DispatchQueueOut(BaseModel):
+    """待派队列按游戏汇总"""
+    games: List[DispatchGameOut]
+
+class OrderHistoryOut(BaseModel):
+    """订单历史：审计记录按时间正序"""
+    order_id: int
+    items: List[AuditOut]
+
+
+# ---------- 小工具：统一构造输出（同步/异步路由共用）----------
+def to_order_out(order: Any) -> OrderOut:
+    # 有的 Enum 需要 .value，有的直接是 str
+    status_val = order.status.value if hasattr(order.status, "value") else str(order.status)
+    return OrderOut(
+        id=order.id,
+        game_name=order.game_name,
+        amount_cents=order.amount_cents,
+        duration_hours=order.duration_hours,
+        status=status_val,
+        extra=order.extra,
+        # 新增：直接从 orders 表返回 KOOK 身份
+        boss_kook_id=getattr(order, "boss_kook_id", None),
+        boss_kook_name=getattr(order, "boss_kook_name", None),
+        player_kook_id=getattr(order, "player_kook_id", None),
+        player_kook_name=getattr(order, "player_kook_name", None),
+        created_at=getattr(order, "created_at", None),
+        updated_at=getattr(order, "updated_at", None),
+    )
+
+
+def order_dict(order: Any) -> Dict[str, Any]:
+    """与 to_order_out 同样的字段 / 顺序，但只产出纯 dict（交给 app.fastjson 一次序列化，不经 pydantic）"""
+    status = order.status
+    return {
+        "id": order.id,
+        "game_name": order.game_name,
+        "amount_cents": order.amount_cents,
+        "duration_hours": order.duration_hours,
+        "status": status.value if hasattr(status, "value") else str(status),
+        "boss_kook_id": getattr(order, "boss_kook_id", None),
+        "boss_kook_name": getattr(order, "boss_kook_name", None),
+        "player_kook_id": getattr(order, "player_kook_id", None),
+        "player_kook_name": getattr(order, "player_kook_name", None),
+        "created_at": getattr(order, "created_at", None),
+        "updated_at": getattr(order, "updated_at", None),
+        "extra": order.extra if order.extra is not None else {},
+    }
+
+
+def audit_dict(a: Any) -> Dict[str, Any]:
+    return {
+        "id": a.id,
+        "from_status": getattr(a.from_status, "value", a.from_status),
+        "to_status": getattr(a.to_status, "value", a.to_status),
+        "actor_user_id": a.actor_user_id,
+        "reason": a.reason,
+        "payload": a.payload,
+        "created_at": a.created_at,
+    }
@@ -0,0 +1,99 @@
+# app/services/archive.py
+"""
+冷热分离：终态订单（COMPLETED / REVIEW_REJECTED / CANCELLED）创建与最后一次变更都早于 ARCHIVE_AFTER_DAYS 天后，
+连同审计、回执整批搬进 orders_archive / order_audits_archive / receipts_archive
+- 每批一条语句：选一批订单（FOR UPDATE SKIP LOCKED，不挡正在流转的行）-> 三张表各自 DELETE ... RETURNING 整行
+  -> INSERT 进对应归档表；同一事务，要么整批搬完要么不搬
+- 选批走 ix_orders_status_created_id，不为归档在热表上另加索引
+- 归档进程见 app/workers/archive.py；live 表删掉的行由 autovacuum 回收，活跃数据量稳定，堆和索引能常驻内存
+- 读路径：GET /api/orders/{id} 与订单历史在 live 表找不到时回落到归档表；结算导出与报表全量重算
+  经 with_archived() 把归档表 UNION ALL 进来。列表接口与流转只看 live 表（终态订单不会再流转）
+"""
+import os
+from datetime import timedelta
+from typing import List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import delete, func, insert, select, union_all
+from sqlalchemy.orm import Session
+
+from app.metrics import ARCHIVE_READS
+from app.models import (
+    Order, OrderArchive, OrderAudit, OrderAuditArchive, OrderStatus, Receipt, ReceiptArchive,
+)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "1000"))
+
+TERMINAL_STATUSES = (OrderStatus.COMPLETED, OrderStatus.REVIEW_REJECTED, OrderStatus.CANCELLED)
+
+# 每批搬的三张表：(live, 归档, 与订单关联的列, CTE 名前缀)
+ARCHIVED_TABLES = (
+    (Order.__table__, OrderArchive.__table__, Order.__table__.c.id, "ord"),
+    (OrderAudit.__table__, OrderAuditArchive.__table__, OrderAudit.__table__.c.order_id, "aud"),
+    (Receipt.__table__, ReceiptArchive.__table__, Receipt.__table__.c.order_id, "rct"),
+)
+
+
+# ---------- 搬迁 ----------
+def _move_cte(live: sa.Table, cold: sa.Table, where, name: str):
+    """DELETE live ... RETURNING 整行 -> INSERT 进归档表（按列名对应，不依赖物理列序）"""
+    cols = [c.name for c in live.columns]
+    out = delete(live).where(where).returning(*live.columns).cte(f"{name}_out")
+    return (
+        insert(cold)
+        .from_select(cols, select(*(out.c[n] for n in cols)))
+        .returning(cold.c.id)
+        .cte(f"{name}_in")
+    )
+
+
+def archive_batch_stmt(older_than_days: int = ARCHIVE_AFTER_DAYS, batch: int = ARCHIVE_BATCH):
+    """一批归档；返回一行 (orders, audits, receipts) 各搬了多少行"""
+    cutoff = func.now() - timedelta(days=older_than_days)
+    victims = (
+        select(Order.id)
+        .where(Order.status.in_(TERMINAL_STATUSES), Order.created_at < cutoff, Order.updated_at < cutoff)
+        .limit(batch)
+        .with_for_update(skip_locked=True)
+        .cte("victims")
+    )
+    ids = select(victims.c.id)
+    moved = [_move_cte(live, cold, key.in_(ids), name) for live, cold, key, name in ARCHIVED_TABLES]
+    return select(
+        *(select(func.count()).select_from(m).scalar_subquery().label(label)
+          for m, label in zip(moved, ("orders", "audits", "receipts")))
+    )
+
+
+# ---------- 读路径 ----------
+def with_archived(live: sa.Table, cold: sa.Table, columns):
+    """live 与归档表按列 UNION ALL 成一个子查询；条件写在子查询外面，Postgres 会下推到两边"""
+    return union_all(*(select(*(t.c[col.key] for col in columns)) for t in (live, cold))).subquery()
+
+
+def archived_order_stmt(order_id: int):
+    return select(OrderArchive).where(OrderArchive.id == order_id)
+
+
+def archived_history_stmt(order_id: int, limit: int):
+    return (
+        select(OrderAuditArchive)
+        .where(OrderAuditArchive.order_id == order_id)
+        .order_by(OrderAuditArchive.created_at, OrderAuditArchive.id)
+        .limit(limit)
+    )
+
+
+def find_order(db: Session, order_id: int) -> Optional[OrderArchive]:
+    order = db.execute(archived_order_stmt(order_id)).scalar_one_or_none()
+    if order is not None:
+        ARCHIVE_READS.labels("order").inc()
+    return order
+
+
+def find_history(db: Session, order_id: int, limit: int) -> List[OrderAuditArchive]:
+    rows = list(db.execute(archived_history_stmt(order_id, limit)).scalars().all())
+    if rows:
+        ARCHIVE_READS.labels("history").inc()
+    return rows
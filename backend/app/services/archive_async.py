@@ -0,0 +1,23 @@
+# app/services/archive_async.py
+"""app.services.archive 的 AsyncSession 版本（DB_ASYNC=1 时使用），语句与同步版共用"""
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.metrics import ARCHIVE_READS
+from app.models import OrderArchive, OrderAuditArchive
+from app.services.archive import archived_history_stmt, archived_order_stmt
+
+
+async def find_order(db: AsyncSession, order_id: int) -> Optional[OrderArchive]:
+    order = (await db.execute(archived_order_stmt(order_id))).scalar_one_or_none()
+    if order is not None:
+        ARCHIVE_READS.labels("order").inc()
+    return order
+
+
+async def find_history(db: AsyncSession, order_id: int, limit: int) -> List[OrderAuditArchive]:
+    rows = list((await db.execute(archived_history_stmt(order_id, limit))).scalars().all())
+    if rows:
+        ARCHIVE_READS.labels("history").inc()
+    return rows
@@ -0,0 +1,331 @@
+# app/services/dispatch.py
+"""
+自动派单
+- 陪玩登记可接的游戏、在线状态与同时接单上限（players / player_games）
+- 审核通过的订单在同一条语句里进入 dispatch_queue（每个游戏一条队列）；
+  手动 /accept 或自动派单接单时在同一语句里出队
+- 负载：接单 +1、结单 -1 并累加时长，均为流转语句里的附加 CTE，与状态变化同一事务
+- 派单进程（app/workers/dispatch.py）每轮：
+    1) 列出有空闲陪玩的游戏（ix_player_games_pick 只含空闲行），按各自队首的优先级 / 入队时间排序
+    2) 逐个游戏领队首：ix_dispatch_queue_next 该游戏段的最左端，FOR UPDATE OF 队列行 + 订单行 SKIP LOCKED
+    3) 挑陪玩：ix_player_games_pick 该游戏段的最左端 = 负载最低、累计时长最少、最久没派过的空闲陪玩；
+       锁 players 行时 SKIP LOCKED，多个派单进程不会把同一名额派两次
+    4) 复用 accept_stmt 接单（出队、负载 +1 都在这一条语句里）
+  领队首、挑陪玩都是索引最左端查找，O(log n)；没有空闲陪玩的游戏整条队列原样等待，不产生任何写
+"""
+import os
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import Text, delete, func, literal, select, true, update
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models import DispatchQueue, Order, OrderStatus, Player, PlayerGame
+
+DISPATCH_PICK_CANDIDATES = int(os.getenv("DISPATCH_PICK_CANDIDATES", "8"))
+# /api/players/recent 最多倒序扫多少单
+RECENT_SCAN_ROWS = int(os.getenv("RECENT_SCAN_ROWS", "5000"))
+
+Q = DispatchQueue
+
+
+# ---------- 流转语句的附加 CTE（见 app/services/orders.py）----------
+def _per_player(upd):
+    """本次流转涉及的陪玩：批量接单 / 结单同一陪玩可能有多行，先聚合再更新 players"""
+    return (
+        select(
+            upd.c.player_kook_id.label("kook_id"),
+            func.count().label("n"),
+            func.sum(upd.c.duration_hours).label("hours"),
+        )
+        .where(upd.c.player_kook_id.is_not(None))
+        .group_by(upd.c.player_kook_id)
+        .subquery()
+    )
+
+
+def enqueue_cte(upd):
+    """审核通过：进入待派队列"""
+    return pg_insert(Q).from_select(
+        ["order_id", "game_name"],
+        select(upd.c.id, upd.c.game_name).where(upd.c.status == OrderStatus.REVIEW_APPROVED),
+    ).on_conflict_do_nothing().cte("dq_in")
+
+
+def dequeue_cte(upd):
+    """接单（手动或自动）：出队"""
+    return delete(Q).where(Q.order_id.in_(select(upd.c.id))).cte("dq_out")
+
+
+def player_assign_cte(upd):
+    """接单：陪玩负载 +n（未登记的陪玩不受影响）"""
+    s = _per_player(upd)
+    return (
+        update(Player)
+        .where(Player.kook_id == s.c.kook_id)
+        .values(active_orders=Player.active_orders + s.c.n, last_assigned_at=func.now())
+        .cte("pl_assign")
+    )
+
+
+def player_release_cte(upd):
+    """结单：陪玩负载 -n，累计时长 + 本次时长（公平性排序用）"""
+    s = _per_player(upd)
+    return (
+        update(Player)
+        .where(Player.kook_id == s.c.kook_id)
+        .values(
+            active_orders=func.greatest(Player.active_orders - s.c.n, 0),
+            completed_hours=Player.completed_hours + s.c.hours,
+        )
+        .cte("pl_release")
+    )
+
+
+# ---------- 派单进程用的语句 ----------
+def free_games_stmt():
+    """有空闲陪玩且有待派订单的游戏，按各自队首（优先级高、入队早）排序"""
+    g = PlayerGame
+    free = select(g.game_name).where(g.available, g.active_orders < g.max_load).distinct().subquery()
+    head = (
+        select(Q.priority, Q.enqueued_at)
+        .where(Q.game_name == free.c.game_name)
+        .order_by(Q.priority.desc(), Q.enqueued_at)
+        .limit(1)
+        .lateral()
+    )
+    return (
+        select(free.c.game_name)
+        .join(head, true())
+        .order_by(head.c.priority.desc(), head.c.enqueued_at)
+    )
+
+
+def claim_stmt(game_name: str):
+    """该游戏的队首一单；订单行一起锁住，与手动 /accept 互斥（对方等我们提交后按状态不符返回 409）"""
+    return (
+        select(Q.order_id, Q.enqueued_at)
+        .join(Order, Order.id == Q.order_id)
+        .where(Q.game_name == game_name, Order.status == OrderStatus.REVIEW_APPROVED)
+        .order_by(Q.priority.desc(), Q.enqueued_at, Q.order_id)
+        .limit(1)
+        .with_for_update(of=[Q, Order], skip_locked=True)
+    )
+
+
+def _fairness(t):
+    return (t.active_orders, t.completed_hours, t.last_assigned_at.asc().nulls_first())
+
+
+def pick_player_stmt(game_name: str, k: int = DISPATCH_PICK_CANDIDATES):
+    """
+    先从 ix_player_games_pick 取该游戏排在最前的 k 个候选（O(log n + k)），
+    再按 players（权威数据）复核空闲并加锁；被别的派单进程锁住的候选直接跳过
+    """
+    g = PlayerGame
+    cand = (
+        select(g.player_kook_id)
+        .where(g.game_name == game_name, g.available, g.active_orders < g.max_load)
+        .order_by(*_fairness(g))
+        .limit(k)
+    )
+    return (
+        select(Player.kook_id, Player.kook_name)
+        .where(Player.kook_id.in_(cand), Player.available, Player.active_orders < Player.max_load)
+        .order_by(*_fairness(Player), Player.kook_id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+
+
+def purge_stmt():
+    """订单已不在 REVIEW_APPROVED（如被删除 / 旁路改状态）的残留队列行"""
+    stale = select(Order.id).where(Order.id == Q.order_id, Order.status == OrderStatus.REVIEW_APPROVED)
+    return delete(Q).where(~stale.exists())
+
+
+# ---------- 陪玩登记 / 队列管理（API 用，同步 / 异步共用语句）----------
+def clean_games(games: Sequence[str]) -> List[str]:
+    out = list(dict.fromkeys(g.strip() for g in games if g and g.strip()))
+    if not out:
+        raise HTTPException(status_code=422, detail="games must not be empty")
+    return out
+
+
+def _player_orders(kook_id: str, status: OrderStatus):
+    return select(Order.duration_hours).where(Order.player_kook_id == kook_id, Order.status == status).subquery()
+
+
+def upsert_player_stmt(kook_id: str, kook_name: Optional[str], available: bool, max_load: int):
+    """首次登记时负载与累计时长从已有订单算起；再次登记只改资料，不动负载"""
+    active = _player_orders(kook_id, OrderStatus.IN_PROGRESS)
+    done = _player_orders(kook_id, OrderStatus.COMPLETED)
+    ins = pg_insert(Player).values(
+        kook_id=kook_id, kook_name=kook_name, available=available, max_load=max_load,
+        active_orders=select(func.count()).select_from(active).scalar_subquery(),
+        completed_hours=select(func.coalesce(func.sum(done.c.duration_hours), 0)).scalar_subquery(),
+    )
+    return ins.on_conflict_do_update(
+        index_elements=[Player.kook_id],
+        set_={
+            "kook_name": func.coalesce(ins.excluded.kook_name, Player.kook_name),
+            "available": ins.excluded.available,
+            "max_load": ins.excluded.max_load,
+            "updated_at": func.now(),
+        },
+    )
+
+
+def set_games_stmts(kook_id: str, games: List[str]):
+    """整体替换可接游戏；新行的负载副本从 players 复制，此后由触发器同步"""
+    drop = delete(PlayerGame).where(PlayerGame.player_kook_id == kook_id, PlayerGame.game_name.not_in(games))
+    add = pg_insert(PlayerGame).from_select(
+        ["player_kook_id", "game_name", "available", "max_load", "active_orders", "completed_hours", "last_assigned_at"],
+        select(
+            Player.kook_id, func.unnest(literal(games, ARRAY(Text))),
+            Player.available, Player.max_load, Player.active_orders, Player.completed_hours, Player.last_assigned_at,
+        ).where(Player.kook_id == kook_id),
+    ).on_conflict_do_nothing()
+    return [drop, add]
+
+
+def update_player_stmt(kook_id: str, changes: Dict[str, Any]):
+    return (
+        update(Player)
+        .where(Player.kook_id == kook_id)
+        .values(**changes, updated_at=func.now())
+        .returning(Player.kook_id)
+    )
+
+
+def players_stmt(kook_id: Optional[str] = None, game_name: Optional[str] = None):
+    games = (
+        select(func.array_agg(aggregate_order_by(PlayerGame.game_name, PlayerGame.game_name)))
+        .where(PlayerGame.player_kook_id == Player.kook_id)
+        .scalar_subquery()
+    )
+    q = select(Player, games.label("games"))
+    if kook_id is not None:
+        q = q.where(Player.kook_id == kook_id)
+    if game_name:
+        q = q.where(Player.kook_id.in_(select(PlayerGame.player_kook_id).where(PlayerGame.game_name == game_name)))
+    return q.order_by(Player.available.desc(), *_fairness(Player), Player.kook_id)
+
+
+def queue_summary_stmt():
+    g = PlayerGame
+    free = (
+        select(func.count())
+        .where(g.game_name == Q.game_name, g.available, g.active_orders < g.max_load)
+        .scalar_subquery()
+    )
+    return (
+        select(Q.game_name, func.count().label("waiting"), func.min(Q.enqueued_at).label("oldest"), free.label("free_players"))
+        .group_by(Q.game_name)
+        .order_by(func.count().desc(), Q.game_name)
+    )
+
+
+def set_priority_stmt(order_id: int, priority: int):
+    return update(Q).where(Q.order_id == order_id).values(priority=priority).returning(Q.order_id)
+
+
+def recent_people_stmts(days: int, limit: int, scan: int = RECENT_SCAN_ROWS):
+    """
+    最近活跃的陪玩 / 老板（机器人启动时预取 KOOK 标签用）：
+    ix_orders_created_id 倒序只扫最近 scan 单，各取最近出现过的 limit 个 ID；在线的已登记陪玩排在最前
+    """
+    recent = (
+        select(Order.boss_kook_id, Order.player_kook_id, Order.created_at)
+        .where(Order.created_at >= func.now() - timedelta(days=days))
+        .order_by(Order.created_at.desc())
+        .limit(scan)
+        .subquery()
+    )
+
+    def latest(col):
+        return (
+            select(col)
+            .where(col.is_not(None))
+            .group_by(col)
+            .order_by(func.max(recent.c.created_at).desc())
+            .limit(limit)
+        )
+
+    registered = (
+        select(Player.kook_id)
+        .where(Player.available)
+        .order_by(Player.last_assigned_at.desc().nulls_last())
+        .limit(limit)
+    )
+    return registered, latest(recent.c.player_kook_id), latest(recent.c.boss_kook_id)
+
+
+def recent_out(registered, players, bosses, limit: int) -> Dict[str, Any]:
+    return {"players": list(dict.fromkeys([*registered, *players]))[:limit], "bosses": list(bosses)}
+
+
+def player_out(row) -> Dict[str, Any]:
+    p, games = row
+    return {
+        "kook_id": p.kook_id,
+        "kook_name": p.kook_name,
+        "games": list(games or []),
+        "available": p.available,
+        "max_load": p.max_load,
+        "active_orders": p.active_orders,
+        "completed_hours": p.completed_hours,
+        "last_assigned_at": p.last_assigned_at,
+    }
+
+
+def queue_out(rows) -> Dict[str, Any]:
+    return {"games": [dict(r._mapping) for r in rows]}
+
+
+# ---------- 执行（同步）----------
+def get_player(db: Session, kook_id: str) -> Dict[str, Any]:
+    row = db.execute(players_stmt(kook_id)).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="player not registered")
+    return player_out(row)
+
+
+def register_player(db: Session, kook_id: str, kook_name: Optional[str], games: Sequence[str],
+                    available: bool = True, max_load: int = 1) -> Dict[str, Any]:
+    games = clean_games(games)
+    db.execute(upsert_player_stmt(kook_id, kook_name, available, max_load))
+    for stmt in set_games_stmts(kook_id, games):
+        db.execute(stmt)
+    db.commit()
+    return get_player(db, kook_id)
+
+
+def update_player(db: Session, kook_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    if changes and db.execute(update_player_stmt(kook_id, changes)).first() is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="player not registered")
+    db.commit()
+    return get_player(db, kook_id)
+
+
+def list_players(db: Session, game_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    return [player_out(r) for r in db.execute(players_stmt(game_name=game_name)).all()]
+
+
+def queue_summary(db: Session) -> Dict[str, Any]:
+    return queue_out(db.execute(queue_summary_stmt()).all())
+
+
+def recent_people(db: Session, days: int, limit: int) -> Dict[str, Any]:
+    registered, players, bosses = (db.execute(q).scalars().all() for q in recent_people_stmts(days, limit))
+    return recent_out(registered, players, bosses, limit)
+
+
+def set_priority(db: Session, order_id: int, priority: int) -> None:
+    if db.execute(set_priority_stmt(order_id, priority)).first() is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="order not in dispatch queue")
+    db.commit()
@@ -0,0 +1,57 @@
+# app/services/dispatch_async.py
+"""app.services.dispatch 的 AsyncSession 版本（DB_ASYNC=1 时使用），语句与同步版共用"""
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.dispatch import (
+    clean_games, upsert_player_stmt, set_games_stmts, update_player_stmt,
+    players_stmt, queue_summary_stmt, set_priority_stmt, player_out, queue_out,
+    recent_people_stmts, recent_out,
+)
+
+
+async def get_player(db: AsyncSession, kook_id: str) -> Dict[str, Any]:
+    row = (await db.execute(players_stmt(kook_id))).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="player not registered")
+    return player_out(row)
+
+
+async def register_player(db: AsyncSession, kook_id: str, kook_name: Optional[str], games: Sequence[str],
+                          available: bool = True, max_load: int = 1) -> Dict[str, Any]:
+    games = clean_games(games)
+    await db.execute(upsert_player_stmt(kook_id, kook_name, available, max_load))
+    for stmt in set_games_stmts(kook_id, games):
+        await db.execute(stmt)
+    await db.commit()
+    return await get_player(db, kook_id)
+
+
+async def update_player(db: AsyncSession, kook_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+    if changes and (await db.execute(update_player_stmt(kook_id, changes))).first() is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="player not registered")
+    await db.commit()
+    return await get_player(db, kook_id)
+
+
+async def list_players(db: AsyncSession, game_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    return [player_out(r) for r in (await db.execute(players_stmt(game_name=game_name))).all()]
+
+
+async def queue_summary(db: AsyncSession) -> Dict[str, Any]:
+    return queue_out((await db.execute(queue_summary_stmt())).all())
+
+
+async def recent_people(db: AsyncSession, days: int, limit: int) -> Dict[str, Any]:
+    registered, players, bosses = [(await db.execute(q)).scalars().all() for q in recent_people_stmts(days, limit)]
+    return recent_out(registered, players, bosses, limit)
+
+
+async def set_priority(db: AsyncSession, order_id: int, priority: int) -> None:
+    if (await db.execute(set_priority_stmt(order_id, priority))).first() is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="order not in dispatch queue")
+    await db.commit()
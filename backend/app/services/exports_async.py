@@ -0,0 +1,17 @@
+# app/services/exports_async.py
+"""app.services.exports 的 async 版本（DB_ASYNC=1 时使用）：语句、编码与同步版共用，取数走 asyncpg 游标"""
+from typing import AsyncIterator
+
+from app.db import async_engine
+from app.metrics import EXPORT_ROWS
+from app.services.exports import EXPORT_CHUNK_ROWS
+
+
+async def stream(stmt, encoder, name: str) -> AsyncIterator[bytes]:
+    async with async_engine.connect() as conn:
+        result = await conn.stream(stmt, execution_options={"yield_per": EXPORT_CHUNK_ROWS})
+        yield encoder.begin()
+        async for rows in result.partitions():
+            yield encoder.encode(rows)
+            EXPORT_ROWS.labels(name).inc(len(rows))
+        yield encoder.finish()
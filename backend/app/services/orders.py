@@ -1,22 +1,334 @@
 # app/services/orders.py
-from typing import Optional, Dict, Any
-from sqlalchemy.orm import Session
-from fastapi import HTTPException, status
+"""
+订单状态流转（同步版）
+每次流转是一条语句：
+    WITH upd AS (UPDATE orders SET status=:to ... WHERE id=:id AND status=:expected RETURNING *),
+         aud AS (INSERT INTO order_audits ... SELECT ... FROM upd RETURNING id, order_id),
+         obx AS (INSERT INTO outbox ... SELECT ... FROM upd JOIN aud)
+    SELECT upd.*, aud.id FROM upd JOIN aud
+发件箱与流转同一事务提交，副作用（通知、对账导出）由 app/workers/outbox.py 异步投递
+状态不符时 UPDATE 命中 0 行 -> 409，并发的重复接单在行锁释放后也只会命中 0 行
+"""
+import base64
+import os
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple, Sequence, Union
+from sqlalchemy import select, update, insert, literal, literal_column, null, func, tuple_, cast, Text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session, aliased
+from fastapi import HTTPException
 
 from app.models import (
     Order, OrderAudit, OrderStatus,
-    Receipt, ReceiptType,
+    Receipt, ReceiptType, User, Outbox,
 )
-from app.services.users import get_or_create_user_by_kook
+from app.services.users import get_or_create_user_id_by_kook
+from app.services.reports import report_rollup_cte
+from app.services.dispatch import enqueue_cte, dequeue_cte, player_assign_cte, player_release_cte
+from app.services import archive
+from app.metrics import record_transition
+from app import order_cache, events
 
 
-def _ensure_order(db: Session, order_id: int) -> Order:
-    order = db.query(Order).filter(Order.id == order_id).one_or_none()
-    if not order:
-        raise HTTPException(status_code=404, detail="order not found")
+# ---------- 语句构造（同步/异步共用）----------
+def _typed(value, column):
+    """按列类型绑定字面量；None -> SQL NULL"""
+    return null() if value is None else literal(value, column.type)
+
+
+def _id_clause(order_id):
+    if isinstance(order_id, (list, tuple)):
+        return Order.id.in_(order_id)
+    return Order.id == order_id
+
+
+def transition_stmt(
+    order_id: Union[int, Sequence[int]],
+    expected: OrderStatus,
+    to_status: OrderStatus,
+    *,
+    actor_user_id: Optional[int] = None,
+    reason: Optional[str] = None,
+    payload: Optional[Dict[str, Any]] = None,
+    values: Optional[Dict[str, Any]] = None,
+    receipt_type: Optional[ReceiptType] = None,
+    receipt_payload=None,
+    extra_ctes: Sequence[Any] = (),
+):
+    """
+    构造「条件 UPDATE + 审计 INSERT（+ 回执 INSERT）+ 发件箱 INSERT」单语句，返回 ORM 可执行的 select(Order, audit_id)
+    - order_id：单个 ID，或 ID 列表（批量流转，同一条语句按集合更新）
+    - values：除 status 外顺带更新的列（如 player_kook_id）
+    - receipt_payload：dict 或一个以 upd 为参数、返回 SQL 表达式的函数
+    - extra_ctes：以 upd 为参数、返回附加写 CTE 的函数（如报表汇总）
+    """
+    upd = (
+        update(Order)
+        .where(_id_clause(order_id), Order.status == expected)
+        .values(status=to_status, **(values or {}))
+        .returning(*Order.__table__.c)
+        .cte("upd")
+    )
+    a = OrderAudit.__table__.c
+    aud = insert(OrderAudit).from_select(
+        ["order_id", "actor_user_id", "from_status", "to_status", "reason", "payload"],
+        select(
+            upd.c.id,
+            _typed(actor_user_id, a.actor_user_id),
+            _typed(expected, a.from_status),
+            _typed(to_status, a.to_status),
+            _typed(reason, a.reason),
+            _typed(payload, a.payload),
+        ),
+    ).returning(OrderAudit.id, OrderAudit.order_id).cte("aud")
+
+    # 每行 (Order, audit_id)：审计行 ID 同时作为事件 ID（见 app.events）
+    o = aliased(Order, upd)
+    stmt = select(o, aud.c.id.label("audit_id")).join(aud, aud.c.order_id == o.id)
+
+    rct = None
+    if receipt_type is not None:
+        r = Receipt.__table__.c
+        rp = receipt_payload(upd) if callable(receipt_payload) else _typed(receipt_payload, r.payload)
+        rct = insert(Receipt).from_select(
+            ["order_id", "type", "payload"],
+            select(upd.c.id, _typed(receipt_type, r.type), rp),
+        ).returning(Receipt.order_id, Receipt.payload).cte("rct")
+        stmt = stmt.add_cte(rct)
+
+    stmt = stmt.add_cte(outbox_cte(upd, aud, expected, rct))
+    for make_cte in extra_ctes:
+        stmt = stmt.add_cte(make_cte(upd))
+    return stmt.execution_options(populate_existing=True)
+
+
+_OUTBOX_ORDER_FIELDS = (
+    "game_name", "amount_cents", "duration_hours",
+    "boss_kook_id", "boss_kook_name", "player_kook_id", "player_kook_name",
+)
+
+
+def outbox_cte(src, aud, from_status: Optional[OrderStatus], rct=None):
+    """
+    发件箱 INSERT ... SELECT：每条审计一行，topic = order.<新状态小写>
+    payload 带审计 ID、前后状态、订单字段；结单时附带回执
+    键和字面量都显式写成 SQL 常量 / 带类型转换，asyncpg 预编译时才推得出参数类型
+    """
+    from_value = getattr(from_status, "value", from_status)
+    pairs = {
+        "audit_id": aud.c.id,
+        "order_id": src.c.id,
+        "from_status": cast(literal(from_value) if from_value else null(), Text),
+        "to_status": src.c.status,
+        **{f: src.c[f] for f in _OUTBOX_ORDER_FIELDS},
+        "at": src.c.updated_at,
+    }
+    frm = src.join(aud, aud.c.order_id == src.c.id)
+    if rct is not None:
+        pairs["receipt"] = rct.c.payload
+        frm = frm.outerjoin(rct, rct.c.order_id == src.c.id)
+    args = []
+    for k, v in pairs.items():
+        args += [literal_column(f"'{k}'"), v]
+    topic = func.concat(literal_column("'order.'"), func.lower(cast(src.c.status, Text)))
+    return insert(Outbox).from_select(
+        ["topic", "order_id", "payload"],
+        select(topic, src.c.id, func.jsonb_build_object(*args, type_=JSONB)).select_from(frm),
+    ).cte("obx")
+
+
+def current_status_stmt(order_id: int):
+    return select(Order.status).where(Order.id == order_id)
+
+
+def transition_error(current: Optional[OrderStatus], expect: str) -> HTTPException:
+    """UPDATE 命中 0 行时：订单不存在 -> 404；状态不符 -> 409"""
+    if current is None:
+        return HTTPException(status_code=404, detail="order not found")
+    return HTTPException(
+        status_code=409,
+        detail=f"invalid state: {current}. expect {expect}"
+    )
+
+
+def completion_receipt(actor_user_id: int, actor_kook_id: str, payload: Optional[Dict[str, Any]]):
+    """完成回执：调用方给了 payload 就用，否则由数据库按订单行拼默认回执"""
+    if payload:
+        return payload
+    actor_name = func.coalesce(
+        select(User.display_name).where(User.id == actor_user_id).scalar_subquery(),
+        literal(actor_kook_id),
+    )
+    return lambda upd: func.json_build_object(
+        "completed_by", actor_name,
+        "amount_cents", upd.c.amount_cents,
+        "duration_hours", upd.c.duration_hours,
+    )
+
+
+# ---------- 创建（单条 / 批量共用一条语句）----------
+def create_orders_stmt(items) -> Any:
+    """
+    多行 INSERT ... RETURNING + 审计 INSERT ... SELECT（+ 发件箱），一条语句写完订单和 PENDING_REVIEW 审计
+    返回 select(Order, audit_id)
+    items：带 game_name/amount_cents/duration_hours/boss_kook_id/boss_kook_name 属性的对象（如 CreateOrderIn）
+    """
+    rows = [
+        {
+            "game_name": it.game_name.strip(),
+            "amount_cents": it.amount_cents,
+            "duration_hours": it.duration_hours,
+            "status": OrderStatus.PENDING_REVIEW,
+            # 直接记录 KOOK 身份（不再依赖内部用户ID）；玩家信息接单时写入
+            "boss_kook_id": it.boss_kook_id,
+            "boss_kook_name": it.boss_kook_name,
+        }
+        for it in items
+    ]
+    ins = insert(Order).values(rows).returning(*Order.__table__.c).cte("ins")
+    a = OrderAudit.__table__.c
+    aud = insert(OrderAudit).from_select(
+        ["order_id", "to_status", "reason"],
+        select(ins.c.id, _typed(OrderStatus.PENDING_REVIEW, a.to_status), literal("create")),
+    ).returning(OrderAudit.id, OrderAudit.order_id).cte("aud")
+    o = aliased(Order, ins)
+    return (
+        select(o, aud.c.id.label("audit_id"))
+        .join(aud, aud.c.order_id == o.id)
+        .add_cte(outbox_cte(ins, aud, None))
+        .order_by(o.id)
+    )
+
+
+def create_orders(db: Session, items) -> List[Order]:
+    rows = db.execute(create_orders_stmt(items)).all()
+    for o, _ in rows:
+        db.expunge(o)
+    db.commit()
+    record_transition(None, OrderStatus.PENDING_REVIEW, len(rows))
+    events.publish_rows(None, rows)
+    return [o for o, _ in rows]
+
+
+# ---------- 各流转的语句（单条 / 批量、同步 / 异步共用）----------
+EXPECT_REVIEW = "PENDING_REVIEW"
+EXPECT_ACCEPT = "REVIEW_APPROVED"
+EXPECT_COMPLETE = "IN_PROGRESS"
+
+
+def review_stmt(order_id, reviewer_user_id: int, approve: bool, reason: Optional[str] = None):
+    """审核通过/驳回：PENDING_REVIEW -> REVIEW_APPROVED（同时进入派单队列）/ REVIEW_REJECTED"""
+    to_status = OrderStatus.REVIEW_APPROVED if approve else OrderStatus.REVIEW_REJECTED
+    return transition_stmt(
+        order_id, OrderStatus.PENDING_REVIEW, to_status,
+        actor_user_id=reviewer_user_id,
+        reason=reason or ("approved" if approve else "rejected"),
+        extra_ctes=[enqueue_cte] if approve else (),
+    )
+
+
+def accept_stmt(
+    order_id,
+    player_kook_id: str,
+    player_kook_name: Optional[str] = None,
+    payload: Optional[Dict[str, Any]] = None,
+):
+    """陪玩接单：REVIEW_APPROVED -> IN_PROGRESS，直接写入 player_kook_id / player_kook_name；出派单队列、陪玩负载 +1"""
+    values = {"player_kook_id": player_kook_id}
+    if player_kook_name:
+        values["player_kook_name"] = player_kook_name
+    return transition_stmt(
+        order_id, OrderStatus.REVIEW_APPROVED, OrderStatus.IN_PROGRESS,
+        reason="accept",
+        payload=payload,
+        values=values,
+        extra_ctes=[dequeue_cte, player_assign_cte],
+    )
+
+
+def complete_stmt(order_id, actor_user_id: int, actor_kook_id: str, payload: Optional[Dict[str, Any]] = None):
+    """结单：IN_PROGRESS -> COMPLETED，同时生成完成回执、累加日报表、释放陪玩负载"""
+    return transition_stmt(
+        order_id, OrderStatus.IN_PROGRESS, OrderStatus.COMPLETED,
+        actor_user_id=actor_user_id,
+        reason="completed",
+        receipt_type=ReceiptType.COMPLETION,
+        receipt_payload=completion_receipt(actor_user_id, actor_kook_id, payload),
+        extra_ctes=[report_rollup_cte, player_release_cte],
+    )
+
+
+# ---------- 批量结果 ----------
+def dedupe_ids(order_ids: Sequence[int]) -> List[int]:
+    return list(dict.fromkeys(order_ids))
+
+
+def batch_outcomes(
+    order_ids: List[int],
+    done: Dict[int, Order],
+    current: Dict[int, OrderStatus],
+    expect: str,
+) -> List[Dict[str, Any]]:
+    """逐个 ID 给出结果：成功带新状态；失败带 404/409 及原因"""
+    out = []
+    for oid in order_ids:
+        order = done.get(oid)
+        if order is not None:
+            out.append({"id": oid, "ok": True, "status": order.status.value})
+            continue
+        err = transition_error(current.get(oid), expect)
+        cur = current.get(oid)
+        out.append({
+            "id": oid, "ok": False,
+            "status": cur.value if cur is not None else None,
+            "code": err.status_code, "error": err.detail,
+        })
+    return out
+
+
+def record_batch(expect: str, done: Dict[int, Order]) -> None:
+    """批量流转计数：审核批量可能同时有通过/驳回，按新状态分组"""
+    by_status: Dict[Any, int] = {}
+    for o in done.values():
+        by_status[o.status] = by_status.get(o.status, 0) + 1
+    for to_status, n in by_status.items():
+        record_transition(expect, to_status, n)
+
+
+def current_statuses_stmt(order_ids: Sequence[int]):
+    return select(Order.id, Order.status).where(Order.id.in_(order_ids))
+
+
+# ---------- 执行（同步）----------
+def _apply(db: Session, order_id: int, stmt, expect: str) -> Order:
+    row = db.execute(stmt).one_or_none()
+    if row is None:
+        db.rollback()
+        raise transition_error(db.execute(current_status_stmt(order_id)).scalar_one_or_none(), expect)
+    order = row[0]
+    # 先脱离会话再提交：提交后不必再 refresh 一次
+    db.expunge(order)
+    db.commit()
+    record_transition(expect, order.status)
+    order_cache.fill(order)  # 用流转后的行替换快照
+    events.publish_rows(expect, [row])
     return order
 
 
+def _apply_batch(db: Session, order_ids: List[int], stmt, expect: str) -> List[Dict[str, Any]]:
+    rows = db.execute(stmt).all()
+    done = {o.id: o for o, _ in rows}
+    for o in done.values():
+        db.expunge(o)
+    db.commit()
+    record_batch(expect, done)
+    order_cache.fill_many(done.values())  # 同 _apply：put 新快照，旧行回填挡在版本比较外
+    events.publish_rows(expect, rows)
+    missing = [oid for oid in order_ids if oid not in done]
+    current = dict(db.execute(current_statuses_stmt(missing)).all()) if missing else {}
+    return batch_outcomes(order_ids, done, current, expect)
+
+
 def review_order(
     db: Session,
     order_id: int,
@@ -25,28 +337,8 @@ def review_order(
     reason: Optional[str] = None,
 ) -> Order:
     """审核通过/驳回：PENDING_REVIEW -> REVIEW_APPROVED / REVIEW_REJECTED"""
-    order = _ensure_order(db, order_id)
-
-    if order.status != OrderStatus.PENDING_REVIEW:
-        raise HTTPException(
-            status_code=409,
-            detail=f"invalid state: {order.status}. expect PENDING_REVIEW"
-        )
-
-    reviewer = get_or_create_user_by_kook(db, reviewer_kook_id, role_hint="REVIEWER")
-    to_status = OrderStatus.REVIEW_APPROVED if approve else OrderStatus.REVIEW_REJECTED
-
-    db.add(OrderAudit(
-        order_id=order.id,
-        actor_user_id=reviewer.id,
-        from_status=order.status,
-        to_status=to_status,
-        reason=reason or ("approved" if approve else "rejected"),
-    ))
-    order.status = to_status
-
-    db.commit(); db.refresh(order)
-    return order
+    reviewer_id = get_or_create_user_id_by_kook(db, reviewer_kook_id, role_hint="REVIEWER")
+    return _apply(db, order_id, review_stmt(order_id, reviewer_id, approve, reason), EXPECT_REVIEW)
 
 
 def accept_order(
@@ -61,33 +353,8 @@ def accept_order(
     - 直接写入 player_kook_id / player_kook_name
     - 不再校验内部 user_id（我们已去掉）
     """
-    order = _ensure_order(db, order_id)
-
-    if order.status not in (OrderStatus.REVIEW_APPROVED):
-        raise HTTPException(
-            status_code=409,
-            detail=f"invalid state: {order.status}. expect REVIEW_APPROVED/PENDING_REVIEW"
-        )
-
-    # 写入陪玩 KOOK 身份
-    order.player_kook_id = player_kook_id
-    if player_kook_name:
-        order.player_kook_name = player_kook_name
-
-    # 状态流转
-    order.status = OrderStatus.IN_PROGRESS
-
-    # 审计（保留最小必需字段）
-    db.add(OrderAudit(
-        order_id=order.id,
-        to_status=order.status,
-        reason="accept",
-        # 如果你的 OrderAudit 有 payload 字段可以加上：payload=payload
-    ))
-
-    db.commit()
-    db.refresh(order)
-    return order
+    stmt = accept_stmt(order_id, player_kook_id, player_kook_name, payload)
+    return _apply(db, order_id, stmt, EXPECT_ACCEPT)
 
 
 def complete_order(
@@ -97,37 +364,128 @@ def complete_order(
     payload: Optional[Dict[str, Any]] = None,
 ) -> Order:
     """结单：IN_PROGRESS -> COMPLETED，同时生成完成回执"""
-    order = _ensure_order(db, order_id)
+    # 谁来触发完成都行（老板/陪玩/系统），这里用 kook id 记录审计人
+    actor_id = get_or_create_user_id_by_kook(db, actor_kook_id, role_hint="PLAYER")
+    return _apply(db, order_id, complete_stmt(order_id, actor_id, actor_kook_id, payload), EXPECT_COMPLETE)
 
-    if order.status != OrderStatus.IN_PROGRESS:
-        raise HTTPException(
-            status_code=409,
-            detail=f"invalid state: {order.status}. expect IN_PROGRESS"
-        )
 
-    # 谁来触发完成都行（老板/陪玩/系统），这里用 kook id 记录审计人
-    actor = get_or_create_user_by_kook(db, actor_kook_id, role_hint="PLAYER")
+# ---------- 批量流转（同步）：同一规则，一条集合语句 ----------
+def review_orders(db: Session, order_ids: Sequence[int], reviewer_kook_id: str,
+                  approve: bool, reason: Optional[str] = None) -> List[Dict[str, Any]]:
+    ids = dedupe_ids(order_ids)
+    reviewer_id = get_or_create_user_id_by_kook(db, reviewer_kook_id, role_hint="REVIEWER")
+    return _apply_batch(db, ids, review_stmt(ids, reviewer_id, approve, reason), EXPECT_REVIEW)
 
-    db.add(OrderAudit(
-        order_id=order.id,
-        actor_user_id=actor.id,
-        from_status=order.status,
-        to_status=OrderStatus.COMPLETED,
-        reason="completed",
-    ))
 
-    # 生成回执：COMPLETION
-    default_payload = {
-        "completed_by": getattr(actor, "display_name", actor_kook_id),
-        "amount_cents": order.amount_cents,
-        "duration_hours": order.duration_hours,
-    }
-    db.add(Receipt(
-        order_id=order.id,
-        type=ReceiptType.COMPLETION,
-        payload=(payload or default_payload),
-    ))
-
-    order.status = OrderStatus.COMPLETED
-    db.commit(); db.refresh(order)
-    return order
+def accept_orders(db: Session, order_ids: Sequence[int], player_kook_id: str,
+                  player_kook_name: Optional[str] = None,
+                  payload: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    ids = dedupe_ids(order_ids)
+    return _apply_batch(db, ids, accept_stmt(ids, player_kook_id, player_kook_name, payload), EXPECT_ACCEPT)
+
+
+def complete_orders(db: Session, order_ids: Sequence[int], actor_kook_id: str,
+                    payload: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    ids = dedupe_ids(order_ids)
+    actor_id = get_or_create_user_id_by_kook(db, actor_kook_id, role_hint="PLAYER")
+    return _apply_batch(db, ids, complete_stmt(ids, actor_id, actor_kook_id, payload), EXPECT_COMPLETE)
+
+
+# ---------- 订单历史（order_audits 按月分区）----------
+HISTORY_MAX = 500
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+
+
+def order_history_stmt(order_id: int, limit: int = HISTORY_MAX):
+    """
+    走 (order_id, created_at) 索引；审计不早于订单创建时间，
+    以它为下界（InitPlan），执行期即可裁掉更早的月分区
+    """
+    since = select(Order.created_at).where(Order.id == order_id).scalar_subquery()
+    return (
+        select(OrderAudit)
+        .where(OrderAudit.order_id == order_id, OrderAudit.created_at >= since)
+        .order_by(OrderAudit.created_at, OrderAudit.id)
+        .limit(limit)
+    )
+
+
+def order_history(db: Session, order_id: int) -> List[OrderAudit]:
+    rows = list(db.execute(order_history_stmt(order_id)).scalars().all())
+    if not rows and db.execute(current_status_stmt(order_id)).scalar_one_or_none() is None:
+        # live 表没有这单：可能已归档（见 app/services/archive.py）
+        rows = archive.find_history(db, order_id, HISTORY_MAX)
+        if not rows:
+            raise HTTPException(status_code=404, detail="order not found")
+    return rows
+
+
+def ensure_audit_partitions_stmt(months_ahead: int = AUDIT_PARTITIONS_AHEAD):
+    """补建当前月起 months_ahead 个月的审计分区（函数见 alembic c7a2e94b1d53），返回新建个数"""
+    return select(func.ensure_order_audit_partitions(func.now(), months_ahead))
+
+
+# ---------- 列表查询（keyset 分页）----------
+LIST_DEFAULT_LIMIT = 20
+LIST_MAX_LIMIT = 100
+
+
+def encode_cursor(order: Order) -> str:
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        at, oid = raw.rsplit("|", 1)
+        return datetime.fromisoformat(at), int(oid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def list_orders_stmt(
+    *,
+    status: Optional[OrderStatus] = None,
+    boss_kook_id: Optional[str] = None,
+    player_kook_id: Optional[str] = None,
+    game_name: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = LIST_DEFAULT_LIMIT,
+):
+    """
+    按 created_at DESC, id DESC 排序；翻页用行值比较 (created_at, id) < (:at, :id)，
+    配合 (过滤列, created_at, id) 复合索引，任意深度的页都只扫 limit+1 行
+    """
+    q = select(Order)
+    if status is not None:
+        q = q.where(Order.status == status)
+    if boss_kook_id:
+        q = q.where(Order.boss_kook_id == boss_kook_id)
+    if player_kook_id:
+        q = q.where(Order.player_kook_id == player_kook_id)
+    if game_name:
+        q = q.where(Order.game_name == game_name)
+    if created_from is not None:
+        q = q.where(Order.created_at >= created_from)
+    if created_to is not None:
+        q = q.where(Order.created_at < created_to)
+    if cursor:
+        at, oid = decode_cursor(cursor)
+        q = q.where(tuple_(Order.created_at, Order.id) < tuple_(at, oid))
+    # 多取一行判断是否还有下一页
+    return q.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1)
+
+
+def paginate(rows: List[Order], limit: int) -> Tuple[List[Order], Optional[str]]:
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def list_orders(db: Session, *, limit: int = LIST_DEFAULT_LIMIT, **filters) -> Tuple[List[Order], Optional[str]]:
+    rows = db.execute(list_orders_stmt(limit=limit, **filters)).scalars().all()
+    return paginate(list(rows), limit)
@@ -0,0 +1,124 @@
+# app/services/orders_async.py
+"""app.services.orders 的 AsyncSession 版本（DB_ASYNC=1 时使用），语句与同步版共用"""
+from typing import Optional, Dict, Any, List, Tuple, Sequence
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Order, OrderAudit, OrderStatus
+from app.metrics import record_transition
+from app import order_cache, events
+from app.services.orders import (
+    current_status_stmt, current_statuses_stmt, transition_error, batch_outcomes, dedupe_ids,
+    record_batch,
+    review_stmt, accept_stmt, complete_stmt,
+    EXPECT_REVIEW, EXPECT_ACCEPT, EXPECT_COMPLETE,
+    list_orders_stmt, paginate, LIST_DEFAULT_LIMIT,
+    create_orders_stmt, order_history_stmt, HISTORY_MAX,
+)
+from app.services import archive_async
+from app.services.users_async import get_or_create_user_id_by_kook
+
+
+async def create_orders(db: AsyncSession, items) -> List[Order]:
+    rows = (await db.execute(create_orders_stmt(items))).all()
+    await db.commit()
+    record_transition(None, OrderStatus.PENDING_REVIEW, len(rows))
+    events.publish_rows(None, rows)
+    return [o for o, _ in rows]
+
+
+async def _apply(db: AsyncSession, order_id: int, stmt, expect: str) -> Order:
+    row = (await db.execute(stmt)).one_or_none()
+    if row is None:
+        await db.rollback()
+        current = (await db.execute(current_status_stmt(order_id))).scalar_one_or_none()
+        raise transition_error(current, expect)
+    order = row[0]
+    await db.commit()
+    record_transition(expect, order.status)
+    await order_cache.afill(order)  # 用流转后的行替换快照
+    events.publish_rows(expect, [row])
+    return order
+
+
+async def _apply_batch(db: AsyncSession, order_ids: List[int], stmt, expect: str) -> List[Dict[str, Any]]:
+    rows = (await db.execute(stmt)).all()
+    done = {o.id: o for o, _ in rows}
+    await db.commit()
+    record_batch(expect, done)
+    await order_cache.afill_many(done.values())
+    events.publish_rows(expect, rows)
+    missing = [oid for oid in order_ids if oid not in done]
+    current = dict((await db.execute(current_statuses_stmt(missing))).all()) if missing else {}
+    return batch_outcomes(order_ids, done, current, expect)
+
+
+async def review_order(
+    db: AsyncSession,
+    order_id: int,
+    reviewer_kook_id: str,
+    approve: bool,
+    reason: Optional[str] = None,
+) -> Order:
+    """审核通过/驳回：PENDING_REVIEW -> REVIEW_APPROVED / REVIEW_REJECTED"""
+    reviewer_id = await get_or_create_user_id_by_kook(db, reviewer_kook_id, role_hint="REVIEWER")
+    return await _apply(db, order_id, review_stmt(order_id, reviewer_id, approve, reason), EXPECT_REVIEW)
+
+
+async def accept_order(
+    db: AsyncSession,
+    order_id: int,
+    player_kook_id: str,
+    player_kook_name: Optional[str] = None,
+    payload: Optional[Dict[str, Any]] = None,
+) -> Order:
+    """陪玩接单：REVIEW_APPROVED -> IN_PROGRESS"""
+    stmt = accept_stmt(order_id, player_kook_id, player_kook_name, payload)
+    return await _apply(db, order_id, stmt, EXPECT_ACCEPT)
+
+
+async def complete_order(
+    db: AsyncSession,
+    order_id: int,
+    actor_kook_id: str,
+    payload: Optional[Dict[str, Any]] = None,
+) -> Order:
+    """结单：IN_PROGRESS -> COMPLETED，同时生成完成回执"""
+    actor_id = await get_or_create_user_id_by_kook(db, actor_kook_id, role_hint="PLAYER")
+    return await _apply(db, order_id, complete_stmt(order_id, actor_id, actor_kook_id, payload), EXPECT_COMPLETE)
+
+
+# ---------- 批量流转 ----------
+async def review_orders(db: AsyncSession, order_ids: Sequence[int], reviewer_kook_id: str,
+                        approve: bool, reason: Optional[str] = None) -> List[Dict[str, Any]]:
+    ids = dedupe_ids(order_ids)
+    reviewer_id = await get_or_create_user_id_by_kook(db, reviewer_kook_id, role_hint="REVIEWER")
+    return await _apply_batch(db, ids, review_stmt(ids, reviewer_id, approve, reason), EXPECT_REVIEW)
+
+
+async def accept_orders(db: AsyncSession, order_ids: Sequence[int], player_kook_id: str,
+                        player_kook_name: Optional[str] = None,
+                        payload: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    ids = dedupe_ids(order_ids)
+    return await _apply_batch(db, ids, accept_stmt(ids, player_kook_id, player_kook_name, payload), EXPECT_ACCEPT)
+
+
+async def complete_orders(db: AsyncSession, order_ids: Sequence[int], actor_kook_id: str,
+                          payload: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    ids = dedupe_ids(order_ids)
+    actor_id = await get_or_create_user_id_by_kook(db, actor_kook_id, role_hint="PLAYER")
+    return await _apply_batch(db, ids, complete_stmt(ids, actor_id, actor_kook_id, payload), EXPECT_COMPLETE)
+
+
+async def order_history(db: AsyncSession, order_id: int) -> List[OrderAudit]:
+    rows = list((await db.execute(order_history_stmt(order_id))).scalars().all())
+    if not rows and (await db.execute(current_status_stmt(order_id))).scalar_one_or_none() is None:
+        rows = await archive_async.find_history(db, order_id, HISTORY_MAX)
+        if not rows:
+            raise HTTPException(status_code=404, detail="order not found")
+    return rows
+
+
+async def list_orders(db: AsyncSession, *, limit: int = LIST_DEFAULT_LIMIT, **filters) -> Tuple[List[Order], Optional[str]]:
+    rows = (await db.execute(list_orders_stmt(limit=limit, **filters))).scalars().all()
+    return paginate(list(rows), limit)
@@ -0,0 +1,186 @@
+# app/services/reports.py
+"""
+营收 / 陪玩工作量报表
+- report_daily：天 × 游戏 × 陪玩 的单数、金额、时长汇总
+- 结单语句里多一个 INSERT ... ON CONFLICT DO UPDATE 的 CTE 增量累加，与结单同一事务，不会漏记 / 重记
+- 查询只扫汇总表的日期范围：O(天数 × 游戏 × 陪玩)，与订单总量无关
+- 天按 REPORT_TZ 切分；改时区后用 rebuild_stmts() 从审计表重算（连同已归档的订单与审计）
+"""
+import os
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import Date, Numeric, cast, delete, desc, func, insert, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models import Order, OrderArchive, OrderAudit, OrderAuditArchive, OrderStatus, ReportDaily
+from app.services.archive import with_archived
+
+REPORT_TZ = os.getenv("REPORT_TZ", "Asia/Shanghai")
+REPORT_DEFAULT_DAYS = 7
+REPORT_MAX_DAYS = 366
+
+R = ReportDaily
+
+
+def _day(ts):
+    return cast(func.timezone(REPORT_TZ, ts), Date)
+
+
+def report_rollup_cte(upd):
+    """结单 CTE：按 (天, 游戏, 陪玩) 聚合本次结单的行并累加进 report_daily（批量结单同样一条语句）"""
+    day = _day(upd.c.updated_at).label("day")
+    player = func.coalesce(upd.c.player_kook_id, literal("")).label("player_kook_id")
+    src = (
+        select(
+            day,
+            upd.c.game_name,
+            player,
+            func.max(upd.c.player_kook_name),
+            func.count(),
+            func.sum(upd.c.amount_cents),
+            func.sum(upd.c.duration_hours),
+        )
+        .group_by(day, upd.c.game_name, player)
+    )
+    ins = pg_insert(R).from_select(
+        ["day", "game_name", "player_kook_id", "player_kook_name", "orders", "amount_cents", "hours"], src
+    )
+    return ins.on_conflict_do_update(
+        index_elements=[R.day, R.game_name, R.player_kook_id],
+        set_={
+            "orders": R.orders + ins.excluded.orders,
+            "amount_cents": R.amount_cents + ins.excluded.amount_cents,
+            "hours": R.hours + ins.excluded.hours,
+            "player_kook_name": func.coalesce(ins.excluded.player_kook_name, R.player_kook_name),
+            "updated_at": func.now(),
+        },
+    ).cte("rpt")
+
+
+def rebuild_stmts() -> list:
+    """全量重算（改 REPORT_TZ 或修数据后）：按审计里的 COMPLETED 时间归天；订单与审计整批一起归档，
+    live / 归档表各自 UNION ALL 后再关联，搬走的老订单不会从报表里消失"""
+    a = with_archived(
+        OrderAudit.__table__, OrderAuditArchive.__table__,
+        [OrderAudit.order_id, OrderAudit.to_status, OrderAudit.created_at],
+    )
+    o = with_archived(
+        Order.__table__, OrderArchive.__table__,
+        [Order.id, Order.game_name, Order.player_kook_id, Order.player_kook_name,
+         Order.amount_cents, Order.duration_hours],
+    )
+    day = _day(a.c.created_at).label("day")
+    player = func.coalesce(o.c.player_kook_id, literal("")).label("player_kook_id")
+    src = (
+        select(
+            day, o.c.game_name, player, func.max(o.c.player_kook_name),
+            func.count(), func.sum(o.c.amount_cents), func.sum(o.c.duration_hours),
+        )
+        .select_from(a)
+        .join(o, o.c.id == a.c.order_id)
+        .where(a.c.to_status == OrderStatus.COMPLETED)
+        .group_by(day, o.c.game_name, player)
+    )
+    return [
+        delete(R),
+        insert(R).from_select(
+            ["day", "game_name", "player_kook_id", "player_kook_name", "orders", "amount_cents", "hours"], src
+        ),
+    ]
+
+
+def rebuild(db: Session) -> None:
+    for stmt in rebuild_stmts():
+        db.execute(stmt)
+    db.commit()
+
+
+# ---------- 查询 ----------
+def resolve_range(date_from: Optional[date], date_to: Optional[date], today: Optional[date] = None):
+    """缺省：最近 REPORT_DEFAULT_DAYS 天（含今天）；跨度超过 REPORT_MAX_DAYS -> 400"""
+    today = today or datetime.now(ZoneInfo(REPORT_TZ)).date()
+    date_to = date_to or today
+    date_from = date_from or (date_to - timedelta(days=REPORT_DEFAULT_DAYS - 1))
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from after date_to")
+    if (date_to - date_from).days + 1 > REPORT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"range too long (max {REPORT_MAX_DAYS} days)")
+    return date_from, date_to
+
+
+def _filters(date_from: date, date_to: date, game_name: Optional[str], player_kook_id: Optional[str]):
+    conds = [R.day >= date_from, R.day <= date_to]
+    if game_name:
+        conds.append(R.game_name == game_name)
+    if player_kook_id:
+        conds.append(R.player_kook_id == player_kook_id)
+    return conds
+
+
+def _totals():
+    return (
+        func.sum(R.orders).label("orders"),
+        func.sum(R.amount_cents).label("amount_cents"),
+        cast(func.sum(R.hours), Numeric(12, 2)).label("hours"),
+    )
+
+
+def revenue_stmt(date_from: date, date_to: date, game_name: Optional[str] = None, player_kook_id: Optional[str] = None):
+    """按天汇总（有单的天才有行）"""
+    return (
+        select(R.day, *_totals())
+        .where(*_filters(date_from, date_to, game_name, player_kook_id))
+        .group_by(R.day)
+        .order_by(R.day)
+    )
+
+
+def players_stmt(date_from: date, date_to: date, game_name: Optional[str] = None, limit: int = 100):
+    """按陪玩汇总，时长倒序"""
+    return (
+        select(R.player_kook_id, func.max(R.player_kook_name).label("player_kook_name"), *_totals())
+        .where(*_filters(date_from, date_to, game_name, None))
+        .group_by(R.player_kook_id)
+        .order_by(desc("hours"), R.player_kook_id)
+        .limit(limit)
+    )
+
+
+def revenue_report(rows, date_from: date, date_to: date) -> Dict[str, Any]:
+    days = [dict(r._mapping) for r in rows]
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "tz": REPORT_TZ,
+        "days": days,
+        "total": {
+            "orders": sum(d["orders"] for d in days),
+            "amount_cents": sum(d["amount_cents"] for d in days),
+            "hours": sum((d["hours"] for d in days), 0),
+        },
+    }
+
+
+def players_report(rows, date_from: date, date_to: date) -> Dict[str, Any]:
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "tz": REPORT_TZ,
+        "players": [dict(r._mapping) for r in rows],
+    }
+
+
+def revenue(db: Session, date_from=None, date_to=None, game_name=None, player_kook_id=None) -> Dict[str, Any]:
+    date_from, date_to = resolve_range(date_from, date_to)
+    rows = db.execute(revenue_stmt(date_from, date_to, game_name, player_kook_id)).all()
+    return revenue_report(rows, date_from, date_to)
+
+
+def players(db: Session, date_from=None, date_to=None, game_name=None, limit: int = 100) -> Dict[str, Any]:
+    date_from, date_to = resolve_range(date_from, date_to)
+    rows = db.execute(players_stmt(date_from, date_to, game_name, limit)).all()
+    return players_report(rows, date_from, date_to)
@@ -0,0 +1,21 @@
+# app/services/reports_async.py
+"""app.services.reports 的 AsyncSession 版本（DB_ASYNC=1 时使用），语句与同步版共用"""
+from typing import Any, Dict
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.reports import (
+    resolve_range, revenue_stmt, players_stmt, revenue_report, players_report,
+)
+
+
+async def revenue(db: AsyncSession, date_from=None, date_to=None, game_name=None, player_kook_id=None) -> Dict[str, Any]:
+    date_from, date_to = resolve_range(date_from, date_to)
+    rows = (await db.execute(revenue_stmt(date_from, date_to, game_name, player_kook_id))).all()
+    return revenue_report(rows, date_from, date_to)
+
+
+async def players(db: AsyncSession, date_from=None, date_to=None, game_name=None, limit: int = 100) -> Dict[str, Any]:
+    date_from, date_to = resolve_range(date_from, date_to)
+    rows = (await db.execute(players_stmt(date_from, date_to, game_name, limit))).all()
+    return players_report(rows, date_from, date_to)
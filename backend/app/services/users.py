@@ -1,40 +1,117 @@
 # app/services/users.py
+import os
+import threading
+from collections import OrderedDict
 from typing import Optional
+from sqlalchemy import select, insert, literal, exists
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
 
 from app.models import User, UserRole, KookBinding
 
-def get_or_create_user_by_kook(db: Session, kook_id: str, role_hint: Optional[str] = None) -> User:
-    """按 KOOK 用户ID 找到 User；没有就创建 user+binding（幂等）"""
+# ---------- 进程内缓存：kook_user_id -> user_id ----------
+# 绑定一经创建不再变化，命中后零查询；只缓存已提交的绑定（见 remember_binding 的调用处）
+# OrderedDict 实现 LRU：命中挪到队尾，满了淘汰最久未用的（常下单的老板 / 陪玩不会被挤掉）
+# 同步路由在线程池里并发读写，加锁（同 app/order_cache.py 的 LRUOrderCache）
+BINDING_CACHE_MAX = int(os.getenv("BINDING_CACHE_MAX", "10000"))
+_binding_cache: "OrderedDict[str, int]" = OrderedDict()
+_binding_lock = threading.Lock()
+
+
+def cached_user_id(kook_id: str) -> Optional[int]:
+    kid = str(kook_id)
+    with _binding_lock:
+        uid = _binding_cache.get(kid)
+        if uid is not None:
+            _binding_cache.move_to_end(kid)
+        return uid
+
+
+def remember_binding(kook_id: str, user_id: int) -> None:
     kid = str(kook_id)
+    with _binding_lock:
+        _binding_cache[kid] = user_id
+        _binding_cache.move_to_end(kid)
+        while len(_binding_cache) > BINDING_CACHE_MAX:
+            _binding_cache.popitem(last=False)
 
-    # 1) 先查绑定，避免重复插入触发 UNIQUE
-    kb = db.query(KookBinding).filter_by(kook_user_id=kid).one_or_none()
-    if kb:
-        return kb.user
 
-    # 2) 没有则新建
-    role = None
+def _role_of(role_hint: Optional[str]) -> UserRole:
     if role_hint:
-        role_hint = role_hint.upper()
         try:
-            role = UserRole[role_hint]
+            return UserRole[role_hint.upper()]
         except KeyError:
-            role = UserRole.PLAYER  # 兜底
-
-    user = User(display_name=f"kook_{kid}", role=role or UserRole.PLAYER)
-    db.add(user)
-    db.flush()  # 得到 user.id
-
-    db.add(KookBinding(user_id=user.id, kook_user_id=kid))
-    try:
-        db.commit()
-    except IntegrityError:
-        # 并发或其它请求已创建 -> 回滚重查
-        db.rollback()
-        kb2 = db.query(KookBinding).filter_by(kook_user_id=kid).one()
-        return kb2.user
-
-    db.refresh(user)
-    return user
+            pass
+    return UserRole.PLAYER  # 兜底
+
+
+def upsert_binding_stmt(kook_id: str, role_hint: Optional[str] = None):
+    """
+    一条语句完成「查绑定，没有就建 user + binding」：
+        existing  ：已有绑定
+        new_user  ：没有绑定时插入 users
+        new_kb    ：INSERT kook_bindings ... ON CONFLICT (kook_user_id) DO NOTHING
+    返回 (existing_id, bound_id, new_id)：
+        existing_id 非空 -> 已存在；bound_id 非空 -> 本次新建；
+        都为空 -> 并发下别人抢先建了绑定，new_id 是本次多插的 users 行
+    不提交事务，由调用方的流转语句一起提交
+    """
+    kid = str(kook_id)
+    u, kb = User.__table__, KookBinding.__table__
+
+    existing = select(kb.c.user_id).where(kb.c.kook_user_id == kid).cte("existing")
+    new_user = (
+        insert(u)
+        .from_select(
+            ["display_name", "role"],
+            select(literal(f"kook_{kid}"), literal(_role_of(role_hint), u.c.role.type))
+            .where(~exists(select(existing.c.user_id))),
+        )
+        .returning(u.c.id)
+        .cte("new_user")
+    )
+    new_kb = (
+        pg_insert(kb)
+        .from_select(["user_id", "kook_user_id"], select(new_user.c.id, literal(kid)))
+        .on_conflict_do_nothing(index_elements=["kook_user_id"])
+        .returning(kb.c.user_id)
+        .cte("new_kb")
+    )
+    return select(
+        select(existing.c.user_id).scalar_subquery().label("existing_id"),
+        select(new_kb.c.user_id).scalar_subquery().label("bound_id"),
+        select(new_user.c.id).scalar_subquery().label("new_id"),
+    )
+
+
+def lost_race_stmts(kook_id: str, orphan_user_id: int):
+    """并发建绑定失败时：删掉本次多插的 users 行，再读别人建好的绑定"""
+    return (
+        User.__table__.delete().where(User.id == orphan_user_id),
+        select(KookBinding.user_id).where(KookBinding.kook_user_id == str(kook_id)),
+    )
+
+
+def get_or_create_user_id_by_kook(db: Session, kook_id: str, role_hint: Optional[str] = None) -> int:
+    """
+    按 KOOK 用户ID 拿 user_id；没有就创建 user+binding（幂等）
+    缓存命中 0 次查询，未命中 1 次；不提交调用方事务
+    """
+    kid = str(kook_id)
+    uid = cached_user_id(kid)
+    if uid is not None:
+        return uid
+
+    existing_id, bound_id, new_id = db.execute(upsert_binding_stmt(kid, role_hint)).one()
+    if existing_id is not None:
+        remember_binding(kid, existing_id)
+        return existing_id
+    if bound_id is not None:
+        # 新建的绑定还没提交，先不进缓存；下次命中 existing 时再缓存
+        return bound_id
+
+    delete_orphan, reselect = lost_race_stmts(kid, new_id)
+    db.execute(delete_orphan)
+    uid = db.execute(reselect).scalar_one()
+    remember_binding(kid, uid)
+    return uid
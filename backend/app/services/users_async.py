@@ -0,0 +1,29 @@
+# app/services/users_async.py
+"""app.services.users 的 AsyncSession 版本（DB_ASYNC=1 时使用），语句与缓存同步版共用"""
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.users import (
+    cached_user_id, remember_binding, upsert_binding_stmt, lost_race_stmts,
+)
+
+
+async def get_or_create_user_id_by_kook(db: AsyncSession, kook_id: str, role_hint: Optional[str] = None) -> int:
+    """按 KOOK 用户ID 拿 user_id；缓存命中 0 次查询，未命中 1 次；不提交调用方事务"""
+    kid = str(kook_id)
+    uid = cached_user_id(kid)
+    if uid is not None:
+        return uid
+
+    existing_id, bound_id, new_id = (await db.execute(upsert_binding_stmt(kid, role_hint))).one()
+    if existing_id is not None:
+        remember_binding(kid, existing_id)
+        return existing_id
+    if bound_id is not None:
+        return bound_id
+
+    delete_orphan, reselect = lost_race_stmts(kid, new_id)
+    await db.execute(delete_orphan)
+    uid = (await db.execute(reselect)).scalar_one()
+    remember_binding(kid, uid)
+    return uid
@@ -0,0 +1,111 @@
+# app/workers/archive.py
+"""
+冷数据归档进程：python -m app.workers.archive（在 backend/ 下运行）
+- 每轮把终态且超过 ARCHIVE_AFTER_DAYS 天的订单连同审计、回执搬进 *_archive（语句见 app/services/archive.py），
+  每批 ARCHIVE_BATCH 单、一个短事务，批间停 ARCHIVE_PAUSE 秒，给热路径和 WAL 让路
+- 一批搬不满说明积压清完，等 ARCHIVE_INTERVAL 秒后再看；多开时各自 SKIP LOCKED，不会搬同一单
+- 归档不改订单内容，快照缓存无需失效；GET /api/orders/{id} 在 live 表未命中时回落到归档表
+- 每轮顺带分批删除过期的幂等键（app/idempotency.py 的 purge_stmt），每批一个短事务
+"""
+import argparse
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from prometheus_client import Counter, start_http_server
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.db import DATABASE_URL, to_async_url
+from app.idempotency import PURGE_BATCH, purge_stmt
+from app.services.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH, archive_batch_stmt
+
+log = logging.getLogger("archive")
+
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+ARCHIVE_PAUSE = float(os.getenv("ARCHIVE_PAUSE", "0.2"))
+ARCHIVE_METRICS_PORT = os.getenv("ARCHIVE_METRICS_PORT", "").strip()
+
+ARCHIVED = Counter("archive_rows_total", "搬进归档表的行数", ["table"])
+
+
+class Archiver:
+    def __init__(self, sessions, older_than_days: int = ARCHIVE_AFTER_DAYS, batch: int = ARCHIVE_BATCH):
+        self.sessions = sessions
+        self.older_than_days = older_than_days
+        self.batch = batch
+
+    async def archive_batch(self) -> int:
+        """搬一批，返回搬走的订单数"""
+        async with self.sessions() as db:
+            moved = (await db.execute(archive_batch_stmt(self.older_than_days, self.batch))).one()
+            await db.commit()
+        for table, n in moved._mapping.items():
+            ARCHIVED.labels(table).inc(n)
+        if moved.orders:
+            log.info("archived %d orders, %d audits, %d receipts", moved.orders, moved.audits, moved.receipts)
+        return moved.orders
+
+    async def run_once(self, max_batches: Optional[int] = None) -> int:
+        """搬到积压清完（或达到 max_batches 批），返回搬走的订单数"""
+        total = batches = 0
+        while max_batches is None or batches < max_batches:
+            n = await self.archive_batch()
+            total += n
+            batches += 1
+            if n < self.batch:
+                break
+            await asyncio.sleep(ARCHIVE_PAUSE)
+        return total
+
+    async def purge_idempotency_keys(self) -> int:
+        """删到没有过期键为止，返回删除条数"""
+        total = 0
+        while True:
+            async with self.sessions() as db:
+                n = (await db.execute(purge_stmt())).rowcount
+                await db.commit()
+            total += n
+            if n < PURGE_BATCH:
+                break
+            await asyncio.sleep(ARCHIVE_PAUSE)
+        if total:
+            log.info("purged %d expired idempotency keys", total)
+        return total
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                log.exception("archive round failed")
+            try:
+                await self.purge_idempotency_keys()
+            except Exception:
+                log.exception("idempotency key purge failed")
+            await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+async def main(once: bool = False, max_batches: Optional[int] = None) -> None:
+    engine = create_async_engine(to_async_url(DATABASE_URL), pool_size=1, max_overflow=0)
+    sessions = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    a = Archiver(sessions)
+    try:
+        if once:
+            print(f"archived {await a.run_once(max_batches)} orders")
+            print(f"purged {await a.purge_idempotency_keys()} expired idempotency keys")
+        else:
+            await a.run_forever()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="move old terminal orders into the archive tables")
+    ap.add_argument("--once", action="store_true", help="清完当前积压后退出")
+    ap.add_argument("--max-batches", type=int, default=None, help="配合 --once：最多搬几批")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if ARCHIVE_METRICS_PORT:
+        start_http_server(int(ARCHIVE_METRICS_PORT))
+    asyncio.run(main(once=args.once, max_batches=args.max_batches))
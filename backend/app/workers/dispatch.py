@@ -0,0 +1,127 @@
+# app/workers/dispatch.py
+"""
+自动派单进程：python -m app.workers.dispatch（在 backend/ 下运行，可多开）
+- 每轮先列出有空闲陪玩的游戏，再逐个游戏派一单，直到一整轮没有派出或达到 DISPATCH_BATCH
+- 每派一单一个短事务：领该游戏队首（SKIP LOCKED）-> 挑陪玩（SKIP LOCKED）-> accept_stmt 接单，立即提交；
+  多个进程并发时各自跳过别人锁住的订单和陪玩，不会重复派单，也不会超过陪玩的接单上限
+- 没有空闲陪玩的游戏不会被扫到；陪玩上线 / 结单腾出名额后，下一轮（DISPATCH_POLL_INTERVAL 秒内）即派
+- 接单事件经 order_audits 触发器 NOTIFY，各 API worker 的变更订阅负责失效快照、推送 SSE
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import List
+
+from prometheus_client import Counter, Histogram, start_http_server
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import order_cache
+from app.db import DATABASE_URL, to_async_url
+from app.metrics import record_transition
+from app.services.dispatch import claim_stmt, free_games_stmt, pick_player_stmt, purge_stmt
+from app.services.orders import EXPECT_ACCEPT, accept_stmt
+
+log = logging.getLogger("dispatch")
+
+DISPATCH_BATCH = int(os.getenv("DISPATCH_BATCH", "50"))
+DISPATCH_POLL_INTERVAL = float(os.getenv("DISPATCH_POLL_INTERVAL", "1"))
+DISPATCH_METRICS_PORT = os.getenv("DISPATCH_METRICS_PORT", "").strip()
+
+ASSIGNED = Counter("dispatch_assigned_total", "自动派单成功", ["game"])
+CONTENDED = Counter("dispatch_contended_total", "候选陪玩都被其他派单进程锁住，本轮跳过", ["game"])
+WAIT_SECONDS = Histogram(
+    "dispatch_wait_seconds", "入队到派出的等待时间",
+    buckets=(1, 5, 15, 30, 60, 300, 900, 1800, 3600),
+)
+
+
+class Dispatcher:
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    async def free_games(self) -> List[str]:
+        async with self.sessions() as db:
+            return list((await db.execute(free_games_stmt())).scalars())
+
+    async def assign_one(self, game_name: str) -> bool:
+        """给该游戏派一单；队列空了或暂时挑不到陪玩返回 False"""
+        async with self.sessions() as db:
+            job = (await db.execute(claim_stmt(game_name))).first()
+            if job is None:
+                return False
+            player = (await db.execute(pick_player_stmt(game_name))).first()
+            if player is None:
+                CONTENDED.labels(game_name).inc()
+                return False  # 退出 async with 即回滚，释放队首
+            # 订单行已在领取时锁住且状态为 REVIEW_APPROVED，这里必然命中一行
+            order, _ = (await db.execute(
+                accept_stmt(job.order_id, player.kook_id, player.kook_name, {"dispatched": True})
+            )).one()
+            db.expunge(order)
+            await db.commit()
+        record_transition(EXPECT_ACCEPT, order.status)
+        await order_cache.afill(order)  # 与接口的流转一致：put 新快照
+        ASSIGNED.labels(game_name).inc()
+        WAIT_SECONDS.observe((datetime.now(timezone.utc) - job.enqueued_at).total_seconds())
+        log.info("order %s (%s) -> player %s", order.id, game_name, player.kook_id)
+        return True
+
+    async def run_once(self, limit: int = DISPATCH_BATCH) -> int:
+        """轮流给各游戏派单，最多 limit 单，返回派出的条数"""
+        n = 0
+        while n < limit:
+            progressed = False
+            for game in await self.free_games():
+                if n >= limit:
+                    break
+                if await self.assign_one(game):
+                    n += 1
+                    progressed = True
+            if not progressed:
+                break
+        return n
+
+    async def purge(self) -> int:
+        async with self.sessions() as db:
+            n = (await db.execute(purge_stmt())).rowcount
+            await db.commit()
+        return n
+
+    async def run_forever(self) -> None:
+        idle_rounds = 0
+        while True:
+            try:
+                n = await self.run_once()
+                if n >= DISPATCH_BATCH:
+                    continue  # 还有积压，立即下一轮
+                idle_rounds += 1
+                if idle_rounds % 60 == 1:
+                    await self.purge()
+            except Exception:
+                log.exception("dispatch round failed")
+            await asyncio.sleep(DISPATCH_POLL_INTERVAL)
+
+
+async def main(once: bool = False) -> None:
+    engine = create_async_engine(to_async_url(DATABASE_URL), pool_size=2, max_overflow=0)
+    sessions = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    d = Dispatcher(sessions)
+    try:
+        if once:
+            print(f"dispatched {await d.run_once()}")
+        else:
+            await d.run_forever()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="assign queued orders to available players")
+    ap.add_argument("--once", action="store_true", help="只处理一轮后退出")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if DISPATCH_METRICS_PORT:
+        start_http_server(int(DISPATCH_METRICS_PORT))
+    asyncio.run(main(once=args.once))
@@ -0,0 +1,218 @@
+# app/workers/outbox.py
+"""
+发件箱投递进程：python -m app.workers.outbox（在 backend/ 下运行，可多开）
+- 领取：FOR UPDATE SKIP LOCKED 取一批到期的行，顺手把 available_at 推后一个租约并 attempts+1，立即提交；
+  多个进程并发领取互不阻塞，也不会领到同一行
+- 投递在事务外并发进行（OUTBOX_CONCURRENCY），成功标 delivered_at；失败按指数退避 + 抖动改 available_at
+- 进程崩溃：租约（OUTBOX_LEASE 秒）到期后这些行重新可领 —— 至少一次，消费方按 Idempotency-Key 去重
+- 超过 OUTBOX_MAX_ATTEMPTS 次不再领取，留在表里人工处理（last_error 记最后一次错误）
+- 已投递的行保留 OUTBOX_RETENTION_HOURS 小时后分批删除
+投递目标：OUTBOX_WEBHOOK_URL（POST JSON，带 Idempotency-Key: outbox-<id>）；未配置时只打日志
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+from datetime import timedelta
+from typing import Awaitable, Callable, List
+
+import httpx
+from prometheus_client import Counter, Histogram, start_http_server
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db import DATABASE_URL, to_async_url
+from app.models import Outbox
+
+log = logging.getLogger("outbox")
+
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "100"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "10"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "72"))
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL", "").strip()
+OUTBOX_WEBHOOK_TIMEOUT = float(os.getenv("OUTBOX_WEBHOOK_TIMEOUT", "10"))
+OUTBOX_METRICS_PORT = os.getenv("OUTBOX_METRICS_PORT", "").strip()
+
+DELIVERED = Counter("outbox_delivered_total", "投递成功", ["topic"])
+FAILED = Counter("outbox_failed_total", "投递失败（会退避重试）", ["topic"])
+DELIVERY_SECONDS = Histogram("outbox_delivery_seconds", "单条投递耗时")
+LAG_SECONDS = Histogram(
+    "outbox_lag_seconds", "写入到投递成功的延迟",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 1800),
+)
+
+
+# ---------- 语句 ----------
+def claim_stmt(limit: int):
+    due = (
+        select(Outbox.id)
+        .where(
+            Outbox.delivered_at.is_(None),
+            Outbox.available_at <= func.now(),
+            Outbox.attempts < OUTBOX_MAX_ATTEMPTS,
+        )
+        .order_by(Outbox.available_at, Outbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .cte("due")
+    )
+    return (
+        update(Outbox)
+        .where(Outbox.id == due.c.id)
+        .values(
+            available_at=func.now() + timedelta(seconds=OUTBOX_LEASE),
+            attempts=Outbox.attempts + 1,
+        )
+        .returning(Outbox.id, Outbox.topic, Outbox.order_id, Outbox.payload, Outbox.attempts, Outbox.created_at)
+    )
+
+
+def delivered_stmt(ids: List[int]):
+    return update(Outbox).where(Outbox.id.in_(ids)).values(delivered_at=func.now(), last_error=None)
+
+
+def retry_stmt(outbox_id: int, delay: float, error: str):
+    return (
+        update(Outbox)
+        .where(Outbox.id == outbox_id)
+        .values(available_at=func.now() + timedelta(seconds=delay), last_error=error[:1000])
+    )
+
+
+def purge_stmt(limit: int = 1000):
+    old = (
+        select(Outbox.id)
+        .where(and_(
+            Outbox.delivered_at.is_not(None),
+            Outbox.delivered_at < func.now() - timedelta(hours=OUTBOX_RETENTION_HOURS),
+        ))
+        .limit(limit)
+        .scalar_subquery()
+    )
+    return delete(Outbox).where(Outbox.id.in_(old))
+
+
+def backoff(attempts: int) -> float:
+    # attempts 已含本次；full jitter
+    return random.uniform(0, min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1))))
+
+
+# ---------- 投递目标 ----------
+Deliver = Callable[[dict], Awaitable[None]]
+
+
+def webhook_sender(http: httpx.AsyncClient, url: str) -> Deliver:
+    async def send(msg: dict) -> None:
+        r = await http.post(
+            url,
+            json={"id": msg["id"], "topic": msg["topic"], "payload": msg["payload"]},
+            headers={"Idempotency-Key": f"outbox-{msg['id']}"},
+        )
+        if r.status_code >= 400:
+            raise RuntimeError(f"HTTP {r.status_code}: {r.text[:200]}")
+    return send
+
+
+async def log_sender(msg: dict) -> None:
+    log.info("outbox %s %s order=%s", msg["id"], msg["topic"], msg["order_id"])
+
+
+# ---------- 调度 ----------
+class Dispatcher:
+    def __init__(self, engine, deliver: Deliver, concurrency: int = OUTBOX_CONCURRENCY):
+        self.engine = engine
+        self.deliver = deliver
+        self.sem = asyncio.Semaphore(concurrency)
+
+    async def claim(self, limit: int) -> List[dict]:
+        async with self.engine.begin() as conn:
+            rows = (await conn.execute(claim_stmt(limit))).mappings().all()
+        return [dict(r) for r in rows]
+
+    async def _one(self, msg: dict, done: List[int]) -> None:
+        async with self.sem:
+            loop = asyncio.get_running_loop()
+            t0 = loop.time()
+            try:
+                await self.deliver(msg)
+            except Exception as e:
+                FAILED.labels(msg["topic"]).inc()
+                delay = backoff(msg["attempts"])
+                log.warning("outbox %s failed (attempt %s), retry in %.1fs: %s", msg["id"], msg["attempts"], delay, e)
+                try:
+                    async with self.engine.begin() as conn:
+                        await conn.execute(retry_stmt(msg["id"], delay, f"{type(e).__name__}: {e}"))
+                except Exception:
+                    # 退避没记上只影响这一条：租约到期后照常重领，不能连累同批已成功的标记
+                    log.exception("outbox %s: failed to schedule retry", msg["id"])
+                return
+            finally:
+                DELIVERY_SECONDS.observe(loop.time() - t0)
+            DELIVERED.labels(msg["topic"]).inc()
+            done.append(msg["id"])
+
+    async def run_once(self, limit: int = OUTBOX_BATCH) -> int:
+        """领一批并投递，返回领到的条数"""
+        batch = await self.claim(limit)
+        if not batch:
+            return 0
+        done: List[int] = []
+        await asyncio.gather(*(self._one(m, done) for m in batch))
+        if done:
+            # 成功的一次性标记；这里失败则租约到期后重投（至少一次）
+            async with self.engine.begin() as conn:
+                res = await conn.execute(
+                    delivered_stmt(done).returning(func.extract("epoch", Outbox.delivered_at - Outbox.created_at))
+                )
+                for (lag,) in res:
+                    LAG_SECONDS.observe(float(lag))
+        return len(batch)
+
+    async def purge(self) -> int:
+        async with self.engine.begin() as conn:
+            return (await conn.execute(purge_stmt())).rowcount
+
+    async def run_forever(self) -> None:
+        idle_rounds = 0
+        while True:
+            try:
+                n = await self.run_once()
+                if n >= OUTBOX_BATCH:
+                    continue  # 还有积压，立即下一批
+                idle_rounds += 1
+                if idle_rounds % 60 == 1:
+                    await self.purge()
+            except Exception:
+                log.exception("outbox round failed")
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+async def main(once: bool = False) -> None:
+    engine = create_async_engine(to_async_url(DATABASE_URL), pool_size=2, max_overflow=OUTBOX_CONCURRENCY)
+    http = httpx.AsyncClient(timeout=OUTBOX_WEBHOOK_TIMEOUT)
+    deliver = webhook_sender(http, OUTBOX_WEBHOOK_URL) if OUTBOX_WEBHOOK_URL else log_sender
+    d = Dispatcher(engine, deliver)
+    try:
+        if once:
+            print(f"dispatched {await d.run_once()}")
+        else:
+            await d.run_forever()
+    finally:
+        await http.aclose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="deliver outbox rows")
+    ap.add_argument("--once", action="store_true", help="只领取并投递一批后退出")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if OUTBOX_METRICS_PORT:
+        start_http_server(int(OUTBOX_METRICS_PORT))
+    asyncio.run(main(once=args.once))
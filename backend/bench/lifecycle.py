@@ -0,0 +1,195 @@
+# backend/bench/lifecycle.py
+"""
+订单全流程压测：create -> get -> review -> accept -> complete
+
+用法（在 backend/ 下运行）：
+    # 进程内 ASGI（不起 uvicorn，直接打 app.main:app，数据库用 DATABASE_URL）
+    python -m bench.lifecycle -n 500 -c 20
+    # 打一个已启动的服务（uvicorn app.main:app + 本地 Postgres）
+    python -m bench.lifecycle -n 500 -c 20 --base-url http://localhost:8000
+    # 存基线 / 回归模式（比基线差超过阈值则退出码 1）
+    python -m bench.lifecycle -n 500 -c 20 --save-baseline bench/baseline.json
+    python -m bench.lifecycle -n 500 -c 20 --baseline bench/baseline.json --tolerance 0.2
+
+输出每个接口的 p50/p95/p99 延迟（毫秒）与吞吐（次/秒）
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]  # .../backend
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+STEPS = ("create", "get", "review", "accept", "complete")
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩百分位"""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = max(0, math.ceil(p / 100 * len(s)) - 1)
+    return s[k]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {s: [] for s in STEPS}
+        self.errors: Dict[str, int] = {s: 0 for s in STEPS}
+
+    async def call(self, step: str, coro) -> Optional[dict]:
+        t0 = time.perf_counter()
+        try:
+            r = await coro
+        except httpx.HTTPError:
+            self.errors[step] += 1
+            return None
+        self.samples[step].append(time.perf_counter() - t0)
+        if r.status_code >= 400:
+            self.errors[step] += 1
+            return None
+        return r.json()
+
+
+async def one_lifecycle(c: httpx.AsyncClient, rec: Recorder, seq: int) -> bool:
+    data = await rec.call("create", c.post("/api/orders", json={
+        "game_name": "BENCH",
+        "amount_cents": 1000 + seq % 100,
+        "duration_hours": "1.50",
+        "boss_kook_id": f"bench_boss_{seq % 50}",
+        "boss_kook_name": f"bench_boss#{seq % 50}",
+    }))
+    if not data:
+        return False
+    oid = data["id"]
+    if not await rec.call("get", c.get(f"/api/orders/{oid}")):
+        return False
+    if not await rec.call("review", c.post(f"/api/orders/{oid}/review", json={
+        "reviewer_kook_id": "bench_reviewer", "approve": True, "reason": "bench",
+    })):
+        return False
+    if not await rec.call("accept", c.post(f"/api/orders/{oid}/accept", json={
+        "player_kook_id": f"bench_player_{seq % 20}",
+        "player_kook_name": f"bench_player#{seq % 20}",
+    })):
+        return False
+    return bool(await rec.call("complete", c.post(f"/api/orders/{oid}/complete", json={
+        "actor_kook_id": f"bench_player_{seq % 20}",
+    })))
+
+
+def make_client(base_url: Optional[str], concurrency: int) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if base_url:
+        return httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits)
+    from app.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30)
+
+
+async def run(total: int, concurrency: int, base_url: Optional[str], warmup: int) -> dict:
+    async with make_client(base_url, concurrency) as c:
+        # 预热：建连接 / 填缓存，不计入结果
+        warm = Recorder()
+        for i in range(warmup):
+            await one_lifecycle(c, warm, -1 - i)
+
+        rec = Recorder()
+        counter = iter(range(total))
+        ok = 0
+
+        async def worker():
+            nonlocal ok
+            for seq in counter:
+                done = await one_lifecycle(c, rec, seq)
+                ok += done
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    report = {
+        "total": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "lifecycles_ok": ok,
+        "lifecycles_per_s": round(ok / elapsed, 2) if elapsed else 0.0,
+        "endpoints": {},
+    }
+    for step in STEPS:
+        xs = rec.samples[step]
+        report["endpoints"][step] = {
+            "count": len(xs),
+            "errors": rec.errors[step],
+            "p50_ms": round(percentile(xs, 50) * 1000, 3),
+            "p95_ms": round(percentile(xs, 95) * 1000, 3),
+            "p99_ms": round(percentile(xs, 99) * 1000, 3),
+            "rps": round(len(xs) / elapsed, 2) if elapsed else 0.0,
+        }
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"lifecycles: {report['lifecycles_ok']}/{report['total']}  "
+          f"concurrency={report['concurrency']}  elapsed={report['elapsed_s']}s  "
+          f"{report['lifecycles_per_s']} lifecycles/s")
+    print(f"{'endpoint':<10}{'count':>8}{'err':>6}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}{'rps':>10}")
+    for step, e in report["endpoints"].items():
+        print(f"{step:<10}{e['count']:>8}{e['errors']:>6}{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}{e['rps']:>10}")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """回归判定：任一接口 p95 变慢或吞吐下降超过 tolerance（比例）即视为退化"""
+    problems = []
+    for step, base in baseline.get("endpoints", {}).items():
+        cur = report["endpoints"].get(step)
+        if not cur:
+            continue
+        if base["p95_ms"] and cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{step}: p95 {cur['p95_ms']}ms > baseline {base['p95_ms']}ms (+{tolerance:.0%})")
+        if base["rps"] and cur["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"{step}: rps {cur['rps']} < baseline {base['rps']} (-{tolerance:.0%})")
+        if cur["errors"] > base.get("errors", 0):
+            problems.append(f"{step}: errors {cur['errors']} > baseline {base.get('errors', 0)}")
+    return problems
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="订单全流程压测")
+    ap.add_argument("-n", "--total", type=int, default=200, help="完整流程次数")
+    ap.add_argument("-c", "--concurrency", type=int, default=10, help="并发数")
+    ap.add_argument("--warmup", type=int, default=5, help="预热流程次数（不计入）")
+    ap.add_argument("--base-url", default=None, help="打已启动的服务；不填则进程内 ASGI")
+    ap.add_argument("--json", dest="json_out", default=None, help="把结果写到 JSON 文件")
+    ap.add_argument("--save-baseline", default=None, help="把本次结果存为基线")
+    ap.add_argument("--baseline", default=None, help="回归模式：与基线比较")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="回归阈值（比例），默认 0.2")
+    args = ap.parse_args(argv)
+
+    report = asyncio.run(run(args.total, args.concurrency, args.base_url, args.warmup))
+    print_report(report)
+
+    for path in (args.json_out, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.baseline:
+        problems = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        if problems:
+            print("REGRESSION:")
+            for p in problems:
+                print("  " + p)
+            return 1
+        print("OK: within baseline tolerance")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,126 @@
+# backend/bench/serialize.py
+"""
+响应序列化微基准：每个请求花在「订单 -> 响应字节」上的 CPU
+
+用法（在 backend/ 下运行，不需要数据库）：
+    python -m bench.serialize
+    python -m bench.serialize -n 20000 --page-size 100
+
+对比两条路径（同一批内存中的 Order 对象）：
+    old：to_order_out -> FastAPI serialize_response(response_model) -> JSONResponse（标准库 json）
+    new：order_dict -> app.fastjson.json_response（orjson，一次完成）
+分别测单条订单（GET /api/orders/{id}、流转接口）与一页列表（GET /api/orders），
+并校验两条路径解析后的 JSON 完全一致
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, List
+
+ROOT = Path(__file__).resolve().parents[1]  # .../backend
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from app.fastjson import json_response  # noqa: E402
+from app.models import Order, OrderStatus  # noqa: E402
+from app.schemas import OrderOut, OrderPage, order_dict, to_order_out  # noqa: E402
+from app.services.orders import LIST_DEFAULT_LIMIT  # noqa: E402
+
+
+def sample_orders(n: int) -> List[Order]:
+    t0 = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+    return [
+        Order(
+            id=1_000_000 + i,
+            game_name="CS2" if i % 3 else "瓦罗兰特",
+            amount_cents=3000 + i % 500,
+            duration_hours=Decimal("1.50"),
+            boss_kook_id=str(174142457 + i % 97),
+            boss_kook_name=f"老板{i % 97}#1234",
+            player_kook_id=str(2000 + i % 41) if i % 2 else None,
+            player_kook_name=f"陪玩{i % 41}#0001" if i % 2 else None,
+            status=OrderStatus.IN_PROGRESS if i % 2 else OrderStatus.REVIEW_APPROVED,
+            extra={"note": "上分", "dispatched": bool(i % 2)},
+            created_at=t0 + timedelta(seconds=i),
+            updated_at=t0 + timedelta(seconds=i, milliseconds=250),
+        )
+        for i in range(n)
+    ]
+
+
+ORDER_FIELD = create_model_field("Response_order", OrderOut, mode="serialization")
+PAGE_FIELD = create_model_field("Response_page", OrderPage, mode="serialization")
+
+
+async def old_single(o: Order) -> bytes:
+    content = await serialize_response(field=ORDER_FIELD, response_content=to_order_out(o))
+    return JSONResponse(content).body
+
+
+async def old_page(orders: List[Order]) -> bytes:
+    page = OrderPage(items=[to_order_out(o) for o in orders], next_cursor="abc")
+    content = await serialize_response(field=PAGE_FIELD, response_content=page)
+    return JSONResponse(content).body
+
+
+async def new_single(o: Order) -> bytes:
+    return json_response(order_dict(o)).body
+
+
+async def new_page(orders: List[Order]) -> bytes:
+    return json_response({"items": [order_dict(o) for o in orders], "next_cursor": "abc"}).body
+
+
+async def cpu_per_call(fn: Callable, args: list, iterations: int) -> float:
+    """每次调用的 CPU 微秒数（process_time，不受其他进程影响）"""
+    for a in args[:50]:
+        await fn(a)  # 预热
+    t0 = time.process_time()
+    for i in range(iterations):
+        await fn(args[i % len(args)])
+    return (time.process_time() - t0) / iterations * 1e6
+
+
+async def run(n: int, page_size: int) -> int:
+    orders = sample_orders(max(page_size, 1000))
+    pages = [orders[i:i + page_size] for i in range(0, len(orders) - page_size + 1, page_size)]
+
+    # 两条路径的输出必须等价（字节可以不同：空格 / 时间格式以 json.loads 后比较）
+    for o in orders[:100]:
+        if json.loads(await old_single(o)) != json.loads(await new_single(o)):
+            print(f"MISMATCH single order {o.id}")
+            return 1
+    if json.loads(await old_page(pages[0])) != json.loads(await new_page(pages[0])):
+        print("MISMATCH page")
+        return 1
+
+    page_iters = max(1, n // page_size)
+    rows = [
+        ("single", await cpu_per_call(old_single, orders, n), await cpu_per_call(new_single, orders, n)),
+        (f"page({page_size})", await cpu_per_call(old_page, pages, page_iters), await cpu_per_call(new_page, pages, page_iters)),
+    ]
+    print(f"{'case':<12}{'old us':>12}{'new us':>12}{'saved us':>12}{'speedup':>10}")
+    for case, old, new in rows:
+        print(f"{case:<12}{old:>12.1f}{new:>12.1f}{old - new:>12.1f}{old / new:>9.1f}x")
+    return 0
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="响应序列化微基准")
+    ap.add_argument("-n", "--iterations", type=int, default=10000, help="单条订单的迭代次数")
+    ap.add_argument("--page-size", type=int, default=LIST_DEFAULT_LIMIT, help="列表每页条数，默认 LIST_DEFAULT_LIMIT")
+    args = ap.parse_args(argv)
+    return asyncio.run(run(args.iterations, args.page_size))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,47 +1,35 @@
-from datetime import datetime
-from app.db import get_session
-from app.models import User, Order, OrderAudit, Receipt, UserRole, OrderStatus, ReceiptType
+# backend/scripts/demo_flow.py
+import sys
+from decimal import Decimal
+from pathlib import Path
 
-def main():
-    with get_session() as s:
-        # 1) 新建用户（若不存在）
-        u = s.query(User).filter_by(kook_id="kook_1001").one_or_none()
-        if not u:
-            u = User(kook_id="kook_1001", name="Demo User", role=UserRole.PLAYER)
-            s.add(u)
-            s.flush()  # 拿到 u.id
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
 
-        # 2) 下单
-        o = Order(
-            user_id=u.id,
-            amount=9.99,
-            status=OrderStatus.PENDING,
-            created_at=datetime.utcnow()
-        )
-        s.add(o); s.flush()
+from dotenv import load_dotenv
+load_dotenv(ROOT / ".env")
 
-        # 3) 写审计
-        s.add(OrderAudit(
-            order_id=o.id,
-            action="CREATE",
-            note="initial create",
-            created_at=datetime.utcnow()
-        ))
+from app.db import get_session
+from app.schemas import CreateOrderIn
+from app.services.orders import create_orders, review_order, accept_order, complete_order
 
-        # 4) 开收据
-        s.add(Receipt(
-            order_id=o.id,
-            user_id=u.id,
-            type=ReceiptType.PAYMENT,
-            amount=o.amount,
-            created_at=datetime.utcnow()
-        ))
+def main():
+    with get_session() as s:
+        # 1) 下单（PENDING_REVIEW，同时写审计）
+        [o] = create_orders(s, [CreateOrderIn(
+            game_name="DEMO",
+            amount_cents=3000,
+            duration_hours=Decimal("1.50"),
+            boss_kook_id="kook_boss_001",
+            boss_kook_name="Boss A",
+        )])
 
-        # 5) 更新订单为已支付
-        o.status = OrderStatus.PAID
+        # 2) 审核通过 -> 3) 接单 -> 4) 完成（生成回执）
+        review_order(s, o.id, reviewer_kook_id="kook_admin_001", approve=True)
+        accept_order(s, o.id, player_kook_id="kook_player_001", player_kook_name="Player A")
+        o = complete_order(s, o.id, actor_kook_id="kook_player_001")
 
-        s.commit()
-        print("Demo flow OK. order_id=", o.id)
+        print("Demo flow OK. order_id=", o.id, "status=", o.status.value)
 
 if __name__ == "__main__":
     main()
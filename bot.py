@@ -1,11 +1,24 @@
 import os
+import json
+import logging
 import re
+import time
+import random
 import asyncio
+import functools
+import contextvars
 import httpx
+from collections import OrderedDict, deque
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
 from dotenv import load_dotenv
 from khl import Bot, Message
+from khl.requester import HTTPRequester
 
 # ---------- 环境 ----------
+PROCESS_STARTED = time.monotonic()  # 启动预热日志里算「重启到就绪」
 load_dotenv()
 BOT_TOKEN = os.getenv('KOOK_BOT_TOKEN')
 BASE_URL  = os.getenv('BACKEND_BASE_URL', 'http://localhost:8000')
@@ -42,42 +55,450 @@ async def ensure_perm(msg: Message, *, need: str) -> bool:
     if need == 'operate':
         if is_operator(uid):
             return True
-        await msg.reply("❌ 无权限，此命令仅限【老板或客服】使用。")
+        reply(msg, "❌ 无权限，此命令仅限【老板或客服】使用。")
         return False
     if need == 'boss_only':
         if is_boss(uid):
             return True
-        await msg.reply("❌ 无权限，此命令仅限【老板】使用。")
+        reply(msg, "❌ 无权限，此命令仅限【老板】使用。")
         return False
-    await msg.reply("❌ 无权限。")
+    reply(msg, "❌ 无权限。")
     return False
 
+# ---------- 指标（Prometheus）----------
+# BOT_METRICS_PORT 非空时在该端口起一个 /metrics 监听
+BOT_METRICS_PORT = os.getenv("BOT_METRICS_PORT", "").strip()
+
+CMD_SECONDS = Histogram("bot_command_seconds", "命令总耗时", ["command"])
+CMD_KOOK_SECONDS = Histogram("bot_command_kook_seconds", "命令内 KOOK API 耗时", ["command"])
+CMD_BACKEND_SECONDS = Histogram("bot_command_backend_seconds", "命令内后端调用耗时", ["command"])
+CMD_ERRORS = Counter("bot_command_errors_total", "命令未捕获异常数", ["command"])
+KOOK_API_SECONDS = Histogram("bot_kook_api_seconds", "单次 KOOK API 请求耗时", ["route"])
+BACKEND_SECONDS = Histogram("bot_backend_seconds", "单次后端请求耗时", ["method"])
+
+# 当前命令的 {"kook": 秒, "backend": 秒}；不在命令内为 None
+_cmd_timing = contextvars.ContextVar("cmd_timing", default=None)
+
+# 启动预热完成（或超时）后置位；之前到达的命令先等它，见「7) 启动预热」
+bot_ready = asyncio.Event()
+
+def _add_timing(kind: str, seconds: float):
+    acc = _cmd_timing.get()
+    if acc is not None:
+        acc[kind] += seconds
+
+def instrumented(handler):
+    """命令耗时：总耗时 + 其中 KOOK API / 后端调用各占多少"""
+    name = handler.__name__.removesuffix('_cmd')
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        if not bot_ready.is_set():
+            await bot_ready.wait()
+        acc = {"kook": 0.0, "backend": 0.0}
+        token = _cmd_timing.set(acc)
+        t0 = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            CMD_ERRORS.labels(name).inc()
+            raise
+        finally:
+            CMD_SECONDS.labels(name).observe(time.perf_counter() - t0)
+            CMD_KOOK_SECONDS.labels(name).observe(acc["kook"])
+            CMD_BACKEND_SECONDS.labels(name).observe(acc["backend"])
+            _cmd_timing.reset(token)
+    return wrapper
+
 # ---- HTTP 客户端（全局复用）----
-client = httpx.AsyncClient(base_url=BASE_URL, timeout=10)
+def env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+# 连接池 / 协议：HTTP/2 只在 https 后端（如前置 TLS 反代）上生效，uvicorn 直连仍是 HTTP/1.1
+BACKEND_HTTP2           = env_flag("BACKEND_HTTP2")
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "20"))
+BACKEND_MAX_KEEPALIVE   = int(os.getenv("BACKEND_MAX_KEEPALIVE", "10"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "60"))
+# 按接口分超时（秒）：查询短、单条写入中、批量长；建连统一
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "2"))
+BACKEND_READ_TIMEOUT    = float(os.getenv("BACKEND_READ_TIMEOUT", "3"))
+BACKEND_WRITE_TIMEOUT   = float(os.getenv("BACKEND_WRITE_TIMEOUT", "5"))
+BACKEND_BATCH_TIMEOUT   = float(os.getenv("BACKEND_BATCH_TIMEOUT", "15"))
+# 重试（仅幂等请求：GET 与带 Idempotency-Key 的 POST）：指数退避 + 全抖动
+BACKEND_RETRIES       = int(os.getenv("BACKEND_RETRIES", "2"))
+BACKEND_BACKOFF_BASE  = float(os.getenv("BACKEND_BACKOFF_BASE", "0.2"))
+BACKEND_BACKOFF_MAX   = float(os.getenv("BACKEND_BACKOFF_MAX", "2"))
+# 熔断：连续失败 N 次后打开，期间直接失败；冷却后放一个探测请求
+BACKEND_BREAKER_THRESHOLD = int(os.getenv("BACKEND_BREAKER_THRESHOLD", "5"))
+BACKEND_BREAKER_COOLDOWN  = float(os.getenv("BACKEND_BREAKER_COOLDOWN", "15"))
+
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+BACKEND_RETRIES_TOTAL = Counter("bot_backend_retries_total", "后端请求重试次数", ["method"])
+BACKEND_FAST_FAILS = Counter("bot_backend_circuit_rejections_total", "熔断期间直接失败的请求数")
+BACKEND_OPEN_SECONDS = Counter("bot_backend_circuit_open_seconds_total", "熔断打开累计秒数")
+BACKEND_CIRCUIT_OPEN = Gauge("bot_backend_circuit_open", "熔断是否打开（1/0）")
+
+class BackendUnavailable(RuntimeError):
+    pass
+
+class CircuitBreaker:
+    """连续失败计数熔断：closed -> open -> (冷却后) half-open 探测 -> closed / open"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None    # 本轮打开（含探测失败后重开）的时间
+        self.open_since = None   # 首次打开时间，用于累计打开时长
+        self.probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self.probing and time.monotonic() - self.opened_at >= self.cooldown:
+            self.probing = True  # half-open：只放一个请求去探测
+            return True
+        return False
+
+    def record_success(self):
+        if self.open_since is not None:
+            BACKEND_OPEN_SECONDS.inc(time.monotonic() - self.open_since)
+        self.failures = 0
+        self.opened_at = self.open_since = None
+        self.probing = False
+        BACKEND_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            now = time.monotonic()
+            self.opened_at = now
+            if self.open_since is None:
+                self.open_since = now
+            self.probing = False
+            BACKEND_CIRCUIT_OPEN.set(1)
+
+class BackendClient:
+    """
+    机器人 -> 后端的唯一出口：
+      - 显式连接池上限 / keep-alive，可选 HTTP/2
+      - 按接口分超时
+      - 幂等请求遇到网络错误或 429/502/503/504 时抖动重试
+      - 熔断打开时直接失败，不再每条命令卡满超时
+    """
+
+    def __init__(self, base_url: str):
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            http2=BACKEND_HTTP2,
+            timeout=httpx.Timeout(BACKEND_WRITE_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=BACKEND_MAX_CONNECTIONS,
+                max_keepalive_connections=BACKEND_MAX_KEEPALIVE,
+                keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self.breaker = CircuitBreaker(BACKEND_BREAKER_THRESHOLD, BACKEND_BREAKER_COOLDOWN)
+
+    @staticmethod
+    def timeout_for(method: str, path: str) -> httpx.Timeout:
+        if method == "GET":
+            t = BACKEND_READ_TIMEOUT
+        elif path.endswith("/bulk") or path.endswith(":batch"):
+            t = BACKEND_BATCH_TIMEOUT
+        else:
+            t = BACKEND_WRITE_TIMEOUT
+        return httpx.Timeout(t, connect=BACKEND_CONNECT_TIMEOUT)
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        # full jitter：[0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(BACKEND_BACKOFF_MAX, BACKEND_BACKOFF_BASE * (2 ** attempt)))
 
-async def api_post(path: str, json: dict):
-    r = await client.post(path, json=json)
+    async def request(self, method: str, path: str, *, json=None, idempotency_key: str = None) -> httpx.Response:
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        # PUT 整体覆盖资源，重放无副作用，与 GET 一样可重试
+        retryable = method in ("GET", "PUT") or bool(idempotency_key)
+        attempts = 1 + (BACKEND_RETRIES if retryable else 0)
+        timeout = self.timeout_for(method, path)
+
+        t_start = time.perf_counter()
+        try:
+            for attempt in range(attempts):
+                if not self.breaker.allow():
+                    BACKEND_FAST_FAILS.inc()
+                    raise BackendUnavailable("后端暂不可用（熔断中），请稍后再试")
+                t0 = time.perf_counter()
+                try:
+                    r = await self.http.request(method, path, json=json, headers=headers, timeout=timeout)
+                except httpx.TransportError as e:
+                    self.breaker.record_failure()
+                    if attempt + 1 >= attempts:
+                        raise RuntimeError(f"后端请求失败：{type(e).__name__}") from e
+                else:
+                    if r.status_code < 500:
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.record_failure()
+                    if r.status_code not in RETRYABLE_STATUS or attempt + 1 >= attempts:
+                        return r
+                finally:
+                    BACKEND_SECONDS.labels(method).observe(time.perf_counter() - t0)
+                BACKEND_RETRIES_TOTAL.labels(method).inc()
+                await asyncio.sleep(self.backoff(attempt))
+        finally:
+            _add_timing("backend", time.perf_counter() - t_start)
+
+backend = BackendClient(BASE_URL)
+client = backend.http  # 运行结束时关闭
+
+def _raise_for_status(r: httpx.Response):
     if r.status_code >= 400:
         try:
             detail = r.json().get('detail', r.text)
         except Exception:
             detail = r.text
         raise RuntimeError(f'HTTP {r.status_code}: {detail}')
+
+async def api_post(path: str, json, idempotency_key: str = None):
+    r = await backend.request("POST", path, json=json, idempotency_key=idempotency_key)
+    _raise_for_status(r)
     return r.json()
 
+async def api_put(path: str, json):
+    r = await backend.request("PUT", path, json=json)
+    _raise_for_status(r)
+    return r.json()
+
+async def api_patch(path: str, json):
+    r = await backend.request("PATCH", path, json=json)
+    _raise_for_status(r)
+    return r.json()
+
+def idem_key(msg: Message) -> str:
+    """每条 KOOK 消息至多执行一次写操作：后端按此键去重，超时重试 / 事件重投都不会重复下单"""
+    return f"kook-msg:{msg.id}"
+
 async def api_get(path: str):
-    r = await client.get(path)
-    if r.status_code >= 400:
-        try:
-            detail = r.json().get('detail', r.text)
-        except Exception:
-            detail = r.text
-        raise RuntimeError(f'HTTP {r.status_code}: {detail}')
+    r = await backend.request("GET", path)
+    _raise_for_status(r)
     return r.json()
 
 # ---- 创建机器人 ----
 bot = Bot(token=BOT_TOKEN)
 
+def instrument_kook_requests(bot_obj: Bot):
+    """所有 KOOK API（fetch_user、reply 等）都经过 requester.request，在这里统一计时"""
+    requester = bot_obj.client.gate.requester
+    orig_request = requester.request
+
+    async def timed_request(method: str, route: str, **params):
+        t0 = time.perf_counter()
+        try:
+            return await orig_request(method, route, **params)
+        finally:
+            dt = time.perf_counter() - t0
+            KOOK_API_SECONDS.labels(route).observe(dt)
+            _add_timing("kook", dt)
+
+    requester.request = timed_request
+
+instrument_kook_requests(bot)
+
+# ---------- KOOK 出站消息队列 ----------
+# 命令处理函数只把回复交给队列就返回，不再在处理函数里等 KOOK 限速：
+#   - 每个频道一个令牌桶（REPLY_RATE 条/秒，突发 REPLY_BURST 条）+ 一个发送协程，频道内保持先后顺序
+#   - 发消息接口的响应头 X-Rate-Limit-Remaining/Reset：剩余额度 <= REPLY_RESERVE（或命中全局限速）时，
+#     所有频道暂停到窗口重置；被 429 拒绝时（khl 抛错前不读响应头）整批放回队首，指数退避后重发
+#   - 积压时把同一频道排队中的多条回复合并成一条 KMarkdown：每段前 @ 提问人（合并后没法逐条引用），
+#     段间分隔线，单条不超过 REPLY_COALESCE_MAX_CHARS
+REPLY_RATE               = float(os.getenv("REPLY_RATE", "1"))
+REPLY_BURST              = int(os.getenv("REPLY_BURST", "3"))
+REPLY_RESERVE            = int(os.getenv("REPLY_RESERVE", "5"))
+REPLY_COALESCE_MAX_CHARS = int(os.getenv("REPLY_COALESCE_MAX_CHARS", "4000"))
+REPLY_QUEUE_MAX          = int(os.getenv("REPLY_QUEUE_MAX", "200"))   # 单频道排队上限，超出直接丢弃
+REPLY_MAX_ATTEMPTS       = int(os.getenv("REPLY_MAX_ATTEMPTS", "4"))
+REPLY_BACKOFF_MAX        = float(os.getenv("REPLY_BACKOFF_MAX", "30"))
+
+SEND_ROUTES = {"message/create", "direct-message/create"}
+REPLY_SEPARATOR = "\n---\n"
+
+REPLY_QUEUE_DEPTH = Gauge("bot_reply_queue_depth", "排队 / 发送中的回复条数")
+REPLY_SECONDS = Histogram(
+    "bot_reply_seconds", "回复从入队到发出的耗时",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+REPLY_SENDS = Counter("bot_reply_sends_total", "实际发出的 KOOK 消息（single / coalesced）", ["kind"])
+REPLY_RESULTS = Counter("bot_replies_total", "回复结果（sent / dropped / failed）", ["result"])
+REPLY_THROTTLED = Counter("bot_reply_throttled_total", "因 KOOK 限速暂停发送的次数", ["reason"])
+
+class _Pending:
+    __slots__ = ("content", "quote", "author_id", "queued_at", "attempts", "future")
+
+    def __init__(self, content: str, quote, author_id, future: asyncio.Future):
+        self.content = content
+        self.quote = quote
+        self.author_id = author_id
+        self.queued_at = time.perf_counter()
+        self.attempts = 0
+        self.future = future
+
+    def part(self) -> str:
+        """合并发送时的一段"""
+        return f"(met){self.author_id}(met) {self.content}" if self.author_id else self.content
+
+class _ChannelQueue:
+    def __init__(self, channel):
+        self.channel = channel
+        self.items = deque()
+        self.tokens = float(REPLY_BURST)
+        self.refilled = time.monotonic()
+        self.task = None
+
+    def take_token(self) -> float:
+        """取一个令牌；不够时返回还需等待的秒数（此时不扣）"""
+        now = time.monotonic()
+        self.tokens = min(float(REPLY_BURST), self.tokens + (now - self.refilled) * REPLY_RATE)
+        self.refilled = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / REPLY_RATE
+
+def is_rate_limited(e: Exception) -> bool:
+    if not isinstance(e, HTTPRequester.APIRequestFailed):
+        return False
+    return e.err_code == 429 or "limit" in str(e.err_message).lower() or "频繁" in str(e.err_message)
+
+class ReplyScheduler:
+    def __init__(self):
+        self.queues = {}            # 频道 ID -> _ChannelQueue，队列清空后发送协程退出并移除
+        self.paused_until = 0.0     # monotonic；限速窗口内所有频道都不发
+
+    def submit(self, channel, content: str, *, quote: str = None, author_id: str = None) -> asyncio.Future:
+        """入队并立即返回；future 在发出后为 True，丢弃 / 失败为 False（不抛异常）"""
+        fut = asyncio.get_running_loop().create_future()
+        cq = self.queues.get(channel.id)
+        if cq is None:
+            cq = self.queues[channel.id] = _ChannelQueue(channel)
+        if len(cq.items) >= REPLY_QUEUE_MAX:
+            REPLY_RESULTS.labels("dropped").inc()
+            logging.warning("reply queue for channel %s full, dropping reply", channel.id)
+            fut.set_result(False)
+            return fut
+        cq.items.append(_Pending(content, quote, None if author_id is None else str(author_id), fut))
+        REPLY_QUEUE_DEPTH.inc()
+        if cq.task is None:
+            # 不继承调用方命令的计时上下文：发送耗时单独记在 bot_reply_seconds
+            cq.task = asyncio.create_task(self._drain(channel.id, cq), context=contextvars.Context())
+        return fut
+
+    def pause(self, seconds: float, reason: str):
+        until = time.monotonic() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            REPLY_THROTTLED.labels(reason).inc()
+
+    def observe(self, route: str, headers):
+        """发消息接口的限速响应头（由 watch_kook_rate_limits 转进来）"""
+        if route not in SEND_ROUTES or "X-Rate-Limit-Remaining" not in headers:
+            return
+        try:
+            remaining = int(headers["X-Rate-Limit-Remaining"])
+            reset = float(headers.get("X-Rate-Limit-Reset", 1))
+        except ValueError:
+            return
+        if remaining <= REPLY_RESERVE or "X-Rate-Limit-Global" in headers:
+            self.pause(reset, "headers")
+
+    @staticmethod
+    def _take(cq: _ChannelQueue):
+        """队首一条；后面还有积压时，在长度上限内尽量多带几条合并发送"""
+        batch = [cq.items.popleft()]
+        size = len(batch[0].part())
+        while cq.items:
+            size += len(REPLY_SEPARATOR) + len(cq.items[0].part())
+            if size > REPLY_COALESCE_MAX_CHARS:
+                break
+            batch.append(cq.items.popleft())
+        return batch
+
+    @staticmethod
+    def _finish(batch, ok: bool):
+        now = time.perf_counter()
+        for p in batch:
+            REPLY_QUEUE_DEPTH.dec()
+            REPLY_RESULTS.labels("sent" if ok else "failed").inc()
+            if ok:
+                REPLY_SECONDS.observe(now - p.queued_at)
+            if not p.future.done():
+                p.future.set_result(ok)
+
+    async def _send(self, channel, batch):
+        if len(batch) == 1:
+            p = batch[0]
+            kwargs = {"quote": p.quote} if p.quote else {}
+            await channel.send(p.content, **kwargs)
+            REPLY_SENDS.labels("single").inc()
+        else:
+            await channel.send(REPLY_SEPARATOR.join(p.part() for p in batch))
+            REPLY_SENDS.labels("coalesced").inc()
+
+    async def _drain(self, key: str, cq: _ChannelQueue):
+        try:
+            while cq.items:
+                while (delay := cq.take_token()) > 0:
+                    await asyncio.sleep(delay)
+                while (delay := self.paused_until - time.monotonic()) > 0:
+                    await asyncio.sleep(delay)
+                batch = self._take(cq)
+                try:
+                    await self._send(cq.channel, batch)
+                except Exception as e:
+                    attempts = max(p.attempts for p in batch) + 1
+                    if is_rate_limited(e) and attempts < REPLY_MAX_ATTEMPTS:
+                        for p in batch:
+                            p.attempts = attempts
+                        cq.items.extendleft(reversed(batch))
+                        self.pause(random.uniform(0.5, 1) * min(REPLY_BACKOFF_MAX, 2 ** attempts), "429")
+                        continue
+                    logging.warning("reply to channel %s not sent (%d msgs): %s", key, len(batch), e)
+                    self._finish(batch, False)
+                else:
+                    self._finish(batch, True)
+        finally:
+            # 只会在队列已空或被取消时到这里；取消时剩下的回复判为失败
+            if cq.items:
+                self._finish(list(cq.items), False)
+                cq.items.clear()
+            if self.queues.get(key) is cq:
+                del self.queues[key]
+
+def watch_kook_rate_limits(bot_obj: Bot, scheduler: ReplyScheduler):
+    """khl 自带的 RateLimiter 会读限速响应头，这里顺带转给出站队列"""
+    limiter = bot_obj.client.gate.requester._ratelimiter
+    if limiter is None:
+        return
+    orig_update = limiter.update
+
+    async def update(route, headers):
+        scheduler.observe(route, headers)
+        return await orig_update(route, headers)
+
+    limiter.update = update
+
+replies = ReplyScheduler()
+watch_kook_rate_limits(bot, replies)
+
+def reply(msg: Message, content: str) -> asyncio.Future:
+    """命令回复统一走出站队列（引用原消息）；处理函数不必 await"""
+    return replies.submit(msg.ctx.channel, content, quote=msg.id, author_id=msg.author.id)
+
 # ---------- KOOK 工具 ----------
 MENTION_RE = re.compile(r"\(met\)(\d+)\(met\)")
 
@@ -98,31 +519,127 @@ def parse_kook_id(arg: str, author_id: str) -> str:
         return arg
     raise RuntimeError("用户参数既不是 @提及 也不是纯数字 ID，也不是 @me")
 
+# ---- 用户标签缓存（TTL + LRU）----
+KOOK_TAG_CACHE_SIZE = int(os.getenv("KOOK_TAG_CACHE_SIZE", "2048"))
+KOOK_TAG_TTL        = float(os.getenv("KOOK_TAG_TTL", "600"))     # 成功结果缓存秒数
+KOOK_TAG_NEG_TTL    = float(os.getenv("KOOK_TAG_NEG_TTL", "30"))  # 失败（回退数字ID）缓存秒数
+
+class KookTagCache:
+    """
+    进程内 KOOK 标签缓存：
+      - OrderedDict 实现 LRU，超过 maxsize 淘汰最久未用
+      - 成功结果按 ttl 过期；失败结果按 neg_ttl 过期（负缓存，避免反复打 KOOK）
+      - 同一 ID 的并发查询只发一次 fetch_user（single-flight）
+    """
+
+    def __init__(self, maxsize: int, ttl: float, neg_ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.neg_ttl = neg_ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # kook_id -> (tag, expires_at)
+        self._inflight: dict = {}                               # kook_id -> Future
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def get(self, kook_id: str):
+        item = self._data.get(kook_id)
+        if item is None:
+            return None
+        tag, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[kook_id]
+            return None
+        self._data.move_to_end(kook_id)
+        return tag
+
+    def put(self, kook_id: str, tag: str, ttl: float):
+        self._data[kook_id] = (tag, time.monotonic() + ttl)
+        self._data.move_to_end(kook_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_load(self, kook_id: str, loader) -> str:
+        tag = self.get(kook_id)
+        if tag is not None:
+            self.hits += 1
+            return tag
+        fut = self._inflight.get(kook_id)
+        if fut is not None:
+            # 已有同 ID 的查询在路上：等它的结果，不重复请求
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[kook_id] = fut
+        try:
+            try:
+                tag = await loader(kook_id)
+                self.put(kook_id, tag, self.ttl)
+            except Exception:
+                self.failures += 1
+                tag = kook_id
+                self.put(kook_id, tag, self.neg_ttl)
+            fut.set_result(tag)
+            return tag
+        finally:
+            self._inflight.pop(kook_id, None)
+            if not fut.done():
+                fut.cancel()  # 自身被取消时，别让等待者永远挂住
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "inflight": len(self._inflight),
+        }
+
+kook_tag_cache = KookTagCache(KOOK_TAG_CACHE_SIZE, KOOK_TAG_TTL, KOOK_TAG_NEG_TTL)
+
+_tag_cache_gauge = Gauge("bot_kook_tag_cache", "KOOK 标签缓存计数", ["stat"])
+for _stat in ("size", "hits", "misses", "coalesced", "failures"):
+    _tag_cache_gauge.labels(_stat).set_function(lambda s=_stat: kook_tag_cache.stats()[s])
+
+async def fetch_kook_tag(bot_obj: Bot, kook_id: str) -> str:
+    """直接请求 KOOK：数字ID -> '用户名#识别码'（失败抛异常）"""
+    u = await bot_obj.client.fetch_user(str(kook_id))
+    name  = getattr(u, "username", None) or getattr(u, "name", None) or "unknown"
+    ident = getattr(u, "identify_num", None) or getattr(u, "identify_num_", None)
+    return f"{name}#{ident}" if ident else name
+
 async def get_kook_tag(bot_obj: Bot, kook_id: str) -> str:
     """
     KOOK 数字ID -> '用户名#识别码'；失败则回退数字ID
+    走 kook_tag_cache，命中时不出进程
     """
-    try:
-        u = await bot_obj.client.fetch_user(str(kook_id))
-        name  = getattr(u, "username", None) or getattr(u, "name", None) or "unknown"
-        ident = getattr(u, "identify_num", None) or getattr(u, "identify_num_", None)
-        return f"{name}#{ident}" if ident else name
-    except Exception:
-        return str(kook_id)
+    return await kook_tag_cache.get_or_load(
+        str(kook_id), lambda kid: fetch_kook_tag(bot_obj, kid)
+    )
 
 # ---------- 帮助 ----------
 HELP_TEXT = (
     "🧾 **Kook 订单指令**\n"
     "`/order <游戏名> <时长（小时）> <金额(元)> <@老板>`  创建订单\n"
+    "`/orderbatch` 换行后每行一单：`<游戏名> <时长> <金额> <@老板>`  批量创建\n"
     "`/review <订单ID> <ok|no> [原因]`  审核通过/驳回\n"
     "`/accept <订单ID> <@陪玩>`  接单并绑定陪玩\n"
     "`/done <订单ID>`  完成订单\n"
+    "（review/accept/done 的订单ID 支持批量：`101-120`、`5,6,7`）\n"
     "`/info <订单ID>`  查看订单详情\n"
+    "`/report [天数|YYYY-MM-DD|起~止] [游戏名]`  营收与陪玩工作量报表（默认最近 7 天）\n"
+    "`/player <@陪玩> <游戏1,游戏2> [同时接单上限]`  登记陪玩可接的游戏；`/player <@陪玩> on|off` 上线/下线\n"
+    "`/queue`  查看待派队列（审核通过的订单会自动派给空闲陪玩）\n"
 )
 
 @bot.command(name='help')
+@instrumented
 async def help_cmd(msg: Message):
-    await msg.reply(HELP_TEXT)
+    reply(msg, HELP_TEXT)
 
 def parse_int(x: str, name: str) -> int:
     try:
@@ -139,8 +656,48 @@ def parse_hours(x: str) -> float:
         raise RuntimeError('参数 `hours` 必须大于 0')
     return round(val, 2)  # 与 Numeric(6,2) 对齐
 
+BATCH_MAX = 200  # 与后端 BULK_MAX 对齐
+
+def parse_id_spec(spec: str) -> list:
+    """
+    订单ID 列表：'5' / '5,6,7' / '101-120' / '1-3,8'
+    返回去重后保持顺序的 int 列表
+    """
+    ids = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = (parse_int(x.strip(), 'id') for x in part.split('-', 1))
+            if hi < lo:
+                raise RuntimeError(f'区间 `{part}` 起止颠倒')
+            if hi - lo + 1 > BATCH_MAX:
+                raise RuntimeError(f'一次最多 {BATCH_MAX} 个订单')
+            ids.extend(range(lo, hi + 1))
+        else:
+            ids.append(parse_int(part, 'id'))
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise RuntimeError('缺少订单ID')
+    if len(ids) > BATCH_MAX:
+        raise RuntimeError(f'一次最多 {BATCH_MAX} 个订单')
+    return ids
+
+def format_batch(title: str, results: list) -> str:
+    """批量接口逐个 ID 的结果 -> 汇总文本：成功的合并成一行，失败的逐条列出"""
+    ok = [str(r['id']) for r in results if r.get('ok')]
+    lines = [f"{title}：成功 {len(ok)} / 共 {len(results)}"]
+    if ok:
+        lines.append(f"✅ {','.join(ok)}")
+    for r in results:
+        if not r.get('ok'):
+            lines.append(f"❌ ID={r['id']}：{r.get('error')}")
+    return "\n".join(lines)
+
 # ---------- 1) 创建订单：最后一参为 @老板 ----------
 @bot.command(name='order')
+@instrumented
 async def order_cmd(msg: Message, game: str=None, hours: str=None, cents: str=None, boss_arg: str=None):
     # 权限：老板或客服
     if not await ensure_perm(msg, need='operate'):
@@ -150,7 +707,7 @@ async def order_cmd(msg: Message, game: str=None, hours: str=None, cents: str=No
     """
     try:
         if not all([game, hours, cents, boss_arg]):
-            await msg.reply("用法：`/order <game> <hours> <cents> <@老板|老板_id|@me>`（hours 支持小数，如 1.5）")
+            reply(msg, "用法：`/order <game> <hours> <cents> <@老板|老板_id|@me>`（hours 支持小数，如 1.5）")
             return
 
         duration_hours = parse_hours(hours)
@@ -165,40 +722,118 @@ async def order_cmd(msg: Message, game: str=None, hours: str=None, cents: str=No
             "duration_hours": duration_hours,
             "boss_kook_id": boss_kook_id,
             "boss_kook_name": boss_kook_name
-        })
-        await msg.reply(
+        }, idempotency_key=idem_key(msg))
+        reply(msg,
             f"✅ 订单创建成功：ID={data.get('id')}，老板={boss_kook_name}（{boss_kook_id}），"
             f"状态={data.get('status')}"
         )
     except Exception as e:
-        await msg.reply(f"❌ 创建失败：{e}")
+        reply(msg, f"❌ 创建失败：{e}")
+
+# ---------- 1b) 批量创建：每行一单 ----------
+def parse_order_line(line: str, author_id: str) -> dict:
+    """'<game> <hours> <cents> <@老板|老板_id|@me>' -> 订单字段（不含老板昵称）"""
+    parts = line.split()
+    if len(parts) != 4:
+        raise RuntimeError("格式应为 `<game> <hours> <cents> <@老板|老板_id|@me>`")
+    game, hours, cents, boss_arg = parts
+    return {
+        "game_name": game,
+        "duration_hours": parse_hours(hours),
+        "amount_cents": parse_int(cents, 'cents'),
+        "boss_kook_id": parse_kook_id(boss_arg, author_id),
+    }
+
+@bot.command(name='orderbatch')
+@instrumented
+async def orderbatch_cmd(msg: Message, *args):
+    # 权限：老板或客服
+    if not await ensure_perm(msg, need='operate'):
+        return
+    """
+    /orderbatch
+    LOL 1.5 3000 @老板A
+    CS2 2 5000 174142457
+    """
+    # 命令参数会被按空白拆开，这里直接按行解析原始消息，第一行是命令本身
+    lines = [ln.strip() for ln in (msg.content or "").splitlines()[1:] if ln.strip()]
+    if not lines:
+        reply(msg, "用法：`/orderbatch` 换行后每行一单：`<game> <hours> <cents> <@老板|老板_id|@me>`")
+        return
+    if len(lines) > BATCH_MAX:
+        reply(msg, f"❌ 一次最多 {BATCH_MAX} 单，当前 {len(lines)} 行")
+        return
+
+    results = {}  # 行号 -> 结果文本
+    parsed = []   # (行号, 订单字段)
+    for no, line in enumerate(lines, 1):
+        try:
+            parsed.append((no, parse_order_line(line, msg.author.id)))
+        except Exception as e:
+            results[no] = f"❌ 第{no}行：{e}"
+
+    if parsed:
+        # 所有老板标签并发反查（同一老板只查一次，且走标签缓存）
+        boss_ids = list({o["boss_kook_id"] for _, o in parsed})
+        tags = dict(zip(boss_ids, await asyncio.gather(*(get_kook_tag(bot, b) for b in boss_ids))))
+        for _, o in parsed:
+            o["boss_kook_name"] = tags[o["boss_kook_id"]]
+
+        try:
+            created = await api_post("/api/orders/bulk", [o for _, o in parsed], idempotency_key=idem_key(msg))
+            for (no, o), data in zip(parsed, created):
+                results[no] = (
+                    f"✅ 第{no}行：ID={data.get('id')}，{o['game_name']}，"
+                    f"老板={o['boss_kook_name']}（{o['boss_kook_id']}）"
+                )
+        except Exception as e:
+            # 后端整批一个事务：失败则这些行都没有写入
+            for no, _ in parsed:
+                results[no] = f"❌ 第{no}行：{e}"
+
+    ok = sum(1 for r in results.values() if r.startswith("✅"))
+    summary = f"🧾 批量创建：成功 {ok} / 共 {len(lines)}"
+    reply(msg, "\n".join([summary] + [results[no] for no in sorted(results)]))
 
 # ---------- 2) 审核 ----------
 @bot.command(name='review')
+@instrumented
 async def review_cmd(msg: Message, order_id: str=None, decision: str=None, *reason_parts):
     # 权限：老板或客服
     if not await ensure_perm(msg, need='operate'):
         return
     try:
         if not order_id or decision not in ('ok', 'no'):
-            await msg.reply("用法：`/review <订单ID> <ok|no> [原因]`")
+            reply(msg, "用法：`/review <订单ID|101-120|5,6,7> <ok|no> [原因]`")
             return
-        oid = parse_int(order_id, 'id')
+        ids = parse_id_spec(order_id)
         approve = decision == 'ok'
         reviewer_kook_id = msg.author.id
         reason = ' '.join(reason_parts) if reason_parts else ('approved' if approve else 'rejected')
 
+        if len(ids) > 1:
+            data = await api_post("/api/orders/review:batch", {
+                "order_ids": ids,
+                "reviewer_kook_id": str(reviewer_kook_id),
+                "approve": approve,
+                "reason": reason
+            }, idempotency_key=idem_key(msg))
+            reply(msg, format_batch("🪪 批量审核", data.get('results', [])))
+            return
+
+        oid = ids[0]
         data = await api_post(f"/api/orders/{oid}/review", {
             "reviewer_kook_id": str(reviewer_kook_id),
             "approve": approve,
             "reason": reason
-        })
-        await msg.reply(f"🪪 审核结果：ID={data.get('id')}，状态={data.get('status')}")
+        }, idempotency_key=idem_key(msg))
+        reply(msg, f"🪪 审核结果：ID={data.get('id')}，状态={data.get('status')}")
     except Exception as e:
-        await msg.reply(f"❌ 审核失败：{e}")
+        reply(msg, f"❌ 审核失败：{e}")
 
 # ---------- 3) 接单 ----------
 @bot.command(name='accept')
+@instrumented
 async def accept_cmd(msg: Message, order_id: str=None, player_arg: str=None):
     # 权限：老板或客服（陪玩不需要使用机器人）
     if not await ensure_perm(msg, need='operate'):
@@ -213,62 +848,85 @@ async def accept_cmd(msg: Message, order_id: str=None, player_arg: str=None):
     """
     try:
         if not order_id or not player_arg:
-            await msg.reply("用法：`/accept <订单ID> <@陪玩|陪玩_id|@me>`（必须指定）")
+            reply(msg, "用法：`/accept <订单ID|101-120|5,6,7> <@陪玩|陪玩_id|@me>`（必须指定）")
             return
-        oid = parse_int(order_id, 'id')
+        ids = parse_id_spec(order_id)
 
         # 解析 KOOK 数字ID
         player_kook_id = parse_kook_id(player_arg, msg.author.id)
         # 反查“用户名#识别码”
         player_kook_name = await get_kook_tag(bot, player_kook_id)
 
+        if len(ids) > 1:
+            data = await api_post("/api/orders/accept:batch", {
+                "order_ids": ids,
+                "player_kook_id": player_kook_id,
+                "player_kook_name": player_kook_name,
+                "payload": {"accepted_by": str(msg.author.id)}
+            }, idempotency_key=idem_key(msg))
+            reply(msg, format_batch(f"🎮 批量接单（陪玩={player_kook_name}）", data.get('results', [])))
+            return
+
+        oid = ids[0]
         data = await api_post(f"/api/orders/{oid}/accept", {
             "player_kook_id": player_kook_id,
             "player_kook_name": player_kook_name,
             "payload": {"accepted_by": str(msg.author.id)}
-        })
+        }, idempotency_key=idem_key(msg))
 
-        await msg.reply(
+        reply(msg,
             f"🎮 接单成功：ID={data.get('id')}，陪玩={player_kook_name}（{player_kook_id}），状态={data.get('status')}"
         )
     except Exception as e:
-        await msg.reply(f"❌ 接单失败：{e}")
+        reply(msg, f"❌ 接单失败：{e}")
 
 # ---------- 4) 完成 ----------
 @bot.command(name='done')
+@instrumented
 async def done_cmd(msg: Message, order_id: str=None):
     # 权限：老板或客服
     if not await ensure_perm(msg, need='operate'):
         return
     try:
         if not order_id:
-            await msg.reply("用法：`/done <订单ID>`")
+            reply(msg, "用法：`/done <订单ID|101-120|5,6,7>`")
             return
-        oid = parse_int(order_id, 'id')
+        ids = parse_id_spec(order_id)
         actor_kook_id = str(msg.author.id)
 
+        if len(ids) > 1:
+            data = await api_post("/api/orders/complete:batch", {
+                "order_ids": ids,
+                "actor_kook_id": actor_kook_id,
+                "payload": {"finished_by": actor_kook_id}
+            }, idempotency_key=idem_key(msg))
+            reply(msg, format_batch("✅ 批量完成", data.get('results', [])))
+            return
+
+        oid = ids[0]
         data = await api_post(f"/api/orders/{oid}/complete", {
             "actor_kook_id": actor_kook_id,
             "payload": {"finished_by": actor_kook_id}
-        })
-        await msg.reply(f"✅ 已完成：ID={data.get('id')}，状态={data.get('status')}")
+        }, idempotency_key=idem_key(msg))
+        reply(msg, f"✅ 已完成：ID={data.get('id')}，状态={data.get('status')}")
     except Exception as e:
-        await msg.reply(f"❌ 完成失败：{e}")
+        reply(msg, f"❌ 完成失败：{e}")
 
 # ---------- 5) 查询 ----------
 @bot.command(name='info')
+@instrumented
 async def info_cmd(msg: Message, order_id: str=None):
     # 权限：仅老板
     if not await ensure_perm(msg, need='boss_only'):
         return
     try:
         if not order_id:
-            await msg.reply("用法：`/info <订单ID>`")
+            reply(msg, "用法：`/info <订单ID>`")
             return
         oid = parse_int(order_id, 'id')
         data = await api_get(f"/api/orders/{oid}")
 
-        await msg.reply(
+        reply(msg,
             "🧾 订单 {oid}：game={game}，时长={dur}h，金额={amt}元，"
             "老板={bname}（{bid}），陪玩={pname}（{pid}），状态={st}".format(
                 oid=oid,
@@ -283,10 +941,284 @@ async def info_cmd(msg: Message, order_id: str=None):
             )
         )
     except Exception as e:
-        await msg.reply(f"❌ 查询失败：{e}")
+        reply(msg, f"❌ 查询失败：{e}")
+
+# ---------- 5b) 报表：读后端按天汇总表，只有老板能看 ----------
+REPORT_TZ = os.getenv("REPORT_TZ", "Asia/Shanghai")  # 与后端一致，决定“今天”是哪天
+REPORT_TOP_PLAYERS = 10
+
+def parse_report_range(spec: str = None) -> tuple:
+    """
+    '' -> 后端默认（最近 7 天）；'30' -> 最近 30 天（含今天）；
+    '2026-10-01' -> 当天；'2026-10-01~2026-10-15' -> 区间（含两端）
+    返回 (date_from, date_to)，缺省为 None
+    """
+    if not spec:
+        return None, None
+    if spec.isdigit():
+        days = int(spec)
+        if days <= 0:
+            raise RuntimeError('天数必须大于 0')
+        today = datetime.now(ZoneInfo(REPORT_TZ)).date()
+        return today - timedelta(days=days - 1), today
+    try:
+        lo, _, hi = spec.partition('~')
+        date_from = date.fromisoformat(lo.strip())
+        date_to = date.fromisoformat(hi.strip()) if hi else date_from
+    except ValueError:
+        raise RuntimeError('日期格式应为 `YYYY-MM-DD` 或 `YYYY-MM-DD~YYYY-MM-DD`')
+    return date_from, date_to
+
+def yuan(cents) -> str:
+    return f"{int(cents) / 100:.2f}"
+
+@bot.command(name='report')
+@instrumented
+async def report_cmd(msg: Message, spec: str=None, game: str=None):
+    # 权限：仅老板
+    if not await ensure_perm(msg, need='boss_only'):
+        return
+    try:
+        date_from, date_to = parse_report_range(spec)
+        params = {k: v for k, v in (("date_from", date_from), ("date_to", date_to), ("game_name", game)) if v}
+        revenue, players = await asyncio.gather(
+            api_get("/api/reports/revenue?" + urlencode(params)),
+            api_get("/api/reports/players?" + urlencode({**params, "limit": REPORT_TOP_PLAYERS})),
+        )
+        total = revenue["total"]
+        lines = [
+            f"📊 报表 {revenue['date_from']} ~ {revenue['date_to']}" + (f"（{game}）" if game else ""),
+            f"合计：{total['orders']} 单，{yuan(total['amount_cents'])} 元，{total['hours']}h",
+        ]
+        for d in revenue["days"]:
+            lines.append(f"{d['day']}：{d['orders']} 单，{yuan(d['amount_cents'])} 元，{d['hours']}h")
+        if players["players"]:
+            lines.append(f"🎮 陪玩时长 Top{REPORT_TOP_PLAYERS}：")
+            for i, p in enumerate(players["players"], 1):
+                lines.append(
+                    f"{i}. {p.get('player_kook_name') or p['player_kook_id']}："
+                    f"{p['hours']}h，{p['orders']} 单，{yuan(p['amount_cents'])} 元"
+                )
+        reply(msg, "\n".join(lines))
+    except Exception as e:
+        reply(msg, f"❌ 报表失败：{e}")
+
+# ---------- 5c) 派单：登记陪玩、查看待派队列 ----------
+def format_player(data: dict) -> str:
+    state = "在线" if data.get("available") else "离线"
+    return (
+        f"🎮 陪玩 {data.get('kook_name') or data.get('kook_id')}：{state}，"
+        f"可接 {','.join(data.get('games') or []) or '—'}，进行中 {data.get('active_orders')}/{data.get('max_load')}，"
+        f"累计 {data.get('completed_hours')}h"
+    )
+
+@bot.command(name='player')
+@instrumented
+async def player_cmd(msg: Message, player_arg: str=None, spec: str=None, max_load: str=None):
+    # 权限：老板或客服（陪玩不需要使用机器人）
+    if not await ensure_perm(msg, need='operate'):
+        return
+    """
+    /player @陪玩 LOL,CS2 2   登记（或整体更新）可接游戏，同时最多接 2 单
+    /player @陪玩 off|on      下线 / 上线（离线的陪玩不会被自动派单）
+    """
+    try:
+        if not player_arg or not spec:
+            reply(msg, "用法：`/player <@陪玩|陪玩_id|@me> <游戏1,游戏2> [同时接单上限]` 或 `/player <@陪玩> on|off`")
+            return
+        kook_id = parse_kook_id(player_arg, msg.author.id)
+        if spec in ('on', 'off'):
+            data = await api_patch(f"/api/players/{kook_id}", {"available": spec == 'on'})
+        else:
+            body = {
+                "kook_name": await get_kook_tag(bot, kook_id),
+                "games": [g.strip() for g in spec.split(',') if g.strip()],
+            }
+            if max_load:
+                body["max_load"] = parse_int(max_load, 'max_load')
+            data = await api_put(f"/api/players/{kook_id}", body)
+        reply(msg, format_player(data))
+    except Exception as e:
+        reply(msg, f"❌ 登记失败：{e}")
+
+@bot.command(name='queue')
+@instrumented
+async def queue_cmd(msg: Message):
+    # 权限：老板或客服
+    if not await ensure_perm(msg, need='operate'):
+        return
+    try:
+        games = (await api_get("/api/dispatch/queue")).get("games", [])
+        if not games:
+            reply(msg, "📋 待派队列为空")
+            return
+        now = datetime.now(ZoneInfo("UTC"))
+        lines = ["📋 待派队列："]
+        for g in games:
+            waited = now - datetime.fromisoformat(g["oldest"].replace("Z", "+00:00"))
+            lines.append(
+                f"{g['game_name']}：{g['waiting']} 单，空闲陪玩 {g['free_players']}，"
+                f"最久已等 {int(waited.total_seconds() // 60)} 分钟"
+            )
+        reply(msg, "\n".join(lines))
+    except Exception as e:
+        reply(msg, f"❌ 查询失败：{e}")
+
+# ---------- 6) 订单事件推送：订阅后端 SSE，把状态变化发到 KOOK 频道 ----------
+ORDER_EVENTS_CHANNEL_ID = os.getenv("ORDER_EVENTS_CHANNEL_ID", "").strip()  # 留空则不推送
+
+ORDER_EVENTS_TOTAL = Counter("bot_order_events_total", "推送到频道的订单事件", ["result"])
+ORDER_EVENTS_RECONNECTS = Counter("bot_order_events_reconnects_total", "事件流断线重连次数")
+
+STATUS_EMOJI = {
+    "PENDING_REVIEW": "🆕",
+    "REVIEW_APPROVED": "🪪",
+    "REVIEW_REJECTED": "🚫",
+    "IN_PROGRESS": "🎮",
+    "COMPLETED": "✅",
+}
+
+def format_order_event(ev: dict) -> str:
+    to = ev.get("to_status")
+    head = f"{STATUS_EMOJI.get(to, '🔔')} 订单 {ev.get('order_id')}：{ev.get('from_status') or '新建'} → {to}"
+    parts = [f"game={ev.get('game_name')}", f"老板={ev.get('boss_kook_name') or ev.get('boss_kook_id') or '—'}"]
+    if ev.get("player_kook_id"):
+        parts.append(f"陪玩={ev.get('player_kook_name') or ev.get('player_kook_id')}")
+    return head + "，" + "，".join(parts)
+
+async def iter_sse(resp: httpx.Response):
+    """逐个产出 (event_id, data_dict)；注释行（心跳）和无 data 的块跳过"""
+    ev_id, data = None, []
+    async for line in resp.aiter_lines():
+        if not line:
+            if data:
+                yield ev_id, json.loads("\n".join(data))
+            ev_id, data = None, []
+        elif line.startswith("id:"):
+            ev_id = line[3:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+def count_order_event(fut: asyncio.Future):
+    ORDER_EVENTS_TOTAL.labels("sent" if fut.result() else "failed").inc()
+
+async def watch_order_events(bot_obj: Bot):
+    """整个机器人只订阅一条流；断线后带 Last-Event-ID 重连，漏掉的事件由后端补发"""
+    last_id = None
+    attempt = 0
+    channel = None
+    stream_timeout = httpx.Timeout(None, connect=BACKEND_CONNECT_TIMEOUT)
+    while True:
+        try:
+            headers = {"Last-Event-ID": last_id} if last_id else None
+            async with client.stream("GET", "/api/orders/events", headers=headers, timeout=stream_timeout) as r:
+                r.raise_for_status()
+                attempt = 0
+                async for ev_id, ev in iter_sse(r):
+                    try:
+                        if channel is None:
+                            channel = await bot_obj.client.fetch_public_channel(ORDER_EVENTS_CHANNEL_ID)
+                        replies.submit(channel, format_order_event(ev)).add_done_callback(count_order_event)
+                    except Exception as e:
+                        # 单条发送失败不重放，免得一条坏消息卡住整条流
+                        ORDER_EVENTS_TOTAL.labels("failed").inc()
+                        logging.warning("order event %s not posted: %s", ev_id, e)
+                    last_id = ev_id or last_id
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning("order event stream dropped: %s", e)
+        ORDER_EVENTS_RECONNECTS.inc()
+        await asyncio.sleep(backend.backoff(attempt))
+        attempt = min(attempt + 1, 10)
+
+_event_tasks = set()
+
+@bot.on_startup
+async def start_order_event_watch(bot_obj: Bot):
+    if ORDER_EVENTS_CHANNEL_ID:
+        task = asyncio.create_task(watch_order_events(bot_obj))
+        _event_tasks.add(task)
+        task.add_done_callback(_event_tasks.discard)
+
+# ---------- 7) 启动预热 ----------
+# 与连 KOOK 网关并行进行，完成后才置 bot_ready；重启后的第一批命令不再付冷启动代价：
+#   1) 后端健康检查  2) 并发预开 keep-alive 连接  3) 后端取最近活跃的陪玩 / 老板
+#   4) 并发预取 BOSSES_IDS / STAFF_IDS 与上一步这些人的 KOOK 标签（顺带建好到 KOOK 的连接）
+# 每个阶段单独计时；某阶段失败只记日志、照常往下走，整体超过 WARMUP_TIMEOUT 直接就绪
+WARMUP_TIMEOUT         = float(os.getenv("WARMUP_TIMEOUT", "20"))
+WARMUP_CONNECTIONS     = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_RECENT_DAYS     = int(os.getenv("WARMUP_RECENT_DAYS", "7"))
+WARMUP_RECENT_LIMIT    = int(os.getenv("WARMUP_RECENT_LIMIT", "200"))
+WARMUP_TAG_CONCURRENCY = int(os.getenv("WARMUP_TAG_CONCURRENCY", "5"))
+
+STARTUP_PHASE_SECONDS = Gauge("bot_startup_phase_seconds", "启动预热各阶段耗时", ["phase"])
+STARTUP_READY_SECONDS = Gauge("bot_startup_ready_seconds", "进程启动到就绪的秒数")
+
+async def warm_phase(name: str, coro, default=None):
+    t0 = time.perf_counter()
+    try:
+        return await coro
+    except Exception as e:
+        logging.warning("warm-up %s failed: %s", name, e)
+        return default
+    finally:
+        dt = time.perf_counter() - t0
+        STARTUP_PHASE_SECONDS.labels(name).set(dt)
+        logging.info("warm-up %s: %.3fs", name, dt)
+
+async def backend_health() -> bool:
+    _raise_for_status(await backend.request("GET", "/"))
+    return True
+
+async def open_backend_connections(n: int):
+    # 同时在途的请求才会各占一条连接；返回后都留在 keep-alive 池里
+    n = min(n, BACKEND_MAX_KEEPALIVE)
+    await asyncio.gather(*(backend.request("GET", "/") for _ in range(n)))
+
+async def prefetch_tags(bot_obj: Bot, kook_ids) -> int:
+    sem = asyncio.Semaphore(WARMUP_TAG_CONCURRENCY)  # 别一下子把 KOOK 的限速额度用光
+
+    async def one(kid: str):
+        async with sem:
+            await get_kook_tag(bot_obj, kid)
+
+    await asyncio.gather(*(one(k) for k in kook_ids))
+    return len(kook_ids)
+
+async def warm_up(bot_obj: Bot):
+    recent = {}
+    if await warm_phase("backend_health", backend_health(), default=False):
+        await warm_phase("backend_connections", open_backend_connections(WARMUP_CONNECTIONS))
+        query = urlencode({"days": WARMUP_RECENT_DAYS, "limit": WARMUP_RECENT_LIMIT})
+        recent = await warm_phase("recent_people", api_get(f"/api/players/recent?{query}"), default={})
+    ids = list(dict.fromkeys([*BOSSES_IDS, *STAFF_IDS, *recent.get("players", []), *recent.get("bosses", [])]))
+    n = await warm_phase("kook_tags", prefetch_tags(bot_obj, ids), default=0)
+    logging.info("warm-up prefetched %d/%d KOOK tags", n, len(ids))
+
+async def run_warm_up(bot_obj: Bot):
+    try:
+        await asyncio.wait_for(warm_up(bot_obj), WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.warning("warm-up exceeded %.0fs, marking ready anyway", WARMUP_TIMEOUT)
+    finally:
+        ready = time.monotonic() - PROCESS_STARTED
+        STARTUP_READY_SECONDS.set(ready)
+        bot_ready.set()
+        logging.info("bot ready %.2fs after process start", ready)
+
+_warm_up_tasks = set()
+
+@bot.on_startup
+async def start_warm_up(bot_obj: Bot):
+    task = asyncio.create_task(run_warm_up(bot_obj))
+    _warm_up_tasks.add(task)
+    task.add_done_callback(_warm_up_tasks.discard)
 
 # ---------- 运行 ----------
 if __name__ == '__main__':
+    if BOT_METRICS_PORT:
+        start_http_server(int(BOT_METRICS_PORT))
     try:
         bot.run()
     finally: